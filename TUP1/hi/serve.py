@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 生产环境启动器：用多进程/多线程的WSGI服务器代替Flask自带的开发服务器
+#
+# 上传.py 和 上传2.py 的 __main__ 都通过这里启动，也可以直接交给 gunicorn:
+#   gunicorn -w 1 --threads 16 --preload '上传2:create_app()'
+#
+# 上传2.py 的后台任务记录、目录/统计缓存都保存在进程内，多个worker之间不共享
+# （/jobs/<id> 可能落到没有该任务的worker上返回404），因此默认只用1个worker、
+# 靠线程并发；app.config['SERVE_WORKERS'] 决定 -w 的默认值。
+#
+# Linux/macOS 使用 gunicorn（pip install gunicorn），支持多 worker、
+# 线程、keep-alive 以及 kill -HUP 平滑重载；Windows 上没有 gunicorn，
+# 退回到 waitress（pip install waitress，单进程多线程），都没有安装时使用开发服务器。
+
+import argparse
+import importlib
+import os
+
+try:
+    from gunicorn.app.base import BaseApplication  # 可选依赖
+except ImportError:
+    BaseApplication = None
+
+try:
+    import waitress  # 可选依赖
+except ImportError:
+    waitress = None
+
+
+def default_workers():
+    """S3请求大部分时间在等待网络，worker数量按CPU核数的两倍估算"""
+    return max(2, (os.cpu_count() or 1) * 2)
+
+
+def build_parser(description, workers=None):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=5000, help='监听端口')
+    parser.add_argument('-w', '--workers', type=int, default=workers or default_workers(), help='worker进程数')
+    parser.add_argument('--threads', type=int, default=8, help='每个worker的线程数')
+    parser.add_argument('--keep-alive', type=int, default=5, help='HTTP keep-alive 超时（秒）')
+    parser.add_argument('--timeout', type=int, default=300,
+                        help='单个请求的最长处理时间（秒），大文件上传需要足够长')
+    parser.add_argument('--graceful-timeout', type=int, default=30,
+                        help='平滑重载/停止时等待进行中请求的时间（秒）')
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='worker处理多少请求后重启（0为不重启，重启会丢失已建立的S3连接池）')
+    parser.add_argument('--reload', action='store_true', help='源码修改后自动重载（开发用）')
+    parser.add_argument('--dev', action='store_true', help='使用Flask开发服务器')
+    return parser
+
+
+if BaseApplication is not None:
+    class GunicornApplication(BaseApplication):
+        """在代码中配置并启动 gunicorn，不依赖命令行或配置文件"""
+
+        def __init__(self, app, options, post_fork=None, module=None):
+            self.application = app
+            self.options = options
+            self.post_fork_hook = post_fork
+            self.module = module
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+            if self.post_fork_hook is not None:
+                hook = self.post_fork_hook
+                self.cfg.set('post_fork', lambda server, worker: hook())
+
+        def load(self):
+            # reload 模式下每个 worker 重新导入模块，才能拿到修改后的代码
+            if self.options.get('reload') and self.module:
+                return importlib.import_module(self.module).create_app()
+            return self.application
+
+
+def run(app, description, post_fork=None, module=None, argv=None):
+    """解析命令行参数并启动服务
+
+    post_fork 在每个 worker 进程 fork 之后调用，用于丢弃从主进程继承的连接等进程内状态
+    （也可以由应用模块自己用 os.register_at_fork 注册，直接用 gunicorn 启动时同样生效）；
+    module 是应用所在的模块名（需提供 create_app），--reload 时由 worker 重新导入；
+    app.config['SERVE_WORKERS'] 存在时作为 -w 的默认值。
+    """
+    parser = build_parser(description, app.config.get('SERVE_WORKERS'))
+    args = parser.parse_args(argv)
+    
+    # 进程内的限流计数在多个worker之间不共享，每个worker各算一份额度
+    if app.config.get('SHARE_LIMIT_BACKEND') == 'memory' and args.workers > 1 and not args.dev:
+        parser.error("SHARE_LIMIT_BACKEND='memory' 只能配合 -w 1 使用，多个worker请改用 'sqlite'")
+
+    # 每个线程都可能同时占用一个S3连接，连接池不能比线程数小
+    if 'S3_MAX_POOL_CONNECTIONS' in app.config and app.config['S3_MAX_POOL_CONNECTIONS'] < args.threads:
+        app.config['S3_MAX_POOL_CONNECTIONS'] = args.threads
+
+    print(f"访问地址: http://127.0.0.1:{args.port}")
+    print(f"或使用局域网IP访问: http://<您的设备IP>:{args.port}")
+
+    if args.dev:
+        app.run(debug=False, host=args.host, port=args.port, threaded=True, use_reloader=args.reload)
+    elif BaseApplication is not None:
+        print(f"gunicorn: {args.workers} 个worker × {args.threads} 个线程，kill -HUP <主进程PID> 可平滑重载")
+        options = {
+            'bind': f'{args.host}:{args.port}',
+            'workers': args.workers,
+            'threads': args.threads,
+            'worker_class': 'gthread',
+            'keepalive': args.keep_alive,
+            'timeout': args.timeout,
+            'graceful_timeout': args.graceful_timeout,
+            'max_requests': args.max_requests,
+            'max_requests_jitter': args.max_requests // 10,
+            'reload': args.reload,
+            # 模板等只在主进程加载一次，fork 后各 worker 共享（reload 模式下需要在worker里重新导入）
+            'preload_app': not args.reload,
+        }
+        GunicornApplication(app, options, post_fork=post_fork, module=module).run()
+    elif waitress is not None:
+        print(f"未安装gunicorn，使用waitress单进程 {args.threads} 个线程")
+        waitress.serve(app, host=args.host, port=args.port, threads=args.threads,
+                       channel_timeout=args.timeout)
+    else:
+        print("未安装gunicorn或waitress，使用Flask开发服务器（pip install gunicorn 以获得更好的性能）")
+        app.run(debug=False, host=args.host, port=args.port, threaded=True, use_reloader=args.reload)
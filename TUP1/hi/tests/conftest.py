@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# 测试使用 moto 模拟S3（pip install pytest moto），不访问真实的对象存储
+
+import os
+import sys
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+from moto import mock_aws
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import 上传2  # noqa: E402
+
+ENDPOINT = 'https://s3.amazonaws.com'
+OWNER = {'endpoint_url': ENDPOINT, 'access_key': 'owner-key', 'secret_key': 'owner-secret'}
+OTHER = {'endpoint_url': ENDPOINT, 'access_key': 'other-key', 'secret_key': 'other-secret'}
+
+
+@pytest.fixture
+def app_module(tmp_path):
+    """上传2 模块：SQLite文件和磁盘缓存放到临时目录，每个测试使用新建的缓存，结束后恢复配置"""
+    module = 上传2
+    saved = dict(module.app.config)
+    module.create_app({
+        'TESTING': True,
+        'METADATA_INDEX_DB': str(tmp_path / 'index.db'),
+        'SHARE_LIMIT_DB': str(tmp_path / 'limits.db'),
+        'SHARE_CREDENTIAL_DB': str(tmp_path / 'credentials.db'),
+        'SHARE_TOKEN_KEY_FILE': str(tmp_path / 'share-token.key'),
+        'SHARE_CACHE_DIR': str(tmp_path / 'share-cache'),
+        'THUMBNAIL_DIR': str(tmp_path / 'thumbnails'),
+    })
+    module.reset_s3_clients()
+    yield module
+    module.app.config.clear()
+    module.app.config.update(saved)
+    module.init_state()
+
+
+@pytest.fixture
+def s3(app_module):
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='bkt')
+        yield client
+
+
+def make_client(app_module, config):
+    """带有指定S3配置的浏览器会话"""
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['s3_config'] = dict(config)
+    return client
+
+
+def flashes(client):
+    """会话中等待显示的提示消息"""
+    with client.session_transaction() as session:
+        return [message for _, message in session.get('_flashes', [])]
+
+
+@pytest.fixture
+def owner(app_module, s3):
+    return make_client(app_module, OWNER)
+
+
+@pytest.fixture
+def other(app_module, s3):
+    return make_client(app_module, OTHER)
+
+
+@pytest.fixture
+def deny_other(app_module, monkeypatch):
+    """OTHER 凭证对存储桶没有任何权限：它的每次列表请求都返回AccessDenied"""
+    denied = boto3.client('s3', region_name='us-east-1', aws_access_key_id=OTHER['access_key'],
+                          aws_secret_access_key=OTHER['secret_key'])
+    stubber = Stubber(denied)
+    for _ in range(5):
+        stubber.add_client_error('list_objects_v2', 'AccessDenied', http_status_code=403)
+    stubber.activate()
+    real_get_s3_client = app_module.get_s3_client
+
+    def get_s3_client(config=None):
+        current = config or app_module.session.get('s3_config', app_module.DEFAULT_CONFIG)
+        if current['access_key'] == OTHER['access_key']:
+            return denied
+        return real_get_s3_client(config)
+
+    monkeypatch.setattr(app_module, 'get_s3_client', get_s3_client)
+    return stubber
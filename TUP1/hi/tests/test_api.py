@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+
+def test_api_lists_buckets(app_module, s3, owner):
+    result = owner.get('/api/buckets').get_json()
+    assert result['success'] is True
+    assert [bucket['name'] for bucket in result['buckets']] == ['bkt']
+
+
+def test_api_objects_pages_with_cursor(app_module, s3, owner):
+    for key in ('a.txt', 'b.txt', 'c.txt', 'dir/d.txt'):
+        s3.put_object(Bucket='bkt', Key=key, Body=b'xy')
+
+    first = owner.get('/api/buckets/bkt/objects?limit=2').get_json()
+    assert [obj['key'] for obj in first['objects']] == ['a.txt', 'b.txt']
+    assert first['objects'][0]['size'] == 2 and first['next_cursor']
+    second = owner.get('/api/buckets/bkt/objects', query_string={'limit': 2, 'cursor': first['next_cursor']}).get_json()
+    assert [obj['key'] for obj in second['objects']] == ['c.txt']
+    assert second['prefixes'] == ['dir/']
+    assert second['next_cursor'] == ''
+
+
+def test_api_objects_lists_recursively_without_delimiter(app_module, s3, owner):
+    for key in ('a.txt', 'dir/d.txt', 'dir/sub/e.txt'):
+        s3.put_object(Bucket='bkt', Key=key, Body=b'')
+    result = owner.get('/api/buckets/bkt/objects?delimiter=&prefix=dir/').get_json()
+    assert [obj['key'] for obj in result['objects']] == ['dir/d.txt', 'dir/sub/e.txt']
+    assert result['prefixes'] == []
+
+
+def test_api_reports_s3_errors_as_json(app_module, s3, other, deny_other):
+    response = other.get('/api/buckets/bkt/objects')
+    assert response.status_code == 500
+    assert response.get_json()['success'] is False
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# 异步部署模式需要额外的依赖（pip install quart aiobotocore asgiref），未安装时跳过
+
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip('quart')
+pytest.importorskip('aiobotocore')
+pytest.importorskip('asgiref')
+
+
+@pytest.fixture
+def async_module(app_module):
+    import 上传2_async
+    return 上传2_async
+
+
+class FakeBody:
+    def __init__(self, data):
+        self.data = data
+        self.closed = False
+
+    async def iter_chunks(self, chunk_size):
+        for start in range(0, len(self.data), chunk_size):
+            yield self.data[start:start + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeS3:
+    """只实现 get_object 的异步S3客户端，记录收到的参数"""
+
+    def __init__(self, data):
+        self.data = data
+        self.calls = []
+        self.bodies = []
+
+    async def get_object(self, **params):
+        self.calls.append(params)
+        data = self.data
+        obj = {'ContentLength': len(data), 'ETag': '"abc"', 'ContentType': 'text/plain',
+               'LastModified': datetime(2024, 1, 1, tzinfo=timezone.utc)}
+        if 'Range' in params:
+            start, end = params['Range'][len('bytes='):].split('-')
+            data = data[int(start):int(end) + 1]
+            obj.update(ContentLength=len(data), ContentRange=f'bytes {start}-{end}/{len(self.data)}')
+        obj['Body'] = FakeBody(data)
+        self.bodies.append(obj['Body'])
+        return obj
+
+
+def test_async_download_streams_range(async_module, monkeypatch):
+    fake = FakeS3(b'0123456789')
+
+    async def get_s3_client():
+        return fake
+    monkeypatch.setattr(async_module, 'get_s3_client', get_s3_client)
+    monkeypatch.setitem(async_module.settings, 'DOWNLOAD_CHUNK_SIZE', 3)
+
+    async def download():
+        client = async_module.app.test_client()
+        response = await client.get('/download/bkt/f.txt', headers={'Range': 'bytes=2-7'})
+        return response.status_code, await response.get_data(), response.headers
+    status, data, headers = asyncio.run(download())
+    assert (status, data) == (206, b'234567')
+    assert headers['Content-Range'] == 'bytes 2-7/10'
+    assert fake.calls == [{'Bucket': 'bkt', 'Key': 'f.txt', 'Range': 'bytes=2-7'}]
+    assert all(body.closed for body in fake.bodies)
+
+
+def test_unported_routes_are_handled_by_flask(async_module, monkeypatch):
+    handled = []
+
+    async def flask_app(scope, receive, send):
+        handled.append(('flask', scope['path']))
+
+    class QuartRecorder:
+        url_map = async_module.app.url_map
+
+        async def __call__(self, scope, receive, send):
+            handled.append(('quart', scope['path']))
+    monkeypatch.setattr(async_module, 'flask_app', flask_app)
+    monkeypatch.setattr(async_module, 'app', QuartRecorder())
+
+    async def dispatch(method, path):
+        await async_module.asgi_app({'type': 'http', 'method': method, 'path': path}, None, None)
+    for method, path in (('GET', '/bucket/bkt'), ('GET', '/download/bkt/a.txt'), ('POST', '/upload/bkt'),
+                         ('GET', '/jobs'), ('GET', '/share/token')):
+        asyncio.run(dispatch(method, path))
+    assert handled == [('quart', '/bucket/bkt'), ('quart', '/download/bkt/a.txt'), ('flask', '/upload/bkt'),
+                       ('flask', '/jobs'), ('flask', '/share/token')]
+
+
+def test_async_app_shares_session_with_flask(async_module):
+    assert async_module.app.secret_key == async_module.base.app.secret_key
+    assert async_module.app.jinja_loader.mapping is async_module.base.TEMPLATES
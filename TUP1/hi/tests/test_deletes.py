@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+from conftest import ENDPOINT, OWNER, flashes
+
+
+def count_calls(client, operation):
+    calls = []
+    client.meta.events.register(f'before-call.s3.{operation}', lambda **kwargs: calls.append(1))
+    return calls
+
+
+def keys_in(s3):
+    return sorted(obj['Key'] for obj in s3.list_objects_v2(Bucket='bkt').get('Contents', []))
+
+
+# 批量删除
+
+def test_folder_delete_uses_one_batch_request(app_module, s3, owner):
+    for key in ('docs/', 'docs/a.txt', 'docs/sub/b.txt', 'docsx.txt'):
+        s3.put_object(Bucket='bkt', Key=key, Body=b'x')
+    batches = count_calls(app_module.get_s3_client(OWNER), 'DeleteObjects')
+    single = count_calls(app_module.get_s3_client(OWNER), 'DeleteObject')
+
+    response = owner.get('/delete/bkt/docs/')
+    assert response.status_code == 302
+    assert keys_in(s3) == ['docsx.txt']
+    assert (len(batches), len(single)) == (1, 0)
+    assert any('及其内容已删除' in message for message in flashes(owner))
+
+
+def test_delete_prefix_deletes_every_page(app_module, s3):
+    for number in range(1001):
+        s3.put_object(Bucket='bkt', Key=f'logs/{number:04d}.txt', Body=b'')
+    s3.put_object(Bucket='bkt', Key='keep.txt', Body=b'')
+    batches = count_calls(s3, 'DeleteObjects')
+    job = {'cancel_requested': False, 'done': 0, 'failed': 0, 'errors': []}
+
+    app_module.delete_prefix(job, s3, 'bkt', 'logs/', ENDPOINT)
+    assert (job['done'], job['failed']) == (1001, 0)
+    assert len(batches) == 2  # 每页最多1000个键
+    assert keys_in(s3) == ['keep.txt']
+
+
+def test_delete_keys_batch_reports_failed_keys(app_module, s3):
+    s3.put_object(Bucket='bkt', Key='a.txt', Body=b'')
+
+    def reject(parsed, **kwargs):
+        parsed['Errors'] = [{'Key': 'a.txt', 'Code': 'AccessDenied', 'Message': 'denied'}]
+    s3.meta.events.register('after-call.s3.DeleteObjects', reject)
+    assert app_module.delete_keys_batch(s3, 'bkt', ['a.txt']) == [
+        {'key': 'a.txt', 'code': 'AccessDenied', 'message': 'denied'}]
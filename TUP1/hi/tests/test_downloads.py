@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from conftest import flashes
+
+
+# 流式下载
+
+def test_download_streams_object_in_chunks(app_module, s3, owner, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'DOWNLOAD_CHUNK_SIZE', 4)
+    s3.put_object(Bucket='bkt', Key='docs/报告.txt', Body=b'0123456789')
+
+    response = owner.get('/download/bkt/docs/报告.txt', buffered=False)
+    assert response.is_streamed
+    assert response.headers['Content-Length'] == '10'
+    assert "filename*=UTF-8''%E6%8A%A5%E5%91%8A.txt" in response.headers['Content-Disposition']
+    chunks = list(response.response)
+    assert chunks == [b'0123', b'4567', b'89']
+    response.close()
+
+
+def test_download_of_missing_object_redirects_with_message(app_module, s3, owner):
+    response = owner.get('/download/bkt/missing.txt')
+    assert response.status_code == 302
+    assert any('下载失败' in message for message in flashes(owner))
+
+
+# 区间请求和条件请求
+
+def test_download_serves_single_range(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='f.bin', Body=b'0123456789')
+    response = owner.get('/download/bkt/f.bin', headers={'Range': 'bytes=2-5'})
+    assert response.status_code == 206
+    assert response.data == b'2345'
+    assert response.headers['Content-Range'] == 'bytes 2-5/10'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+
+def test_download_answers_not_modified(app_module, s3, owner):
+    etag = s3.put_object(Bucket='bkt', Key='f.bin', Body=b'0123456789')['ETag']
+    response = owner.get('/download/bkt/f.bin', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_if_range_requires_strong_matching_etag(app_module, s3, owner):
+    etag = s3.put_object(Bucket='bkt', Key='f.bin', Body=b'0123456789')['ETag']
+    headers = {'Range': 'bytes=5-'}
+    assert owner.get('/download/bkt/f.bin', headers=dict(headers, **{'If-Range': etag})).status_code == 206
+    for if_range in ('W/' + etag, '"changed"'):
+        response = owner.get('/download/bkt/f.bin', headers=dict(headers, **{'If-Range': if_range}))
+        assert response.status_code == 200
+        assert response.data == b'0123456789'
+
+
+def test_unsatisfiable_range_returns_416(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='f.bin', Body=b'0123456789')
+    response = owner.get('/download/bkt/f.bin', headers={'Range': 'bytes=20-'})
+    assert response.status_code == 416
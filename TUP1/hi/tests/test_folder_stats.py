@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+import io
+import time
+
+from conftest import ENDPOINT, OWNER
+
+
+def folder_stats(client, *prefixes, timeout=10):
+    """请求文件夹统计，直到不再有统计中的前缀"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = client.get('/api/buckets/bkt/folder-stats', query_string={'prefix': list(prefixes)}).get_json()
+        if not result['pending']:
+            return result['stats']
+        time.sleep(0.02)
+    raise AssertionError('文件夹统计没有按时完成')
+
+
+def put_tree(s3):
+    for key, body in (('docs/a.txt', b'12345'), ('docs/sub/b.txt', b'123'), ('docs/sub/deep/c.txt', b'1'),
+                      ('other/d.txt', b'1234')):
+        s3.put_object(Bucket='bkt', Key=key, Body=body)
+
+
+def test_folder_stats_are_computed_in_background(app_module, s3, owner):
+    put_tree(s3)
+    first = owner.get('/api/buckets/bkt/folder-stats', query_string={'prefix': 'docs/'}).get_json()
+    assert (first['stats'], first['pending']) == ({}, ['docs/'])  # 不等待统计完成
+    assert folder_stats(owner, 'docs/', 'other/') == {'docs/': {'size': 9, 'count': 3},
+                                                      'other/': {'size': 4, 'count': 1}}
+    # 子文件夹的结果也已缓存
+    assert app_module.folder_stats_cache.get(
+        (ENDPOINT, 'bkt', 'docs/sub/') + app_module.credential_identity(OWNER)) == {'size': 4, 'count': 2}
+
+
+def test_writes_invalidate_cached_folder_stats(app_module, s3, owner):
+    put_tree(s3)
+    assert folder_stats(owner, 'docs/')['docs/'] == {'size': 9, 'count': 3}
+    s3.put_object(Bucket='bkt', Key='docs/direct.txt', Body=b'xx')  # 绕过本服务写入
+    assert folder_stats(owner, 'docs/')['docs/'] == {'size': 9, 'count': 3}
+
+    owner.post('/upload/bkt', data={'file': (io.BytesIO(b'1234567'), 'new.txt'), 'prefix': 'docs/sub/'})
+    assert folder_stats(owner, 'docs/', 'docs/sub/') == {'docs/': {'size': 18, 'count': 5},
+                                                         'docs/sub/': {'size': 11, 'count': 3}}
+    owner.get('/delete/bkt/docs/sub/')
+    assert folder_stats(owner, 'docs/')['docs/'] == {'size': 7, 'count': 2}
+
+
+def test_folder_stats_use_ready_index_without_listing(app_module, s3, owner):
+    put_tree(s3)
+    app_module.metadata_index.scan({'cancel_requested': False, 'done': 0}, s3, ENDPOINT, 'bkt')
+    listings = []
+    app_module.get_s3_client(OWNER).meta.events.register(
+        'provide-client-params.s3.ListObjectsV2', lambda params, **kwargs: listings.append(params))
+    result = owner.get('/api/buckets/bkt/folder-stats', query_string={'prefix': 'docs/'}).get_json()
+    assert result['stats'] == {'docs/': {'size': 9, 'count': 3}}
+    assert [params['MaxKeys'] for params in listings] == [1]  # 只有权限检查
+
+
+def test_folder_stats_require_bucket_access(app_module, s3, owner, other, deny_other):
+    put_tree(s3)
+    folder_stats(owner, 'docs/')
+    response = other.get('/api/buckets/bkt/folder-stats', query_string={'prefix': 'docs/'})
+    assert response.status_code == 500
+    assert 'stats' not in response.get_json()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from conftest import OWNER
+
+
+def wait_for(client, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/jobs/{job_id}').get_json()
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError('任务没有按时结束')
+
+
+def enqueue_as(app_module, config, func):
+    with app_module.app.test_request_context():
+        app_module.session['s3_config'] = dict(config)
+        return app_module.enqueue_job('test', '测试任务', func)
+
+
+def test_large_folder_delete_runs_as_background_job(app_module, s3, owner):
+    for number in range(1001):
+        s3.put_object(Bucket='bkt', Key=f'logs/{number:04d}.txt', Body=b'')
+
+    response = owner.get('/delete/bkt/logs/')
+    job_id = response.location.rsplit('job=', 1)[1]
+    job = wait_for(owner, job_id)
+    assert (job['status'], job['done'], job['failed']) == ('finished', 1001, 0)
+    assert s3.list_objects_v2(Bucket='bkt', Prefix='logs/')['KeyCount'] == 0
+
+
+def test_running_job_can_be_cancelled_by_its_owner(app_module, owner, other):
+    started, release = threading.Event(), threading.Event()
+
+    def work(job):
+        started.set()
+        release.wait(10)
+        while not job['cancel_requested']:
+            time.sleep(0.01)
+        job['done'] += 1
+
+    job = enqueue_as(app_module, OWNER, work)
+    assert started.wait(10)
+    try:
+        assert other.post(f'/jobs/{job["id"]}/cancel').status_code == 404
+        assert owner.post(f'/jobs/{job["id"]}/cancel').get_json() == {'success': True}
+    finally:
+        release.set()
+    assert wait_for(owner, job['id'])['status'] == 'cancelled'
+    assert owner.post(f'/jobs/{job["id"]}/cancel').status_code == 404  # 已结束的任务不能再取消
+
+
+def test_cancelled_queued_job_never_runs(app_module):
+    owner_id = app_module.job_owner(OWNER)
+    job = app_module.create_job('test', '排队中的任务', owner_id)
+    assert app_module.cancel_job(job['id'], owner_id)
+    assert not app_module.begin_job(job)
+    assert job['status'] == 'cancelled'
+
+
+def test_jobs_are_only_visible_to_their_owner(app_module, owner, other):
+    job = enqueue_as(app_module, OWNER, lambda job: None)
+    wait_for(owner, job['id'])
+    assert job['id'] in [item['id'] for item in owner.get('/jobs').get_json()['jobs']]
+    assert other.get('/jobs').get_json()['jobs'] == []
+    assert other.get(f'/jobs/{job["id"]}').status_code == 404
+    assert 'owner' not in owner.get(f'/jobs/{job["id"]}').get_json()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import html
+import io
+import re
+
+from conftest import OWNER
+
+
+def listed(client, path='/bucket/bkt'):
+    return client.get(path).get_data(as_text=True)
+
+
+# 目录列表缓存
+
+def test_listing_is_served_from_cache(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='a.txt', Body=b'x')
+    assert 'a.txt' in listed(owner)
+    s3.put_object(Bucket='bkt', Key='b.txt', Body=b'x')  # 绕过本服务写入，缓存不知道
+    assert 'b.txt' not in listed(owner)
+
+
+def test_listing_cache_expires_after_ttl(app_module, s3, owner, monkeypatch):
+    monkeypatch.setattr(app_module.listing_cache, 'ttl', 0)
+    s3.put_object(Bucket='bkt', Key='a.txt', Body=b'x')
+    assert 'a.txt' in listed(owner)
+    s3.put_object(Bucket='bkt', Key='b.txt', Body=b'x')
+    assert 'b.txt' in listed(owner)
+
+
+def test_writes_invalidate_parent_listings(app_module, s3, owner):
+    file_link = '/download/bkt/docs/a.txt'
+    assert 'prefix=new-folder/' not in listed(owner)
+    assert file_link not in listed(owner, '/bucket/bkt?prefix=docs/')
+    owner.get('/create-folder/bkt', query_string={'folder_name': 'new-folder'})
+    owner.post('/upload/bkt', data={'file': (io.BytesIO(b'x'), 'a.txt'), 'prefix': 'docs/'})
+    assert 'prefix=new-folder/' in listed(owner)
+    assert file_link in listed(owner, '/bucket/bkt?prefix=docs/')
+
+    owner.get('/delete/bkt/docs/a.txt')
+    assert file_link not in listed(owner, '/bucket/bkt?prefix=docs/')
+
+
+def test_listing_cache_is_not_shared_across_credentials(app_module, s3, owner, other, deny_other):
+    s3.put_object(Bucket='bkt', Key='secret.txt', Body=b'x')
+    assert 'secret.txt' in owner.get('/bucket/bkt').get_data(as_text=True)
+
+    page = other.get('/bucket/bkt').get_data(as_text=True)
+    assert 'secret.txt' not in page
+    assert '无法列出文件' in page
+
+
+# 服务端分页
+
+def page_link(page, label):
+    match = re.search(r'href="([^"]*)">' + label, page)
+    return html.unescape(match.group(1)) if match else None
+
+
+def file_names(page):
+    return re.findall(r'/download/bkt/(f\d\.txt)', page)
+
+
+def test_listing_pages_follow_continuation_tokens(app_module, s3, owner):
+    for number in range(5):
+        s3.put_object(Bucket='bkt', Key=f'f{number}.txt', Body=b'x')
+    requests = []
+    app_module.get_s3_client(OWNER).meta.events.register(
+        'provide-client-params.s3.ListObjectsV2', lambda params, **kwargs: requests.append(params.get('MaxKeys')))
+
+    first = listed(owner, '/bucket/bkt?limit=2')
+    assert file_names(first) == ['f0.txt', 'f1.txt']
+    assert page_link(first, '上一页') is None
+    second = listed(owner, page_link(first, '下一页'))
+    assert file_names(second) == ['f2.txt', 'f3.txt']
+    third = listed(owner, page_link(second, '下一页'))
+    assert file_names(third) == ['f4.txt']
+    assert page_link(third, '下一页') is None
+    assert requests == [2, 2, 2]  # 每页一次请求，只取一页的键
+
+    # 上一页的游标来自翻页时记录的历史，命中缓存不再请求S3
+    assert file_names(listed(owner, page_link(third, '上一页'))) == ['f2.txt', 'f3.txt']
+    assert file_names(listed(owner, page_link(second, '上一页'))) == ['f0.txt', 'f1.txt']
+    assert len(requests) == 3
+
+
+# 流式输出完整列表
+
+def test_full_listing_streams_page_by_page(app_module, s3, owner):
+    for number in range(1001):
+        s3.put_object(Bucket='bkt', Key=f'many/{number:04d}.txt', Body=b'')
+    requests = []
+    app_module.get_s3_client(OWNER).meta.events.register(
+        'before-call.s3.ListObjectsV2', lambda **kwargs: requests.append(1))
+
+    response = owner.get('/bucket/bkt?prefix=many/&all=1', buffered=False)
+    assert response.is_streamed
+    chunks = iter(response.response)
+    head = next(chunks)
+    assert '<html' in head.decode('utf-8') and requests == []  # 页头在请求S3之前已发出
+    body = head + b''.join(chunks)
+    response.close()
+    assert len(requests) == 2
+    assert len(re.findall(rb'/download/bkt/many/\d{4}\.txt', body)) == 1001
+
+
+def test_full_listing_reports_errors_inside_the_page(app_module, s3, owner, other, deny_other):
+    page = other.get('/bucket/bkt?all=1').get_data(as_text=True)
+    assert 'AccessDenied' in page
+    assert page.rstrip().endswith('</html>')
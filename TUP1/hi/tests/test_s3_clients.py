@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+from conftest import OTHER, OWNER
+
+
+def test_client_is_reused_for_same_credentials(app_module):
+    client = app_module.get_s3_client(OWNER)
+    assert app_module.get_s3_client(dict(OWNER)) is client
+    assert app_module.get_s3_client(OTHER) is not client
+    assert app_module.s3_client_stats()['size'] == 2
+
+
+def test_changed_secret_key_rebuilds_client(app_module):
+    client = app_module.get_s3_client(OWNER)
+    rebuilt = app_module.get_s3_client(dict(OWNER, secret_key='rotated'))
+    assert rebuilt is not client
+    assert app_module.get_s3_client(dict(OWNER, secret_key='rotated')) is rebuilt
+    assert app_module.s3_client_stats()['size'] == 1
+
+
+def test_pool_evicts_least_recently_used(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'S3_CLIENT_CACHE_SIZE', 2)
+    first = app_module.get_s3_client(OWNER)
+    app_module.get_s3_client(OTHER)
+    app_module.get_s3_client(OWNER)  # OWNER 变为最近使用
+    app_module.get_s3_client(dict(OTHER, access_key='third-key'))
+    assert app_module.get_s3_client(OWNER) is first
+    assert app_module.s3_client_stats()['size'] == 2
+
+
+def test_idle_clients_are_evicted(app_module, monkeypatch):
+    client = app_module.get_s3_client(OWNER)
+    monkeypatch.setitem(app_module.app.config, 'S3_CLIENT_IDLE_TIMEOUT', 0)
+    assert app_module.get_s3_client(OTHER) is not client
+    assert app_module.s3_client_stats()['size'] == 1
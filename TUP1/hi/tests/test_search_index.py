@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timezone
+
+from conftest import ENDPOINT, OTHER, flashes
+
+
+def test_search_checks_bucket_access_before_reading_index(app_module, s3, owner, other, deny_other):
+    s3.put_object(Bucket='bkt', Key='reports/secret.txt', Body=b'x')
+    app_module.metadata_index.scan({'cancel_requested': False, 'done': 0}, s3, ENDPOINT, 'bkt')
+    assert 'reports/secret.txt' in owner.get('/search/bkt?q=secret').get_data(as_text=True)
+
+    response = other.get('/search/bkt?q=secret')
+    assert response.status_code == 302
+    assert 'secret.txt' not in response.get_data(as_text=True)
+    assert any('搜索失败' in message for message in flashes(other))
+
+
+class UploadDuringScan:
+    """第一页列出之后、扫描结束之前有新对象上传的存储桶"""
+
+    def __init__(self, index):
+        self.index = index
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket):
+        now = datetime.now(timezone.utc)
+        yield {'Contents': [{'Key': 'old.txt', 'Size': 1, 'ETag': '"a"', 'LastModified': now}]}
+        self.index.put(ENDPOINT, Bucket, 'new.txt', 1, 'b', now)
+        yield {'Contents': []}
+
+
+def test_index_keeps_objects_uploaded_during_scan(app_module):
+    index = app_module.metadata_index
+    index.scan({'cancel_requested': False, 'done': 0}, UploadDuringScan(index), ENDPOINT, 'bkt')
+    assert sorted(row['key'] for row in index.search(ENDPOINT, 'bkt', '.txt')) == ['new.txt', 'old.txt']
+
+
+def test_rebuild_without_access_keeps_ready_index(app_module, s3, owner, other, deny_other):
+    s3.put_object(Bucket='bkt', Key='reports/secret.txt', Body=b'x')
+    app_module.metadata_index.scan({'cancel_requested': False, 'done': 0}, s3, ENDPOINT, 'bkt')
+    assert app_module.metadata_index.status(ENDPOINT, 'bkt')['status'] == 'ready'
+
+    response = other.post('/index/bkt/rebuild')
+    assert response.status_code == 302
+    assert any('重建索引失败' in message for message in flashes(other))
+    assert app_module.metadata_index.status(ENDPOINT, 'bkt')['status'] == 'ready'
+    assert app_module.list_jobs(app_module.job_owner(OTHER)) == []
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+import serve
+
+
+def test_create_app_rebuilds_state_from_config(app_module):
+    app_module.create_app({'SHARE_LIMIT_BACKEND': 'memory', 'LISTING_CACHE_TTL': 5})
+    assert isinstance(app_module.share_limits, app_module.MemoryLimitStore)
+    assert app_module.listing_cache.ttl == 5
+
+
+def test_create_app_returns_module_app(app_module):
+    assert app_module.create_app() is app_module.app
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='需要 fork')
+def test_forked_process_drops_inherited_s3_clients(app_module):
+    app_module._s3_clients[('endpoint', 'key')] = {'client': object(), 'secret_key': '', 'last_used': 0}
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if not app_module._s3_clients else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert app_module._s3_clients  # 父进程的连接池不受影响
+
+
+def test_serve_defaults_to_one_worker(app_module):
+    parser = serve.build_parser('test', app_module.app.config['SERVE_WORKERS'])
+    assert parser.parse_args([]).workers == 1
+
+
+def test_serve_rejects_memory_limits_with_several_workers(app_module):
+    app_module.create_app({'SHARE_LIMIT_BACKEND': 'memory'})
+    with pytest.raises(SystemExit):
+        serve.run(app_module.app, 'test', argv=['-w', '2'])
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+
+from conftest import OTHER, OWNER
+
+
+def share_path(client, key, **limits):
+    response = client.post('/generate-share-url/bkt', data=dict(key=key, expires_in='10', **limits))
+    return response.get_json()['url'].split('localhost', 1)[1]
+
+
+def token_payload(path):
+    body = path.rsplit('/', 1)[1].split('.')[0]
+    return json.loads(base64.urlsafe_b64decode(body + '=' * (-len(body) % 4)))
+
+
+def sign(payload, key):
+    """按令牌格式用任意密钥签名，模拟攻击者伪造的令牌"""
+    encode = lambda data: base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+    body = encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    return f'{body}.{encode(hmac.new(key, body.encode("ascii"), hashlib.sha256).digest()[:16])}'
+
+
+# 签名令牌
+
+def test_share_link_uses_creator_credentials(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='f.txt', Body=b'hello')
+    path = share_path(owner, 'f.txt')
+    visitor = app_module.app.test_client()  # 没有登录过的浏览器
+    response = visitor.get(path)
+    assert response.status_code == 302
+    assert 'owner-key' in response.location
+
+
+def test_token_signed_with_public_secret_key_is_rejected(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='public.txt', Body=b'public')
+    s3.put_object(Bucket='bkt', Key='private/secret.txt', Body=b'secret')
+    payload = token_payload(share_path(owner, 'public.txt'))
+    payload[1] = 'private/secret.txt'
+    secret = app_module.app.secret_key.encode('utf-8')
+    visitor = app_module.app.test_client()
+    for key in (secret, hashlib.sha256(b'share-token:' + secret).digest()):
+        assert visitor.get(f'/share/{sign(payload, key)}').location.endswith('/share-expired')
+
+
+def test_credential_reference_only_reads_the_shared_object(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='public.txt', Body=b'public')
+    s3.put_object(Bucket='bkt', Key='private/secret.txt', Body=b'secret')
+    bucket, _, expires_at, *rest = token_payload(share_path(owner, 'public.txt'))
+    # 即使拿到签名密钥，把引用放到另一个对象的令牌里也读不到凭证
+    token = app_module.make_share_token(bucket, 'private/secret.txt', expires_at, credential_ref=rest[-1])
+    response = app_module.app.test_client().get(f'/share/{token}')
+    assert response.location.endswith('/share-expired')
+
+
+def test_share_token_key_is_random_and_private(app_module):
+    key = app_module.share_token_key()
+    path = app_module.app.config['SHARE_TOKEN_KEY_FILE']
+    assert len(key) == 32
+    assert oct(os.stat(path).st_mode & 0o777) == '0o600'
+    app_module._share_token_keys.clear()
+    assert app_module.share_token_key() == key  # 其他worker读取同一个文件
+
+
+def test_shares_are_refused_with_public_key(app_module, s3, owner, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'SHARE_TOKEN_KEY', app_module.app.secret_key)
+    response = owner.post('/generate-share-url/bkt', data={'key': 'f.txt', 'expires_in': '10'})
+    assert response.status_code == 503
+    token = sign(['bkt', 'f.txt', int(time.time()) + 600], app_module.app.secret_key.encode('utf-8'))
+    assert app_module.verify_share_token(token) is None
+
+
+def test_tampered_share_token_is_rejected(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='f.bin', Body=b'0123456789')
+    path = share_path(owner, 'f.bin', max_downloads='1')
+    payload = token_payload(path)
+    payload[4] = 1000  # 改大下载次数，沿用原来的签名
+    forged = sign(payload, b'x' * 32).split('.')[0] + '.' + path.rsplit('.', 1)[1]
+    assert app_module.verify_share_token(forged) is None
+    assert app_module.app.test_client().get(f'/share/{forged}').location.endswith('/share-expired')
+
+
+# 代理模式的磁盘缓存
+
+def test_proxy_cache_is_scoped_to_share_credentials(app_module, s3, owner, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'SHARE_PROXY', True)
+    monkeypatch.setattr(app_module.share_cache, 'fill_async', app_module.share_cache._fill)
+    s3.put_object(Bucket='bkt', Key='private.txt', Body=b'secret')
+    path = share_path(owner, 'private.txt')
+    assert app_module.app.test_client().get(path).data == b'secret'
+    assert app_module.share_cache.stats()['fills'] == 1
+
+    # 另一组凭证没有读权限：不能命中所有者填充的缓存，只能向S3请求并被拒绝
+    denied = boto3.client('s3', region_name='us-east-1')
+    stubber = Stubber(denied)
+    stubber.add_client_error('get_object', 'AccessDenied', http_status_code=403)
+    monkeypatch.setattr(app_module.share_cache, 'fill_async', lambda s3, cache_key: None)
+    with stubber, app_module.app.test_request_context():
+        with pytest.raises(ClientError):
+            app_module.serve_shared_object(denied, OTHER, 'bkt', 'private.txt')
+    assert app_module.share_cache.stats()['hits'] == 0
+
+
+def test_share_link_requires_read_access(app_module, s3, other, monkeypatch):
+    s3.put_object(Bucket='bkt', Key='private.txt', Body=b'secret')
+    denied = boto3.client('s3', region_name='us-east-1')
+    stubber = Stubber(denied)
+    stubber.add_client_error('head_object', 'AccessDenied', http_status_code=403)
+    monkeypatch.setattr(app_module, 'get_s3_client', lambda config=None: denied)
+    with stubber:
+        response = other.post('/generate-share-url/bkt', data={'key': 'private.txt', 'expires_in': '10'})
+    assert response.status_code == 404
+    assert response.get_json()['success'] is False
+
+
+def test_share_link_for_missing_object_is_refused(app_module, s3, owner):
+    response = owner.post('/generate-share-url/bkt', data={'key': 'missing.txt', 'expires_in': '10'})
+    assert response.status_code == 404
+
+
+def test_stale_fill_lock_is_reclaimed(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='f.txt', Body=b'hello')
+    cache = app_module.share_cache
+    cache_key = (OTHER['endpoint_url'], 'bkt', 'f.txt') + app_module.credential_identity(OTHER)
+    os.makedirs(cache.directory, exist_ok=True)
+    part_path = cache._path(cache_key) + '.part'
+    open(part_path, 'wb').close()
+    os.utime(part_path, (0, 0))  # 崩溃的进程留下的锁
+
+    cache._fill(s3, cache_key)
+    assert cache.stats()['reclaimed'] == 1
+    data_path, meta = cache.lookup(s3, cache_key)
+    with open(data_path, 'rb') as f:
+        assert f.read() == b'hello'
+
+
+# 预签名URL缓存
+
+def test_share_redirect_reuses_presigned_url(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='f.txt', Body=b'hello')
+    path = share_path(owner, 'f.txt')
+    signed = []
+    app_module.get_s3_client(OWNER).meta.events.register('before-sign.s3.GetObject',
+                                                         lambda **kwargs: signed.append(1))
+    visitor = app_module.app.test_client()
+    first, second = visitor.get(path).location, visitor.get(path).location
+    assert first == second
+    assert len(signed) == 1
+    expires_at = int(first.rsplit('Expires=', 1)[1])
+    assert abs(expires_at - time.time() - app_module.app.config['SHARE_PRESIGN_EXPIRES']) < 5
+
+
+def test_presigned_url_is_cached_for_expiry_minus_margin(app_module, s3):
+    app_module.create_app({'SHARE_PRESIGN_EXPIRES': 300, 'SHARE_PRESIGN_MARGIN': 120})
+    assert app_module.presign_cache.ttl == 180  # 从缓存取出的URL至少还有120秒有效期
+
+    app_module.create_app({'SHARE_PRESIGN_EXPIRES': 120, 'SHARE_PRESIGN_MARGIN': 120})
+    s3.put_object(Bucket='bkt', Key='f.txt', Body=b'hello')
+    with app_module.app.test_request_context():
+        app_module.presigned_download_url(OWNER, 'bkt', 'f.txt')
+        app_module.presigned_download_url(OWNER, 'bkt', 'f.txt')
+    assert app_module.presign_cache.stats()['hits'] == 0  # 没有余量的URL不复用
+
+
+def test_presigned_url_cache_is_per_credential(app_module, s3):
+    with app_module.app.test_request_context():
+        mine = app_module.presigned_download_url(OWNER, 'bkt', 'f.txt')
+        theirs = app_module.presigned_download_url(OTHER, 'bkt', 'f.txt')
+    assert 'owner-key' in mine and 'other-key' in theirs
+
+
+# 分享链接的区间请求和下载额度
+
+def test_download_quota_counts_bytes_of_open_ended_ranges(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='f.bin', Body=b'0123456789')
+    path = share_path(owner, 'f.bin', max_downloads='1')
+    visitor = app_module.app.test_client()
+
+    response = visitor.get(path, headers={'Range': 'bytes=1-'})
+    assert response.status_code == 206
+    assert response.data == b'123456789'
+    # 额度是10个字节，已用掉9个，不足以再完整下载一次
+    assert visitor.get(path).location.endswith('/share-expired')
+    assert visitor.get(path, headers={'Range': 'bytes=0-0'}).data == b'0'
+    assert visitor.get(path, headers={'Range': 'bytes=0-0'}).location.endswith('/share-expired')
+
+
+def test_download_quota_allows_resumed_download(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='f.bin', Body=b'0123456789')
+    path = share_path(owner, 'f.bin', max_downloads='1')
+    visitor = app_module.app.test_client()
+
+    first = visitor.get(path, headers={'Range': 'bytes=0-4'})
+    second = visitor.get(path, headers={'Range': 'bytes=5-9'})
+    assert (first.status_code, second.status_code) == (206, 206)
+    assert first.data + second.data == b'0123456789'
+    assert second.headers['Content-Range'] == 'bytes 5-9/10'
+    assert visitor.get(path).location.endswith('/share-expired')
+
+
+def test_byte_limit_truncates_object_and_ranges(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='f.bin', Body=b'0123456789')
+    path = share_path(owner, 'f.bin', byte_limit_mb=str(4 / 1024 / 1024))
+    visitor = app_module.app.test_client()
+
+    response = visitor.get(path)
+    assert response.status_code == 200
+    assert response.data == b'0123'
+    response = visitor.get(path, headers={'Range': 'bytes=2-'})
+    assert response.status_code == 206
+    assert response.data == b'23'
+    assert response.headers['Content-Range'] == 'bytes 2-3/4'
+    assert visitor.get(path, headers={'Range': 'bytes=4-'}).status_code == 416
+
+
+def test_share_requests_are_rate_limited_per_link_and_ip(app_module, s3, owner, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'SHARE_TOKEN_BURST', 2)
+    monkeypatch.setitem(app_module.app.config, 'SHARE_TOKEN_RATE', 0.5)
+    monkeypatch.setitem(app_module.app.config, 'SHARE_IP_BURST', 3)
+    s3.put_object(Bucket='bkt', Key='f.txt', Body=b'hello')
+    path, other_path = share_path(owner, 'f.txt'), share_path(owner, 'f.txt', max_downloads='5')
+    visitor = app_module.app.test_client()
+    assert [visitor.get(path).status_code for _ in range(2)] == [302, 302]
+    response = visitor.get(path)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+
+    # 换一个链接仍受同一IP的限额约束
+    assert visitor.get(other_path).status_code == 200
+    assert visitor.get(other_path).status_code == 429
+
+
+def test_sqlite_limits_are_shared_between_workers(app_module, tmp_path):
+    first = app_module.SQLiteLimitStore(str(tmp_path / 'shared.db'))
+    second = app_module.SQLiteLimitStore(str(tmp_path / 'shared.db'))
+    expires_at = time.time() + 60
+    assert first.consume('downloads:x', 10, expires_at, amount=6)
+    assert not second.consume('downloads:x', 10, expires_at, amount=5)
+    assert second.consume('downloads:x', 10, expires_at, amount=4)
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+
+def test_templates_are_compiled_once_at_startup(app_module, s3, owner, monkeypatch):
+    def compile_again(*args, **kwargs):
+        raise AssertionError('模板在请求中被重新编译')
+    monkeypatch.setattr(app_module.app.jinja_env, 'compile', compile_again)
+    s3.put_object(Bucket='bkt', Key='a.txt', Body=b'x')
+    assert owner.get('/').status_code == 200
+    assert owner.get('/bucket/bkt').status_code == 200
+
+
+def test_object_names_are_escaped(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='<img src=x onerror=alert(1)>.txt', Body=b'x')
+    page = owner.get('/bucket/bkt').get_data(as_text=True)
+    assert '<img src=x' not in page
+    assert '&lt;img src=x onerror=alert(1)&gt;.txt' in page
+
+
+def test_filesize_filter(app_module):
+    assert app_module.format_file_size(512) == '512 B'
+    assert app_module.format_file_size(2048) == '2.00 KB'
+    assert app_module.format_file_size(3 * 1024 * 1024) == '3.00 MB'
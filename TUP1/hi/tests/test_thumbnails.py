@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import io
+import threading
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from conftest import OWNER  # noqa: E402
+
+
+def png_bytes(size=(400, 300)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def thumbnail_url(s3, key):
+    etag = s3.head_object(Bucket='bkt', Key=key)['ETag'].strip('"')
+    return f'/thumbnail/bkt/{key}?v={etag}'
+
+
+def count_gets(app_module):
+    gets = []
+    app_module.get_s3_client(OWNER).meta.events.register('before-call.s3.GetObject',
+                                                         lambda **kwargs: gets.append(1))
+    return gets
+
+
+def test_thumbnail_is_generated_once_and_cached(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='photo.png', Body=png_bytes())
+    assert 'thumbnailFailed(this)' in owner.get('/bucket/bkt').get_data(as_text=True)
+    gets = count_gets(app_module)
+
+    redirect = owner.get('/thumbnail/bkt/photo.png')
+    assert redirect.location.endswith(thumbnail_url(s3, 'photo.png'))
+    for _ in range(2):
+        response = owner.get(thumbnail_url(s3, 'photo.png'))
+        assert response.status_code == 200
+        assert response.headers['Cache-Control'] == 'private, max-age=31536000, immutable'
+        with Image.open(io.BytesIO(response.data)) as image:
+            assert max(image.size) <= app_module.app.config['THUMBNAIL_SIZE']
+    assert len(gets) == 1
+
+
+def test_slow_thumbnail_returns_503_and_retry_succeeds(app_module, s3, owner, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'THUMBNAIL_WAIT', 0.05)
+    s3.put_object(Bucket='bkt', Key='photo.png', Body=png_bytes())
+    release = threading.Event()
+
+    def slow_download(**kwargs):
+        release.wait(10)
+    app_module.get_s3_client(OWNER).meta.events.register('before-call.s3.GetObject', slow_download)
+
+    response = owner.get(thumbnail_url(s3, 'photo.png'))
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '2'
+    assert response.headers['Cache-Control'] == 'no-store'
+
+    # 生成在后台继续，浏览器按Retry-After重试时得到缩略图
+    release.set()
+    monkeypatch.setitem(app_module.app.config, 'THUMBNAIL_WAIT', 10)
+    assert owner.get(thumbnail_url(s3, 'photo.png') + '&retry=1').status_code == 200
+
+
+def test_unreadable_image_is_remembered(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='broken.png', Body=b'not an image')
+    gets = count_gets(app_module)
+    assert owner.get(thumbnail_url(s3, 'broken.png')).status_code == 404
+    assert owner.get(thumbnail_url(s3, 'broken.png')).status_code == 404
+    assert len(gets) == 1
+
+
+def test_thumbnails_are_not_shared_across_credentials(app_module, s3, owner, other):
+    s3.put_object(Bucket='bkt', Key='photo.png', Body=png_bytes())
+    assert owner.get(thumbnail_url(s3, 'photo.png')).status_code == 200
+    before = app_module.thumbnail_cache.stats()['misses']
+    other.get(thumbnail_url(s3, 'photo.png'))
+    assert app_module.thumbnail_cache.stats()['misses'] == before + 1
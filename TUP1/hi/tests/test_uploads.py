@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import io
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from conftest import OWNER, flashes
+
+PART = 5 * 1024 * 1024  # S3允许的最小分片
+
+
+@pytest.fixture
+def small_parts(app_module, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_PART_SIZE', PART)
+
+
+def init_upload(client, size, filename='big.bin'):
+    response = client.post('/upload/bkt/init', data={'filename': filename, 'size': str(size)})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def put_part(client, upload, number, body):
+    return client.put('/upload/bkt/part', query_string={'token': upload['token'], 'part_number': number},
+                      data=body)
+
+
+# 分片上传（服务端中转）
+
+def test_chunked_upload_resumes_from_status(app_module, s3, owner, small_parts):
+    data = bytes(range(256)) * (PART // 256) + b'end'
+    upload = init_upload(owner, len(data))
+    assert upload['part_size'] == PART
+    assert put_part(owner, upload, 1, data[:PART]).status_code == 200
+
+    # 页面刷新后只凭保存的令牌查询进度，从第2个分片继续
+    status = owner.get('/upload/bkt/status', query_string={'token': upload['token']}).get_json()
+    assert [(part['PartNumber'], part['Size']) for part in status['parts']] == [(1, PART)]
+    assert status['uploaded_bytes'] == PART
+    assert put_part(owner, upload, 2, data[PART:]).status_code == 200
+
+    response = owner.post('/upload/bkt/complete', json={'token': upload['token']})
+    assert response.get_json() == {'success': True, 'key': 'big.bin'}
+    assert s3.get_object(Bucket='bkt', Key='big.bin')['Body'].read() == data
+
+
+def test_part_larger_than_part_size_is_rejected(app_module, s3, owner, small_parts):
+    upload = init_upload(owner, PART + 1)
+    assert put_part(owner, upload, 1, b'x' * (PART + 1)).status_code == 413
+    assert put_part(owner, upload, 3, b'x').status_code == 400  # 超出声明大小需要的分片数
+
+
+def test_complete_checks_total_against_declared_size(app_module, s3, owner, small_parts):
+    upload = init_upload(owner, PART + 10)
+    put_part(owner, upload, 1, b'x' * PART)
+    put_part(owner, upload, 2, b'x')
+    response = owner.post('/upload/bkt/complete', json={'token': upload['token']})
+    assert response.status_code == 409
+    assert 'big.bin' not in [obj['Key'] for obj in s3.list_objects_v2(Bucket='bkt').get('Contents', [])]
+
+
+def test_upload_token_cannot_be_altered(app_module, s3, owner, small_parts):
+    upload = init_upload(owner, 10)
+    signature = upload['token'].split('.')[1]
+    forged = app_module.make_upload_token('bkt', 'big.bin', upload['upload_id'], 10 ** 9, 10 ** 9)
+    assert put_part(owner, dict(upload, token=forged.split('.')[0] + '.' + signature), 1, b'x').status_code == 400
+    # 令牌只对签发时的存储桶有效
+    response = owner.put('/upload/other/part', query_string={'token': upload['token'], 'part_number': 1},
+                         data=b'x')
+    assert response.status_code == 400
+
+
+# 服务端分片并行上传
+
+def test_large_form_upload_uses_parallel_parts(app_module, s3, owner, small_parts, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_MULTIPART_THRESHOLD', PART)
+    data = b'a' * PART + b'b' * 10
+    response = owner.post('/upload/bkt', data={'file': (io.BytesIO(data), 'big.bin'), 'prefix': 'in/'})
+    assert response.status_code == 302
+    head = s3.head_object(Bucket='bkt', Key='in/big.bin')
+    assert head['ETag'].endswith('-2"')  # 两个分片合并的对象
+    assert s3.get_object(Bucket='bkt', Key='in/big.bin')['Body'].read() == data
+
+
+def test_failed_upload_does_not_abort_other_uploads(app_module, s3, owner, small_parts, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_MULTIPART_THRESHOLD', PART)
+    other_upload = s3.create_multipart_upload(Bucket='bkt', Key='big.bin')['UploadId']
+
+    def fail_part(**kwargs):
+        raise ClientError({'Error': {'Code': 'InternalError', 'Message': 'boom'}}, 'UploadPart')
+    app_module.get_s3_client(OWNER).meta.events.register('before-call.s3.UploadPart', fail_part)
+
+    owner.post('/upload/bkt', data={'file': (io.BytesIO(b'x' * (PART + 1)), 'big.bin')})
+    assert any('上传失败' in message for message in flashes(owner))
+    uploads = s3.list_multipart_uploads(Bucket='bkt').get('Uploads', [])
+    assert [upload['UploadId'] for upload in uploads] == [other_upload]
+
+
+# 浏览器直传
+
+def test_direct_upload_of_small_file_signs_size_limited_post(app_module, s3, owner):
+    response = owner.post('/direct-upload/bkt/init', data={'filename': 'a.txt', 'size': '5', 'prefix': 'docs/',
+                                                           'content_type': 'text/plain'})
+    result = response.get_json()
+    assert result['mode'] == 'post' and result['key'] == 'docs/a.txt'
+    policy = json.loads(base64.b64decode(result['fields']['policy']))
+    assert ['content-length-range', 0, 5] in policy['conditions']
+    assert {'Content-Type': 'text/plain'} in policy['conditions']
+
+
+def test_direct_multipart_upload_signs_each_part_and_completes(app_module, s3, owner, small_parts, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_MULTIPART_THRESHOLD', PART)
+    data = b'a' * PART + b'b'
+    result = owner.post('/direct-upload/bkt/init', data={'filename': 'big.bin', 'size': str(len(data))}).get_json()
+    assert result['mode'] == 'multipart' and result['part_size'] == PART
+    assert len(result['urls']) == 2
+    assert all('partNumber=%d' % number in url for number, url in enumerate(result['urls'], 1))
+
+    # 浏览器按URL上传的分片，这里直接用S3客户端代替
+    parts = [{'PartNumber': number, 'ETag': s3.upload_part(
+        Bucket='bkt', Key='big.bin', UploadId=result['upload_id'], PartNumber=number,
+        Body=data[(number - 1) * PART:number * PART])['ETag']} for number in (2, 1)]
+    response = owner.post('/direct-upload/bkt/complete',
+                          json={'key': 'big.bin', 'upload_id': result['upload_id'], 'parts': parts})
+    assert response.get_json() == {'success': True, 'key': 'big.bin'}
+    assert s3.get_object(Bucket='bkt', Key='big.bin')['Body'].read() == data
+
+
+def test_direct_upload_rejects_invalid_requests(app_module, s3, owner):
+    too_large = str(app_module.app.config['MAX_CONTENT_LENGTH'] + 1)
+    assert owner.post('/direct-upload/bkt/init', data={'filename': 'a.txt', 'size': too_large}).status_code == 400
+    assert owner.post('/direct-upload/bkt/init', data={'filename': 'a.txt'}).status_code == 400
+    for parts in ([], [{'PartNumber': 1, 'ETag': '"a"'}, {'PartNumber': 1, 'ETag': '"b"'}],
+                  [{'PartNumber': 0, 'ETag': '"a"'}], ['1']):
+        response = owner.post('/direct-upload/bkt/complete', json={'key': 'k', 'upload_id': 'u', 'parts': parts})
+        assert response.status_code == 400
+
+
+def test_direct_upload_abort_removes_only_that_upload(app_module, s3, owner):
+    mine = s3.create_multipart_upload(Bucket='bkt', Key='big.bin')['UploadId']
+    other = s3.create_multipart_upload(Bucket='bkt', Key='big.bin')['UploadId']
+    response = owner.post('/direct-upload/bkt/abort', json={'key': 'big.bin', 'upload_id': mine})
+    assert response.get_json() == {'success': True}
+    uploads = s3.list_multipart_uploads(Bucket='bkt').get('Uploads', [])
+    assert [upload['UploadId'] for upload in uploads] == [other]
+
+
+# 文件夹和批量上传
+
+def test_batch_upload_keeps_relative_paths(app_module, s3, owner):
+    files = [(io.BytesIO(b'one'), 'a.txt'), (io.BytesIO(b'two!'), 'b.mp3'), (io.BytesIO(b'3'), 'c.txt')]
+    paths = ['相册/a.txt', '音乐/专辑/b.mp3', '../../etc/c.txt']
+    result = owner.post('/upload/bkt/batch', data={'files': files, 'paths': paths, 'prefix': 'up/'}).get_json()
+    assert result['success'] is True
+    assert sorted(result['uploaded']) == ['up/etc/c.txt', 'up/相册/a.txt', 'up/音乐/专辑/b.mp3']
+    assert result['bytes'] == 8
+    assert s3.get_object(Bucket='bkt', Key='up/音乐/专辑/b.mp3')['Body'].read() == b'two!'
+
+
+def test_batch_upload_reports_failed_files_separately(app_module, s3, owner):
+    assert 'prefix=up/' not in owner.get('/bucket/bkt').get_data(as_text=True)
+
+    def reject(params, **kwargs):
+        if params['Key'] == 'up/bad.txt':
+            raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'denied'}}, 'PutObject')
+    app_module.get_s3_client(OWNER).meta.events.register('provide-client-params.s3.PutObject', reject)
+
+    files = [(io.BytesIO(b'ok'), 'good.txt'), (io.BytesIO(b'no'), 'bad.txt')]
+    result = owner.post('/upload/bkt/batch', data={'files': files, 'prefix': 'up/'}).get_json()
+    assert result['success'] is False
+    assert result['uploaded'] == ['up/good.txt']
+    assert [item['path'] for item in result['failed']] == ['bad.txt']
+    # 部分失败时已上传的文件也要出现在列表中
+    assert 'prefix=up/' in owner.get('/bucket/bkt').get_data(as_text=True)
+
+
+def test_batch_upload_without_files_is_rejected(app_module, s3, owner):
+    assert owner.post('/upload/bkt/batch', data={'prefix': 'up/'}).status_code == 400
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import struct
+import zipfile
+
+from conftest import OWNER, flashes
+
+
+# ZIP64 的写入和解析
+
+def force_zip64(monkeypatch):
+    """把zipfile的ZIP64阈值调小，几个字节的文件就会写出ZIP64记录"""
+    monkeypatch.setattr(zipfile, 'ZIP64_LIMIT', 8)
+    monkeypatch.setattr(zipfile, 'ZIP_FILECOUNT_LIMIT', 2)
+
+
+def test_folder_download_writes_readable_zip64(app_module, s3, owner, monkeypatch):
+    files = {'docs/a.txt': b'first file contents', 'docs/sub/b.txt': b'second file contents',
+             'docs/c.txt': b'third file contents'}
+    for key, body in files.items():
+        s3.put_object(Bucket='bkt', Key=key, Body=body)
+
+    with monkeypatch.context() as patch:
+        force_zip64(patch)
+        data = owner.get('/download-folder/bkt/docs').data
+
+    assert b'PK\x06\x06' in data and b'PK\x06\x07' in data  # ZIP64 中央目录结束记录和定位器
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert {name: archive.read(name) for name in archive.namelist()} == {
+            key[len('docs/'):]: body for key, body in files.items()}
+
+
+def test_archive_entry_names_stay_inside_target_folder(app_module):
+    assert app_module.archive_entry_name('docs/../../etc/passwd', 'docs/') == 'etc/passwd'
+    assert app_module.archive_entry_name('docs//abs/./x', 'docs/') == 'abs/x'
+    assert app_module.archive_entry_name('docs/..', 'docs/') == ''
+
+
+def test_folder_download_streams_zip(app_module, s3, owner):
+    s3.put_object(Bucket='bkt', Key='相册/a.txt', Body=b'hello')
+    response = owner.get('/download-folder/bkt/相册', buffered=False)
+    assert response.is_streamed and response.mimetype == 'application/zip'
+    assert "filename*=UTF-8''%E7%9B%B8%E5%86%8C.zip" in response.headers['Content-Disposition']
+    data = b''.join(response.response)
+    response.close()
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.read('a.txt') == b'hello'
+
+
+def test_folder_download_checks_access_before_streaming(app_module, s3, other, deny_other):
+    response = other.get('/download-folder/bkt/docs')
+    assert response.status_code == 302
+    assert any('下载失败' in message for message in flashes(other))
+
+
+# 浏览压缩包内容
+
+def build_zip64_archive(monkeypatch, files):
+    buffer = io.BytesIO()
+    with monkeypatch.context() as patch:
+        force_zip64(patch)
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for name, (body, method) in files.items():
+                archive.writestr(zipfile.ZipInfo(name, (2024, 1, 1, 0, 0, 0)), body, compress_type=method)
+    return buffer.getvalue()
+
+
+def test_zip64_archive_can_be_browsed_and_extracted(app_module, s3, owner, monkeypatch):
+    files = {
+        'readme.txt': (b'stored entry ' * 4, zipfile.ZIP_STORED),
+        'data/big.txt': (b'deflated entry ' * 200, zipfile.ZIP_DEFLATED),
+    }
+    data = build_zip64_archive(monkeypatch, files)
+    assert b'PK\x06\x06' in data
+    s3.put_object(Bucket='bkt', Key='a.zip', Body=data)
+
+    with app_module.app.test_request_context():
+        _, archive_size, entries = app_module.get_zip_directory(s3, 'bkt', 'a.zip')
+    assert archive_size == len(data)
+    assert {entry['name']: entry['size'] for entry in entries} == {
+        name: len(body) for name, (body, _) in files.items()}
+
+    page = owner.get('/zip/bkt/a.zip').get_data(as_text=True)
+    assert 'readme.txt' in page and 'data' in page
+    for name, (body, _) in files.items():
+        response = owner.get('/zip-entry/bkt/a.zip', query_string={'name': name})
+        assert response.status_code == 200
+        assert response.data == body
+
+
+def test_corrupt_zip_reports_error_instead_of_failing(app_module, s3, owner):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('a.txt', b'hello')
+    data = bytearray(buffer.getvalue())
+    # 中央目录中的大小标记为ZIP64，却没有ZIP64扩展字段
+    directory_start = data.index(b'PK\x01\x02')
+    struct.pack_into('<L', data, directory_start + 20, 0xFFFFFFFF)
+    s3.put_object(Bucket='bkt', Key='bad.zip', Body=bytes(data))
+
+    response = owner.get('/zip/bkt/bad.zip')
+    assert response.status_code == 302
+    assert any('无法读取压缩包' in message for message in flashes(owner))
+
+
+def record_ranges(app_module):
+    ranges = []
+    app_module.get_s3_client(OWNER).meta.events.register(
+        'provide-client-params.s3.GetObject', lambda params, **kwargs: ranges.append(params.get('Range')))
+    return ranges
+
+
+def test_browsing_reads_only_the_central_directory(app_module, s3, owner):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('big.bin', os.urandom(2 * 1024 * 1024))
+        archive.writestr('docs/readme.txt', b'hello')
+    s3.put_object(Bucket='bkt', Key='a.zip', Body=buffer.getvalue())
+    ranges = record_ranges(app_module)
+
+    page = owner.get('/zip/bkt/a.zip').get_data(as_text=True)
+    assert 'big.bin' in page and 'docs' in page
+    assert ranges and all(ranges)
+    read = sum(int(end) - int(start) + 1 for start, end in (r[len('bytes='):].split('-') for r in ranges))
+    assert read < 128 * 1024
+
+    # 目录按ETag缓存，再次浏览子文件夹不再读取
+    ranges.clear()
+    assert 'readme.txt' in owner.get('/zip/bkt/a.zip', query_string={'path': 'docs/'}).get_data(as_text=True)
+    assert ranges == []
+
+
+def test_missing_zip_entry_redirects_with_message(app_module, s3, owner):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('a.txt', b'hello')
+    s3.put_object(Bucket='bkt', Key='a.zip', Body=buffer.getvalue())
+    response = owner.get('/zip-entry/bkt/a.zip', query_string={'name': 'missing.txt'})
+    assert response.status_code == 302
+    assert any('压缩包中没有 missing.txt' in message for message in flashes(owner))
@@ -753,8 +753,13 @@ def delete_file(bucket_name, key):
     prefix = '/'.join(key.split('/')[:-1]) + '/' if '/' in key else ''
     return redirect(f'/bucket/{bucket_name}?prefix={prefix}')
 
+def create_app(config=None):
+    """WSGI应用工厂，供 gunicorn '上传:create_app()' 等服务器加载"""
+    if config:
+        app.config.update(config)
+    return app
+
 if __name__ == '__main__':
+    import serve
     print("雨云对象存储管理服务启动中...")
-    print(f"访问地址: http://127.0.0.1:5000")
-    print(f"或使用局域网IP访问: http://<您的设备IP>:5000")
-    app.run(debug=False, host='0.0.0.0', port=5000)
\ No newline at end of file
+    serve.run(create_app(), '雨云对象存储管理', module='上传')
\ No newline at end of file
@@ -1,18 +1,117 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from flask import Flask, request, redirect, url_for, flash, send_file, session, jsonify
+from flask import (Flask, request, redirect, url_for, flash, send_file, session, jsonify, Response,
+                   render_template, get_flashed_messages, stream_with_context)
+from jinja2 import DictLoader
+from markupsafe import Markup
 import boto3
-from botocore.exceptions import ClientError
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from botocore.response import StreamingBody
 import os
 from werkzeug.utils import secure_filename
+from werkzeug.http import http_date
+from werkzeug.middleware.proxy_fix import ProxyFix
 import io
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import json
+import threading
+import time
+import math
+import uuid
+import gzip
+import hmac
+import hashlib
+import base64
+import re
+import tempfile
+import sqlite3
+import secrets
+import queue
+import zipfile
+import struct
+import zlib
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+from collections import OrderedDict, deque
+from urllib.parse import quote
+
+try:
+    import brotli  # 可选依赖：安装后API响应支持br压缩
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image, ImageOps, features  # 可选依赖：安装Pillow后文件列表显示图片缩略图
+except ImportError:
+    Image = None
 
 app = Flask(__name__)
 app.secret_key = 'rainyun-s3-manager-secret-key-2023'
 app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024 * 1024  # 限制上传文件大小为1024MB
+app.config['S3_CLIENT_CACHE_SIZE'] = 32  # 进程内最多缓存的S3客户端数量
+app.config['S3_CLIENT_IDLE_TIMEOUT'] = 600  # 客户端空闲多少秒后被回收
+app.config['S3_MAX_POOL_CONNECTIONS'] = 20  # 每个客户端的urllib3连接池大小
+app.config['DOWNLOAD_CHUNK_SIZE'] = 256 * 1024  # 流式下载每次转发的块大小
+app.config['FOLDER_ZIP_PREFETCH'] = 4  # 打包下载文件夹时提前读取的对象数
+app.config['FOLDER_ZIP_BUFFER_CHUNKS'] = 4  # 每个预读对象最多缓冲的块数（内存上限约为 预读数 × 块数 × 块大小）
+app.config['ZIP_DIRECTORY_CACHE_SIZE'] = 64  # 缓存的压缩包目录数量
+app.config['ZIP_DIRECTORY_TTL'] = 3600  # 压缩包目录缓存有效期（秒），键中带ETag，对象被覆盖后自然失效
+app.config['ZIP_MAX_DIRECTORY'] = 64 * 1024 * 1024  # 中央目录超过此大小的压缩包不支持浏览
+app.config['UPLOAD_MULTIPART_THRESHOLD'] = 16 * 1024 * 1024  # 超过此大小使用分片上传
+app.config['UPLOAD_PART_SIZE'] = 16 * 1024 * 1024  # 分片大小（S3要求至少5MB）
+app.config['UPLOAD_MAX_CONCURRENCY'] = 10  # 并行上传的分片数，不宜超过S3_MAX_POOL_CONNECTIONS
+app.config['UPLOAD_BATCH_CONCURRENCY'] = 4  # 批量上传时同时传往S3的文件数，每个文件的分片并发按连接池大小均分
+app.config['UPLOAD_BATCH_MAX_BYTES'] = 64 * 1024 * 1024  # 浏览器每个批量上传请求的大致大小上限
+app.config['UPLOAD_BATCH_MAX_FILES'] = 100  # 浏览器每个批量上传请求最多包含的文件数
+app.config['DIRECT_UPLOAD'] = False  # 浏览器直传S3（需在存储桶上配置CORS并暴露ETag响应头）
+app.config['DIRECT_UPLOAD_CONCURRENCY'] = 4  # 浏览器直传时同时上传的分片数
+app.config['PRESIGN_UPLOAD_EXPIRES'] = 3600  # 直传签名的有效期（秒）
+app.config['DELETE_CONCURRENCY'] = 4  # 删除文件夹时并发执行的DeleteObjects请求数
+app.config['JOB_HISTORY_SIZE'] = 100  # 保留的后台任务记录数
+app.config['JOB_WORKERS'] = 2  # 同时执行的后台任务数，其余任务排队等待
+app.config['SERVE_WORKERS'] = 1  # serve.py 默认的worker进程数：任务记录和缓存都在进程内，多个worker时查询任务可能落到其他进程返回404
+app.config['LISTING_CACHE_SIZE'] = 512  # 缓存的目录列表数量
+app.config['LISTING_CACHE_TTL'] = 30  # 目录列表缓存有效期（秒）
+app.config['LIST_PAGE_SIZE'] = 200  # 每页显示的文件和文件夹数量（最大1000）
+app.config['FOLDER_STATS_CACHE_SIZE'] = 4096  # 缓存的文件夹统计数量
+app.config['FOLDER_STATS_TTL'] = 600  # 文件夹大小统计的有效期（秒），写操作会立即清除受影响的统计
+app.config['FOLDER_STATS_WORKERS'] = 8  # 统计文件夹大小时并行列举的前缀数
+app.config['API_COMPRESS_MIN_SIZE'] = 1024  # API响应超过此大小时压缩
+app.config['METADATA_INDEX_DB'] = os.path.join(tempfile.gettempdir(), 'rainyun-metadata-index.db')  # 对象元数据索引
+app.config['SEARCH_RESULT_LIMIT'] = 200  # 搜索最多返回的结果数
+app.config['SHARE_PRESIGN_EXPIRES'] = 600  # 分享跳转用的预签名URL有效期（秒）
+app.config['SHARE_PRESIGN_MARGIN'] = 60  # 预签名URL剩余有效期少于此值时重新签名
+app.config['PRESIGN_CACHE_SIZE'] = 4096  # 缓存的预签名URL数量
+app.config['SHARE_TOKEN_KEY'] = os.environ.get('SHARE_TOKEN_KEY')  # 分享令牌的HMAC密钥（至少16字节），为None时使用密钥文件
+app.config['SHARE_TOKEN_KEY_FILE'] = os.path.join(tempfile.gettempdir(), 'rainyun-share-token.key')  # 首次使用时随机生成，权限0600，多个worker共用
+app.config['SHARE_PROXY'] = False  # 分享链接由本服务输出文件内容（经本地磁盘缓存），而不是跳转到S3
+app.config['SHARE_CACHE_DIR'] = os.path.join(tempfile.gettempdir(), 'rainyun-share-cache')  # 多个worker共用
+app.config['SHARE_CACHE_MAX_BYTES'] = 2 * 1024 * 1024 * 1024  # 分享缓存占用的磁盘上限
+app.config['SHARE_CACHE_MAX_OBJECT'] = 512 * 1024 * 1024  # 超过此大小的文件不缓存，直接转发
+app.config['SHARE_CACHE_REVALIDATE'] = 60  # 缓存命中后隔多少秒向S3确认一次ETag
+app.config['SHARE_CACHE_FILL_TIMEOUT'] = 600  # .part 超过此秒数未写入视为填充进程已崩溃，删除后重新下载
+app.config['SHARE_TOKEN_RATE'] = 5.0  # 每个分享链接每秒允许的请求数（令牌桶补充速度）
+app.config['SHARE_TOKEN_BURST'] = 50  # 每个分享链接允许的突发请求数
+app.config['SHARE_IP_RATE'] = 2.0  # 每个IP每秒允许的分享请求数
+app.config['SHARE_IP_BURST'] = 30  # 每个IP允许的突发请求数
+app.config['SHARE_LIMIT_BACKEND'] = 'sqlite'  # 'sqlite'（多个worker共用计数）或 'memory'（只能单进程运行）
+app.config['TRUSTED_PROXY_COUNT'] = 0  # 前面的反向代理层数（如nginx为1），大于0时按X-Forwarded-For识别访问者IP
+app.config['SHARE_LIMIT_DB'] = os.path.join(tempfile.gettempdir(), 'rainyun-share-limits.db')
+# 分享链接引用的S3凭证保存在服务器上，访问者不需要登录；文件只有服务进程可读
+app.config['SHARE_CREDENTIAL_DB'] = os.path.join(tempfile.gettempdir(), 'rainyun-share-credentials.db')
+app.config['THUMBNAIL_DIR'] = os.path.join(tempfile.gettempdir(), 'rainyun-thumbnails')  # 多个worker共用
+app.config['THUMBNAIL_MAX_BYTES'] = 512 * 1024 * 1024  # 缩略图缓存占用的磁盘上限
+app.config['THUMBNAIL_SIZE'] = 256  # 缩略图最长边（像素），列表中按48像素显示，留出高分屏余量
+app.config['THUMBNAIL_FORMAT'] = 'WEBP'  # 'WEBP' 或 'JPEG'，Pillow不支持WebP时自动使用JPEG
+app.config['THUMBNAIL_QUALITY'] = 75
+app.config['THUMBNAIL_MAX_SOURCE'] = 32 * 1024 * 1024  # 超过此大小的图片不生成缩略图
+app.config['THUMBNAIL_WORKERS'] = 2  # 同时生成缩略图的线程数（解码图片占用CPU）
+app.config['THUMBNAIL_WAIT'] = 2  # 请求最多等待缩略图生成的秒数，超时返回503，生成在后台继续
+app.config['THUMBNAIL_EXTENSIONS'] = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
 
 # 默认配置信息
 DEFAULT_CONFIG = {
@@ -21,13 +120,495 @@ DEFAULT_CONFIG = {
     'secret_key': ''
 }
 
-def get_s3_client():
-    """初始化S3客户端"""
+# S3客户端池: (endpoint_url, access_key) -> {'client', 'secret_key', 'last_used'}
+# boto3 的底层客户端是线程安全的，同一组凭证在所有请求间共享，复用已建立的TLS连接
+_s3_clients = OrderedDict()
+_s3_clients_lock = threading.Lock()
+_s3_client_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+def _evict_idle_s3_clients(now):
+    """回收空闲超时的客户端（调用方需持有锁）"""
+    idle_timeout = app.config['S3_CLIENT_IDLE_TIMEOUT']
+    # OrderedDict 按最近使用排序，最旧的在最前面
+    while _s3_clients:
+        pool_key, entry = next(iter(_s3_clients.items()))
+        if now - entry['last_used'] < idle_timeout:
+            break
+        del _s3_clients[pool_key]
+        _s3_client_stats['evictions'] += 1
+
+def get_s3_client(config=None):
+    """获取S3客户端（按端点和Access Key复用），config 为空时使用当前session的配置"""
+    if config is None:
+        config = session.get('s3_config', DEFAULT_CONFIG)
+    pool_key = (config['endpoint_url'], config['access_key'])
+    now = time.monotonic()
+    
+    with _s3_clients_lock:
+        _evict_idle_s3_clients(now)
+        entry = _s3_clients.get(pool_key)
+        # Secret Key 变更时需要重建客户端
+        if entry is not None and entry['secret_key'] == config['secret_key']:
+            entry['last_used'] = now
+            _s3_clients.move_to_end(pool_key)
+            _s3_client_stats['hits'] += 1
+            return entry['client']
+        _s3_client_stats['misses'] += 1
+    
+    # 在锁外创建客户端，避免阻塞其他请求
+    client = boto3.client('s3',
+                          endpoint_url=config['endpoint_url'],
+                          aws_access_key_id=config['access_key'],
+                          aws_secret_access_key=config['secret_key'],
+                          config=Config(max_pool_connections=app.config['S3_MAX_POOL_CONNECTIONS']))
+    
+    with _s3_clients_lock:
+        _s3_clients[pool_key] = {
+            'client': client,
+            'secret_key': config['secret_key'],
+            'last_used': now
+        }
+        _s3_clients.move_to_end(pool_key)
+        while len(_s3_clients) > app.config['S3_CLIENT_CACHE_SIZE']:
+            _s3_clients.popitem(last=False)
+            _s3_client_stats['evictions'] += 1
+    return client
+
+def reset_s3_clients():
+    """丢弃从父进程继承的客户端（在 fork 出的 worker 中调用）
+
+    父进程中建立的TLS连接会被所有子进程共用同一个socket，必须在子进程里重建；
+    之后每个 worker 各自维护自己的连接池，在整个 worker 生命周期内复用。
+    """
+    global _s3_clients_lock
+    _s3_clients_lock = threading.Lock()
+    _s3_clients.clear()
+
+# 在模块里注册，gunicorn --preload、multiprocessing 等任何方式 fork 出的子进程都会执行，
+# 不依赖启动器传入 post_fork（Windows 没有 fork，也不需要）
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_s3_clients)
+
+def s3_client_stats():
+    """S3客户端池的命中统计"""
+    with _s3_clients_lock:
+        stats = dict(_s3_client_stats)
+        stats['size'] = len(_s3_clients)
+    total = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / total, 4) if total else 0.0
+    return stats
+
+class TTLCache:
+    """带过期时间和容量上限的线程安全LRU缓存"""
+    
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+    
+    def get(self, key):
+        """返回未过期的缓存值，不存在时返回None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry[1]
+    
+    def set(self, key, value, ttl=None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+    
+    def invalidate(self, predicate):
+        """删除所有键满足predicate的条目，返回删除数量"""
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                del self._entries[key]
+            self._stats['invalidations'] += len(stale)
+        return len(stale)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self):
+        """命中统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        total = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / total, 4) if total else 0.0
+        return stats
+
+def credential_identity(config=None):
+    """当前session的凭证标识 (access_key, secret_key摘要)
+
+    缓存S3返回的内容时必须把它放进键里：未配置凭证的session都落在 DEFAULT_CONFIG 的同一端点上，
+    只按端点区分会让其他人看到按别人凭证列出的内容。摘要只用于区分，不保存明文Secret Key。
+    """
+    if config is None:
+        config = session.get('s3_config', DEFAULT_CONFIG)
+    return config['access_key'], hashlib.sha256(config['secret_key'].encode('utf-8')).hexdigest()
+
+def parse_listing_page(page, current_prefix):
+    """把一页list_objects_v2结果转换为文件夹和文件列表"""
+    objects = []
+    folders = []
+    
+    # 处理文件夹
+    if 'CommonPrefixes' in page:
+        for prefix in page['CommonPrefixes']:
+            folders.append({
+                'name': prefix['Prefix'].replace(current_prefix, '').rstrip('/'),
+                'prefix': prefix['Prefix'],
+                'type': 'folder'
+            })
+    
+    # 处理文件
+    if 'Contents' in page:
+        for obj in page['Contents']:
+            # 跳过文件夹标记对象
+            if obj['Key'] == current_prefix:
+                continue
+                
+            objects.append({
+                'key': obj['Key'],
+                'name': obj['Key'].replace(current_prefix, ''),
+                'size': obj['Size'],
+                'last_modified': obj['LastModified'],
+                'etag': obj.get('ETag', '').strip('"'),
+                'type': 'file'
+            })
+    return folders, objects
+
+def listing_page_params(bucket_name, current_prefix, cursor, page_size):
+    """一页目录列表对应的list_objects_v2参数"""
+    params = {'Bucket': bucket_name, 'Prefix': current_prefix, 'Delimiter': '/', 'MaxKeys': page_size}
+    if cursor:
+        params['ContinuationToken'] = cursor
+    return params
+
+def listing_cache_key(config, bucket_name, current_prefix, cursor, page_size):
+    """目录列表缓存的键，前三项供 invalidate_listing 匹配"""
+    return (config['endpoint_url'], bucket_name, current_prefix, cursor, page_size) + credential_identity(config)
+
+def store_listing_page(cache_key, page, current_prefix):
+    """解析一页列表结果并写入缓存，cache_key 由 listing_cache_key 生成"""
+    folders, objects = parse_listing_page(page, current_prefix)
+    next_cursor = page.get('NextContinuationToken', '') if page.get('IsTruncated') else ''
+    
+    result = (folders, objects, next_cursor)
+    listing_cache.set(cache_key, result)
+    if next_cursor:
+        # 记录下一页的上一页游标，用于“上一页”导航
+        listing_cursor_history.set(cache_key[:3] + (next_cursor,) + cache_key[4:], cache_key[3])
+    return result
+
+def list_folder_page(s3, bucket_name, current_prefix, cursor='', page_size=None, use_cache=True):
+    """列出前缀下的一页文件夹和文件（单次S3请求），结果按端点、凭证、存储桶、前缀和游标缓存
+    
+    返回 (folders, objects, next_cursor)，next_cursor 为空表示已是最后一页
+    """
+    if page_size is None:
+        page_size = app.config['LIST_PAGE_SIZE']
     config = session.get('s3_config', DEFAULT_CONFIG)
-    return boto3.client('s3',
-                        endpoint_url=config['endpoint_url'],
-                        aws_access_key_id=config['access_key'],
-                        aws_secret_access_key=config['secret_key'])
+    cache_key = listing_cache_key(config, bucket_name, current_prefix, cursor, page_size)
+    if use_cache:
+        cached = listing_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    page = s3.list_objects_v2(**listing_page_params(bucket_name, current_prefix, cursor, page_size))
+    return store_listing_page(cache_key, page, current_prefix)
+
+def iter_folder_entries(s3, bucket_name, current_prefix):
+    """逐页列出前缀下的全部条目，每次请求下一页之前先产出刷新标记"""
+    paginator = s3.get_paginator('list_objects_v2')
+    pages = iter(paginator.paginate(Bucket=bucket_name, Prefix=current_prefix, Delimiter='/'))
+    while True:
+        # 让已渲染的行先发送给浏览器，再等待S3返回下一页
+        yield {'type': 'flush', 'marker': FLUSH_MARKER}
+        try:
+            page = next(pages)
+        except StopIteration:
+            return
+        except ClientError as e:
+            yield {'type': 'error', 'message': str(e)}
+            return
+        folders, objects = parse_listing_page(page, current_prefix)
+        yield from folders
+        yield from objects
+
+def previous_cursor(bucket_name, current_prefix, cursor, page_size, config=None):
+    """查找当前页的上一页游标，未知时返回None（回到第一页）"""
+    if config is None:
+        config = session.get('s3_config', DEFAULT_CONFIG)
+    return listing_cursor_history.get(listing_cache_key(config, bucket_name, current_prefix, cursor, page_size))
+
+def parse_bucket_args(args):
+    """解析存储桶页面的查询参数，返回 (prefix, cursor, page_number, page_size)"""
+    current_prefix = args.get('prefix', '')
+    cursor = args.get('cursor', '')
+    page_number = max(1, args.get('page', 1, type=int))
+    page_size = min(max(1, args.get('limit', app.config['LIST_PAGE_SIZE'], type=int)), 1000)
+    return current_prefix, cursor, page_number, page_size
+
+def build_breadcrumbs(current_prefix):
+    """生成面包屑导航: [(名称, 前缀)]"""
+    breadcrumbs = []
+    path = ''
+    for part in current_prefix.rstrip('/').split('/'):
+        if part:  # 跳过空部分
+            path += part + '/'
+            breadcrumbs.append((part, path))
+    return breadcrumbs
+
+def pagination_urls(bucket_name, current_prefix, cursor, next_cursor, page_number, page_size, config=None):
+    """生成分页导航链接，返回 (上一页, 下一页, 显示全部)"""
+    prev_url = next_url = all_url = ''
+    page_url = f'/bucket/{quote(bucket_name)}?prefix={quote(current_prefix)}&limit={page_size}'
+    if cursor:
+        prev = previous_cursor(bucket_name, current_prefix, cursor, page_size, config)
+        prev_url = f'{page_url}&cursor={quote(prev)}&page={page_number - 1}' if prev else page_url
+    if next_cursor:
+        next_url = f'{page_url}&cursor={quote(next_cursor)}&page={page_number + 1}'
+        all_url = f'/bucket/{quote(bucket_name)}?prefix={quote(current_prefix)}&all=1'
+    return prev_url, next_url, all_url
+
+def invalidate_listing(bucket_name, key, endpoint_url=None):
+    """写操作后清除受影响的目录列表和文件夹统计：key的所有上级目录以及key下的所有子目录
+
+    不区分凭证，其他用户缓存的同一目录也会被清除。
+    """
+    if endpoint_url is None:
+        endpoint_url = session.get('s3_config', DEFAULT_CONFIG)['endpoint_url']
+    
+    def affected(cache_key):
+        return (cache_key[0] == endpoint_url and cache_key[1] == bucket_name
+                and (key.startswith(cache_key[2]) or cache_key[2].startswith(key)))
+    
+    global _folder_stats_generation
+    _folder_stats_generation += 1
+    folder_stats_cache.invalidate(affected)
+    return listing_cache.invalidate(affected)
+
+class MetadataIndex:
+    """对象元数据的本地SQLite索引（键、大小、ETag、修改时间），用于在整个存储桶内快速搜索
+
+    通过后台任务全量扫描建立，之后由上传、创建文件夹和删除操作增量维护。
+    键的子串和通配符查询走FTS5 trigram索引（SQLite 3.34+），不可用时退回逐行匹配。
+    """
+    
+    GLOB_CHARS = '*?['
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self.fts = True
+    
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS objects (
+                    endpoint TEXT, bucket TEXT, key TEXT, size INTEGER, etag TEXT,
+                    last_modified REAL, scan_id INTEGER,
+                    PRIMARY KEY (endpoint, bucket, key));
+                CREATE TABLE IF NOT EXISTS buckets (
+                    endpoint TEXT, bucket TEXT, status TEXT, scan_id INTEGER,
+                    scanned_at REAL, object_count INTEGER,
+                    PRIMARY KEY (endpoint, bucket));
+            ''')
+            try:
+                conn.executescript('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS objects_fts USING fts5(
+                        key, content='objects', content_rowid='rowid', tokenize='trigram');
+                    CREATE TRIGGER IF NOT EXISTS objects_ai AFTER INSERT ON objects BEGIN
+                        INSERT INTO objects_fts (rowid, key) VALUES (new.rowid, new.key);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS objects_ad AFTER DELETE ON objects BEGIN
+                        INSERT INTO objects_fts (objects_fts, rowid, key) VALUES ('delete', old.rowid, old.key);
+                    END;
+                ''')
+            except sqlite3.OperationalError:
+                self.fts = False  # SQLite 未编译FTS5或版本过旧
+            self._local.conn = conn
+        return conn
+    
+    def status(self, endpoint_url, bucket_name):
+        """索引状态字典，尚未建立索引时返回None"""
+        row = self._connect().execute(
+            'SELECT status, scanned_at, object_count FROM buckets WHERE endpoint = ? AND bucket = ?',
+            (endpoint_url, bucket_name)).fetchone()
+        if row is None:
+            return None
+        return {'status': row[0], 'scanned_at': row[1], 'object_count': row[2]}
+    
+    def mark_queued(self, endpoint_url, bucket_name):
+        """登记即将扫描的存储桶，避免重复排队，并开始接收增量更新"""
+        self._connect().execute(
+            'INSERT INTO buckets VALUES (?, ?, ?, NULL, NULL, NULL) '
+            'ON CONFLICT (endpoint, bucket) DO UPDATE SET status = excluded.status',
+            (endpoint_url, bucket_name, 'queued'))
+    
+    def scan(self, job, s3, endpoint_url, bucket_name):
+        """全量扫描存储桶重建索引（作为后台任务执行）"""
+        try:
+            self._scan(job, s3, endpoint_url, bucket_name)
+        except Exception:
+            self._connect().execute('UPDATE buckets SET status = ? WHERE endpoint = ? AND bucket = ?',
+                                    ('failed', endpoint_url, bucket_name))
+            raise
+    
+    def _scan(self, job, s3, endpoint_url, bucket_name):
+        conn = self._connect()
+        scan_id = time.time_ns()
+        conn.execute('INSERT INTO buckets VALUES (?, ?, ?, ?, NULL, NULL) '
+                     'ON CONFLICT (endpoint, bucket) DO UPDATE SET status = excluded.status, scan_id = excluded.scan_id',
+                     (endpoint_url, bucket_name, 'scanning', scan_id))
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name):
+            if job['cancel_requested']:
+                # 保留已扫描的部分，标记为不完整，搜索结果可能缺少未扫描到的对象
+                conn.execute('UPDATE buckets SET status = ? WHERE endpoint = ? AND bucket = ?',
+                             ('partial', endpoint_url, bucket_name))
+                return
+            rows = [(endpoint_url, bucket_name, obj['Key'], obj['Size'], obj.get('ETag', '').strip('"'),
+                     obj['LastModified'].timestamp(), scan_id) for obj in page.get('Contents', [])]
+            # 每页一个事务，扫描期间搜索和增量更新不会被长时间阻塞
+            with conn:
+                conn.execute('BEGIN')
+                self._upsert(conn, rows)
+            job['done'] += len(rows)
+        with conn:
+            conn.execute('BEGIN')
+            # 本次扫描没有见到的对象已在别处被删除
+            conn.execute('DELETE FROM objects WHERE endpoint = ? AND bucket = ? AND scan_id != ?',
+                         (endpoint_url, bucket_name, scan_id))
+            count = conn.execute('SELECT COUNT(*) FROM objects WHERE endpoint = ? AND bucket = ?',
+                                 (endpoint_url, bucket_name)).fetchone()[0]
+            conn.execute('UPDATE buckets SET status = ?, scanned_at = ?, object_count = ? '
+                         'WHERE endpoint = ? AND bucket = ?',
+                         ('ready', time.time(), count, endpoint_url, bucket_name))
+    
+    def _upsert(self, conn, rows):
+        conn.executemany('INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?, ?) '
+                         'ON CONFLICT (endpoint, bucket, key) DO UPDATE SET size = excluded.size, '
+                         'etag = excluded.etag, last_modified = excluded.last_modified, scan_id = excluded.scan_id',
+                         rows)
+    
+    def put(self, endpoint_url, bucket_name, key, size, etag, last_modified):
+        """写入单个对象的元数据（只维护已建立索引的存储桶）"""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN')
+            row = conn.execute('SELECT scan_id FROM buckets WHERE endpoint = ? AND bucket = ?',
+                               (endpoint_url, bucket_name)).fetchone()
+            if row is None:
+                return
+            # 记为当前扫描的编号，扫描进行中上传的对象不会在扫描结束时被当作已删除清除
+            self._upsert(conn, [(endpoint_url, bucket_name, key, size, etag.strip('"'),
+                                 last_modified.timestamp(), row[0])])
+    
+    def remove(self, endpoint_url, bucket_name, keys):
+        """删除指定对象的元数据"""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN')
+            conn.executemany('DELETE FROM objects WHERE endpoint = ? AND bucket = ? AND key = ?',
+                             [(endpoint_url, bucket_name, key) for key in keys])
+    
+    def prefix_totals(self, endpoint_url, bucket_name, prefix):
+        """前缀下所有对象的总大小和数量（按主键范围扫描）"""
+        return self._connect().execute(
+            'SELECT COALESCE(SUM(size), 0), COUNT(*) FROM objects '
+            'WHERE endpoint = ? AND bucket = ? AND key >= ? AND key < ?',
+            (endpoint_url, bucket_name, prefix, prefix + '\U0010ffff')).fetchone()
+    
+    def search(self, endpoint_url, bucket_name, query, mode='substring', limit=200):
+        """按子串（不区分大小写）或通配符（* ? [...]，区分大小写）查找对象，结果按键排序"""
+        if mode == 'glob':
+            operator, pattern = 'GLOB', query
+            literal = max((len(part) for part in re.split(r'[*?]|\[[^\]]*\]', query)), default=0)
+        elif '%' in query or '_' in query:
+            # LIKE的通配符无法转义后使用索引，改用转义过的GLOB精确匹配
+            operator = 'GLOB'
+            pattern = '*' + ''.join(f'[{ch}]' if ch in self.GLOB_CHARS else ch for ch in query) + '*'
+            literal = len(query)
+        else:
+            operator, pattern, literal = 'LIKE', f'%{query}%', len(query)
+        
+        conn = self._connect()
+        if self.fts and literal >= 3:
+            # trigram索引需要至少3个连续的普通字符；先查FTS再回表（CROSS JOIN固定连接顺序），
+            # 不排序以便取够limit条就停止，扫描按键顺序写入，rowid顺序与键顺序基本一致
+            sql = (f'SELECT o.key, o.size, o.etag, o.last_modified FROM objects_fts f '
+                   f'CROSS JOIN objects o ON o.rowid = f.rowid '
+                   f'WHERE f.key {operator} ? AND o.endpoint = ? AND o.bucket = ? LIMIT ?')
+        else:
+            sql = (f'SELECT key, size, etag, last_modified FROM objects '
+                   f'WHERE endpoint = ? AND bucket = ? AND key {operator} ? LIMIT ?')
+        params = (pattern, endpoint_url, bucket_name, limit) if 'objects_fts' in sql else \
+                 (endpoint_url, bucket_name, pattern, limit)
+        rows = conn.execute(sql, params).fetchall()
+        return [
+            {'key': key, 'size': size, 'etag': etag, 'last_modified': datetime.fromtimestamp(last_modified)}
+            for key, size, etag, last_modified in sorted(rows)
+        ]
+
+def index_object(s3, bucket_name, key, endpoint_url=None):
+    """上传或创建后把对象的最新元数据写入索引（存储桶未建立索引时不产生S3请求）"""
+    if endpoint_url is None:
+        endpoint_url = session.get('s3_config', DEFAULT_CONFIG)['endpoint_url']
+    if metadata_index.status(endpoint_url, bucket_name) is None:
+        return
+    try:
+        head = s3.head_object(Bucket=bucket_name, Key=key)
+        metadata_index.put(endpoint_url, bucket_name, key, head['ContentLength'],
+                           head.get('ETag', ''), head['LastModified'])
+    except ClientError:
+        pass  # 索引只是加速搜索，失败时等下次重建
+
+def unindex_objects(bucket_name, keys, endpoint_url=None):
+    """删除对象后同步移除索引记录"""
+    if endpoint_url is None:
+        endpoint_url = session.get('s3_config', DEFAULT_CONFIG)['endpoint_url']
+    if keys:
+        metadata_index.remove(endpoint_url, bucket_name, keys)
+
+def get_transfer_config(max_concurrency=None):
+    """按部署配置生成分片上传参数，max_concurrency 为空时使用 UPLOAD_MAX_CONCURRENCY"""
+    return TransferConfig(multipart_threshold=app.config['UPLOAD_MULTIPART_THRESHOLD'],
+                          multipart_chunksize=app.config['UPLOAD_PART_SIZE'],
+                          max_concurrency=max_concurrency or app.config['UPLOAD_MAX_CONCURRENCY'],
+                          use_threads=True)
+
+def upload_stream(s3, fileobj, bucket_name, key, content_type=None, max_concurrency=None):
+    """使用分片并行上传文件对象
+
+    失败时 s3transfer 会中止它自己发起的分片上传；这里不能按键清理，
+    同一个键可能正有其他用户或标签页在上传。
+    """
+    extra_args = {'ContentType': content_type} if content_type else None
+    s3.upload_fileobj(fileobj, bucket_name, key, ExtraArgs=extra_args,
+                      Config=get_transfer_config(max_concurrency))
 
 # HTML模板
 HTML_TEMPLATE = '''
@@ -178,6 +759,15 @@ HTML_TEMPLATE = '''
             color: #f39c12;
         }
         
+        .thumbnail {
+            width: 48px;
+            height: 48px;
+            object-fit: cover;
+            border-radius: 4px;
+            margin-right: 10px;
+            background-color: #f1f3f5;
+        }
+        
         .file-actions {
             display: flex;
             gap: 10px;
@@ -237,14 +827,12 @@ HTML_TEMPLATE = '''
 
     <div class="container mt-4">
         <!-- 消息提示 -->
-        {% if messages %}
-            {% for message in messages %}
-                <div class="alert alert-info alert-dismissible fade show">
-                    {{ message }}
-                    <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
-                </div>
-            {% endfor %}
-        {% endif %}
+        {% for message in messages %}
+            <div class="alert alert-info alert-dismissible fade show">
+                {{ message }}
+                <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
+            </div>
+        {% endfor %}
 
         <!-- 配置面板 -->
         <div class="config-panel">
@@ -265,7 +853,7 @@ HTML_TEMPLATE = '''
         </div>
 
         <!-- 内容区域 -->
-        {{ content|safe }}
+        {% block content %}{% endblock %}
     </div>
 
     <!-- 配置模态框 -->
@@ -302,35 +890,459 @@ HTML_TEMPLATE = '''
 
     <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
     <script>
-        // 显示上传进度
+        // 上传表单：默认经服务器分片上传，开启直传时由浏览器直接上传到S3
         document.addEventListener('DOMContentLoaded', function() {
-            const fileInput = document.querySelector('input[type="file"]');
-            if (fileInput) {
-                fileInput.addEventListener('change', function() {
-                    const file = this.files[0];
-                    if (file) {
-                        const statusDiv = document.getElementById('upload-status');
-                        const progressBar = document.getElementById('upload-progress');
-                        
-                        statusDiv.style.display = 'block';
-                        progressBar.style.width = '0%';
-                        progressBar.textContent = '0%';
-                        
-                        // 模拟上传进度（实际应用中应使用XMLHttpRequest或Fetch API）
-                        let progress = 0;
-                        const interval = setInterval(() => {
-                            progress += 5;
-                            progressBar.style.width = progress + '%';
-                            progressBar.textContent = progress + '%';
-                            
-                            if (progress >= 100) {
-                                clearInterval(interval);
-                                progressBar.textContent = '上传完成';
-                            }
-                        }, 100);
+            const uploadForm = document.getElementById('uploadForm');
+            if (uploadForm) {
+                uploadForm.addEventListener('submit', function(event) {
+                    event.preventDefault();
+                    const files = Array.from(uploadForm.elements['file'].files)
+                        .concat(Array.from(uploadForm.elements['folder'].files));
+                    if (files.length === 0) {
+                        alert('请选择文件或文件夹');
+                    } else if (files.length > 1 || uploadForm.elements['folder'].files.length) {
+                        batchUpload(uploadForm, files);
+                    } else if (uploadForm.dataset.direct === '1') {
+                        directUpload(uploadForm);
+                    } else {
+                        chunkedUpload(uploadForm);
+                    }
+                });
+            }
+        });
+        
+        // 更新上传进度条
+        function setUploadProgress(loaded, total) {
+            const statusDiv = document.getElementById('upload-status');
+            const progressBar = document.getElementById('upload-progress');
+            const percent = total ? Math.floor(loaded * 100 / total) : 100;
+            statusDiv.style.display = 'block';
+            progressBar.style.width = percent + '%';
+            progressBar.textContent = percent + '%';
+        }
+        
+        // 以XMLHttpRequest发送请求，便于获取上传进度
+        function sendWithProgress(method, url, body, onProgress) {
+            return new Promise(function(resolve, reject) {
+                const xhr = new XMLHttpRequest();
+                xhr.open(method, url);
+                xhr.upload.onprogress = function(event) {
+                    if (event.lengthComputable) {
+                        onProgress(event.loaded);
+                    }
+                };
+                xhr.onload = function() {
+                    if (xhr.status >= 200 && xhr.status < 300) {
+                        resolve(xhr);
+                    } else {
+                        reject(new Error('HTTP ' + xhr.status));
+                    }
+                };
+                xhr.onerror = function() {
+                    reject(new Error('网络错误'));
+                };
+                xhr.send(body);
+            });
+        }
+        
+        // 批量上传：按大小和数量把文件分成若干请求依次发送，每个请求内由服务器并行传往S3
+        function batchUpload(form, files) {
+            const bucket = {{ bucket_name|tojson }};
+            const prefix = form.elements['prefix'].value;
+            const maxBytes = {{ upload_batch_max_bytes|tojson }};
+            const maxFiles = {{ upload_batch_max_files|tojson }};
+            const totalBytes = files.reduce((sum, file) => sum + file.size, 0);
+            const batches = [];
+            let current = [], currentBytes = 0;
+            files.forEach(file => {
+                if (current.length && (currentBytes + file.size > maxBytes || current.length >= maxFiles)) {
+                    batches.push(current);
+                    current = [];
+                    currentBytes = 0;
+                }
+                current.push(file);
+                currentBytes += file.size;
+            });
+            batches.push(current);
+            
+            const result = {uploaded: 0, failed: [], bytes: 0, seconds: 0};
+            let sentBytes = 0;
+            setUploadProgress(0, totalBytes);
+            const sendBatch = index => {
+                if (index >= batches.length) {
+                    return Promise.resolve();
+                }
+                const batch = batches[index];
+                const batchBytes = batch.reduce((sum, file) => sum + file.size, 0);
+                const formData = new FormData();
+                formData.append('prefix', prefix);
+                batch.forEach(file => {
+                    formData.append('files', file);
+                    // 选择文件夹时 webkitRelativePath 包含文件夹名，例如 音乐/01.mp3
+                    formData.append('paths', file.webkitRelativePath || file.name);
+                });
+                return sendWithProgress('POST', '/upload/' + bucket + '/batch', formData,
+                                        loaded => setUploadProgress(sentBytes + Math.min(loaded, batchBytes), totalBytes))
+                    .catch(error => error)
+                    .then(xhr => {
+                        const summary = xhr instanceof Error ? null : JSON.parse(xhr.responseText);
+                        if (summary) {
+                            result.uploaded += summary.uploaded.length;
+                            result.failed = result.failed.concat(summary.failed);
+                            result.bytes += summary.bytes;
+                            result.seconds += summary.seconds;
+                        } else {
+                            batch.forEach(file => result.failed.push({path: file.webkitRelativePath || file.name, message: xhr.message}));
+                        }
+                        sentBytes += batchBytes;
+                        setUploadProgress(sentBytes, totalBytes);
+                        return sendBatch(index + 1);
+                    });
+            };
+            
+            sendBatch(0).then(() => {
+                const speed = result.seconds ? (result.bytes / 1048576 / result.seconds).toFixed(1) + ' MB/s' : '';
+                const status = document.getElementById('upload-summary');
+                status.textContent = '上传完成 ' + result.uploaded + ' 个文件，失败 ' + result.failed.length + ' 个' + (speed ? '，服务器写入 ' + speed : '');
+                result.failed.slice(0, 20).forEach(item => {
+                    const line = document.createElement('div');
+                    line.className = 'small text-danger';
+                    line.textContent = item.path + ': ' + item.message;
+                    status.appendChild(line);
+                });
+                if (!result.failed.length) {
+                    window.location.href = '/bucket/' + bucket + '?prefix=' + encodeURIComponent(prefix);
+                }
+            });
+        }
+        
+        // 浏览器直传：小文件使用预签名POST，大文件并行上传预签名分片
+        function directUpload(form) {
+            const file = form.elements['file'].files[0];
+            if (!file) {
+                return;
+            }
+            const bucket = {{ bucket_name|tojson }};
+            const prefix = form.elements['prefix'].value;
+            const formData = new FormData();
+            formData.append('filename', file.name);
+            formData.append('prefix', prefix);
+            formData.append('size', file.size);
+            formData.append('content_type', file.type || 'application/octet-stream');
+            setUploadProgress(0, file.size);
+            
+            fetch('/direct-upload/' + bucket + '/init', {
+                method: 'POST',
+                body: formData
+            })
+            .then(response => response.json())
+            .then(plan => {
+                if (!plan.success) {
+                    throw new Error(plan.message);
+                }
+                if (plan.mode === 'post') {
+                    const postData = new FormData();
+                    Object.keys(plan.fields).forEach(name => postData.append(name, plan.fields[name]));
+                    postData.append('file', file);
+                    return sendWithProgress('POST', plan.url, postData, loaded => setUploadProgress(loaded, file.size));
+                }
+                return uploadParts(bucket, file, plan);
+            })
+            .then(() => {
+                setUploadProgress(file.size, file.size);
+                window.location.href = '/bucket/' + bucket + '?prefix=' + encodeURIComponent(prefix) + '&refresh=1';
+            })
+            .catch(error => {
+                alert('上传失败: ' + error.message);
+            });
+        }
+        
+        // 按计划并行上传分片，全部完成后通知服务器合并
+        function uploadParts(bucket, file, plan) {
+            const loaded = new Array(plan.urls.length).fill(0);
+            const etags = new Array(plan.urls.length);
+            let next = 0;
+            
+            function worker() {
+                if (next >= plan.urls.length) {
+                    return Promise.resolve();
+                }
+                const index = next++;
+                const chunk = file.slice(index * plan.part_size, (index + 1) * plan.part_size);
+                return sendWithProgress('PUT', plan.urls[index], chunk, partLoaded => {
+                    loaded[index] = partLoaded;
+                    setUploadProgress(loaded.reduce((a, b) => a + b, 0), file.size);
+                }).then(xhr => {
+                    etags[index] = xhr.getResponseHeader('ETag');
+                    if (!etags[index]) {
+                        throw new Error('无法读取分片ETag，请检查存储桶CORS配置');
+                    }
+                    loaded[index] = chunk.size;
+                    return worker();
+                });
+            }
+            
+            const workers = [];
+            for (let i = 0; i < Math.min(plan.concurrency, plan.urls.length); i++) {
+                workers.push(worker());
+            }
+            const body = {key: plan.key, upload_id: plan.upload_id};
+            return Promise.all(workers).then(() => {
+                body.parts = etags.map((etag, index) => ({PartNumber: index + 1, ETag: etag}));
+                return fetch('/direct-upload/' + bucket + '/complete', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify(body)
+                });
+            })
+            .then(response => response.json())
+            .then(result => {
+                if (!result.success) {
+                    throw new Error(result.message);
+                }
+            })
+            .catch(error => {
+                fetch('/direct-upload/' + bucket + '/abort', {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify(body)
+                });
+                throw error;
+            });
+        }
+        
+        // 分片上传：进度记录在localStorage中，断网或刷新后重新选择同一文件即可续传
+        function chunkedUpload(form) {
+            const file = form.elements['file'].files[0];
+            if (!file) {
+                return;
+            }
+            const bucket = {{ bucket_name|tojson }};
+            const prefix = form.elements['prefix'].value;
+            const partSize = {{ upload_part_size|tojson }};
+            const done = () => {
+                setUploadProgress(file.size, file.size);
+                window.location.href = '/bucket/' + bucket + '?prefix=' + encodeURIComponent(prefix);
+            };
+            setUploadProgress(0, file.size);
+            
+            // 小文件直接整表单提交，同样显示真实进度
+            if (file.size <= partSize) {
+                sendWithProgress('POST', form.action, new FormData(form), loaded => setUploadProgress(loaded, file.size))
+                    .then(done)
+                    .catch(error => alert('上传失败: ' + error.message));
+                return;
+            }
+            
+            const storageKey = ['upload', bucket, prefix, file.name, file.size, file.lastModified].join(':');
+            const saved = JSON.parse(localStorage.getItem(storageKey) || 'null');
+            const resume = saved
+                ? fetch('/upload/' + bucket + '/status?token=' + encodeURIComponent(saved.token || ''))
+                    .then(response => response.json())
+                    .then(status => status.success ? Object.assign(saved, {parts: status.parts}) : null)
+                : Promise.resolve(null);
+            
+            resume.then(session => {
+                if (session) {
+                    return session;
+                }
+                const formData = new FormData();
+                formData.append('filename', file.name);
+                formData.append('prefix', prefix);
+                formData.append('size', file.size);
+                formData.append('content_type', file.type || 'application/octet-stream');
+                return fetch('/upload/' + bucket + '/init', {method: 'POST', body: formData})
+                    .then(response => response.json())
+                    .then(result => {
+                        if (!result.success) {
+                            throw new Error(result.message);
+                        }
+                        const created = {key: result.key, upload_id: result.upload_id, part_size: result.part_size,
+                                         token: result.token, parts: []};
+                        localStorage.setItem(storageKey, JSON.stringify(created));
+                        return created;
+                    });
+            })
+            .then(session => uploadChunks(bucket, file, session))
+            .then(session => fetch('/upload/' + bucket + '/complete', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({token: session.token})
+            }))
+            .then(response => response.json())
+            .then(result => {
+                if (!result.success) {
+                    throw new Error(result.message);
+                }
+                localStorage.removeItem(storageKey);
+                done();
+            })
+            .catch(error => {
+                alert('上传中断: ' + error.message + '\\n重新选择同一文件上传即可从断点继续');
+            });
+        }
+        
+        // 只上传服务器上尚未完成的分片，失败的分片最多重试3次
+        function uploadChunks(bucket, file, session) {
+            const partCount = Math.ceil(file.size / session.part_size);
+            const finished = {};
+            session.parts.forEach(part => {
+                const expected = Math.min(session.part_size, file.size - (part.PartNumber - 1) * session.part_size);
+                if (part.Size === expected) {
+                    finished[part.PartNumber] = part.Size;
+                }
+            });
+            const pending = [];
+            for (let number = 1; number <= partCount; number++) {
+                if (!(number in finished)) {
+                    pending.push(number);
+                }
+            }
+            const inflight = {};
+            const report = () => {
+                const total = Object.values(finished).reduce((a, b) => a + b, 0)
+                    + Object.values(inflight).reduce((a, b) => a + b, 0);
+                setUploadProgress(total, file.size);
+            };
+            report();
+            
+            function sendPart(number, attempt) {
+                const chunk = file.slice((number - 1) * session.part_size, number * session.part_size);
+                const url = '/upload/' + bucket + '/part?token=' + encodeURIComponent(session.token)
+                    + '&part_number=' + number;
+                return sendWithProgress('PUT', url, chunk, loaded => {
+                    inflight[number] = loaded;
+                    report();
+                }).then(() => {
+                    delete inflight[number];
+                    finished[number] = chunk.size;
+                    report();
+                }, error => {
+                    delete inflight[number];
+                    if (attempt >= 3) {
+                        throw error;
                     }
+                    return new Promise(resolve => setTimeout(resolve, 1000 * attempt))
+                        .then(() => sendPart(number, attempt + 1));
+                });
+            }
+            
+            function worker() {
+                const number = pending.shift();
+                return number === undefined ? Promise.resolve() : sendPart(number, 1).then(worker);
+            }
+            
+            const workers = [];
+            for (let i = 0; i < 3; i++) {
+                workers.push(worker());
+            }
+            return Promise.all(workers).then(() => session);
+        }
+        
+        // 缩略图仍在生成时服务器返回503，隔几秒重试，多次失败后显示普通文件图标
+        function thumbnailFailed(img) {
+            const attempt = Number(img.dataset.retry || 0) + 1;
+            if (attempt > 3) {
+                img.nextElementSibling.hidden = false;
+                img.remove();
+                return;
+            }
+            img.dataset.retry = attempt;
+            setTimeout(() => {
+                img.src = img.src.replace(/&retry=\\d+$/, '') + '&retry=' + attempt;
+            }, 2000 * attempt);
+        }
+        
+        // 文件夹大小在后台统计，页面先显示，结果陆续填入
+        function formatFileSize(size) {
+            if (size > 1024 * 1024) {
+                return (size / (1024 * 1024)).toFixed(2) + ' MB';
+            }
+            if (size > 1024) {
+                return (size / 1024).toFixed(2) + ' KB';
+            }
+            return size + ' B';
+        }
+        
+        document.addEventListener('DOMContentLoaded', function() {
+            const cells = {};
+            document.querySelectorAll('.folder-stats[data-prefix]').forEach(cell => {
+                cells[cell.dataset.prefix] = cell;
+            });
+            let waiting = Object.keys(cells);
+            let rounds = 0;
+            const poll = function() {
+                if (!waiting.length || rounds++ > 300) {
+                    return;
+                }
+                const batches = [];
+                for (let i = 0; i < waiting.length; i += 100) {
+                    batches.push(waiting.slice(i, i + 100));
+                }
+                Promise.all(batches.map(batch => {
+                    const query = batch.map(prefix => 'prefix=' + encodeURIComponent(prefix)).join('&');
+                    return fetch('/api/buckets/' + encodeURIComponent({{ bucket_name|tojson }}) + '/folder-stats?' + query)
+                        .then(response => response.json());
+                }))
+                .then(results => {
+                    waiting = [];
+                    results.forEach(result => {
+                        if (!result.success) {
+                            return;
+                        }
+                        Object.keys(result.stats).forEach(prefix => {
+                            const stats = result.stats[prefix];
+                            cells[prefix].textContent = formatFileSize(stats.size) + ' - ' + stats.count + ' 个对象';
+                        });
+                        waiting = waiting.concat(result.pending);
+                    });
+                    setTimeout(poll, Math.min(1000 + rounds * 200, 5000));
                 });
+            };
+            poll();
+        });
+        
+        // 轮询后台任务进度
+        document.addEventListener('DOMContentLoaded', function() {
+            const jobStatus = document.getElementById('jobStatus');
+            if (!jobStatus) {
+                return;
             }
+            const jobText = document.getElementById('jobText');
+            const poll = function() {
+                fetch('/jobs/' + jobStatus.dataset.jobId)
+                    .then(response => response.json())
+                    .then(job => {
+                        if (!job.success) {
+                            jobText.textContent = job.message;
+                            return;
+                        }
+                        const label = {queued: '排队中', running: '进行中', finished: '已完成', failed: '失败', cancelled: '已取消'}[job.status];
+                        jobText.textContent = job.description + '（' + label + '）: 已完成 ' + job.done + ' 个，失败 ' + job.failed + ' 个';
+                        if (job.status === 'queued' || job.status === 'running') {
+                            setTimeout(poll, 1000);
+                            return;
+                        }
+                        jobStatus.querySelector('.progress').remove();
+                        document.getElementById('jobCancel').remove();
+                        jobStatus.className = 'alert ' + ({finished: 'alert-success', cancelled: 'alert-warning'}[job.status] || 'alert-danger');
+                        const details = job.errors.slice(0, 20).map(error => error.key + ' ' + error.code + ' ' + error.message);
+                        if (job.message) {
+                            details.unshift(job.message);
+                        }
+                        details.forEach(line => {
+                            const item = document.createElement('div');
+                            item.className = 'small';
+                            item.textContent = line;
+                            jobStatus.appendChild(item);
+                        });
+                    });
+            };
+            poll();
+            document.getElementById('jobCancel').addEventListener('click', function() {
+                this.disabled = true;
+                fetch('/jobs/' + jobStatus.dataset.jobId + '/cancel', {method: 'POST'});
+            });
         });
         
         // 复制文本到剪贴板
@@ -348,7 +1360,7 @@ HTML_TEMPLATE = '''
             if (folderName) {
                 // 确保文件夹名称以斜杠结尾
                 const folderPath = folderName.endsWith('/') ? folderName : folderName + '/';
-                window.location.href = '/create-folder/{{ bucket_name }}?prefix={{ current_prefix }}&folder_name=' + encodeURIComponent(folderPath);
+                window.location.href = '/create-folder/' + {{ bucket_name|tojson }} + '?prefix=' + encodeURIComponent({{ current_prefix|tojson }}) + '&folder_name=' + encodeURIComponent(folderPath);
             }
         }
         
@@ -373,8 +1385,10 @@ HTML_TEMPLATE = '''
             formData.append('key', document.getElementById('shareKey').value);
             formData.append('expires_in', form.elements['expires_in'].value);
             formData.append('expires_unit', form.elements['expires_unit'].value);
+            formData.append('byte_limit_mb', form.elements['byte_limit_mb'].value);
+            formData.append('max_downloads', form.elements['max_downloads'].value);
             
-            fetch('/generate-share-url/{{ bucket_name }}', {
+            fetch('/generate-share-url/' + {{ bucket_name|tojson }}, {
                 method: 'POST',
                 body: formData
             })
@@ -405,46 +1419,11 @@ HTML_TEMPLATE = '''
 </html>
 '''
 
-def render_template(content, messages=None, config=None, bucket_name=None, current_prefix=''):
-    """渲染模板的辅助函数"""
-    if messages is None:
-        messages = []
-    if config is None:
-        config = session.get('s3_config', DEFAULT_CONFIG)
-    
-    # 将消息列表转换为HTML
-    messages_html = ""
-    for message in messages:
-        messages_html += f'<div class="alert alert-info alert-dismissible fade show">{message}<button type="button" class="btn-close" data-bs-dismiss="alert"></button></div>'
-    
-    # 替换模板中的占位符
-    html = HTML_TEMPLATE.replace('{% if messages %}', '<!-- messages start -->')
-    html = html.replace('{% endfor %}', '<!-- messages end -->')
-    html = html.replace('<!-- messages start --><!-- messages end -->', messages_html)
-    html = html.replace('{{ content|safe }}', content)
-    html = html.replace('{{ config.endpoint_url }}', config.get('endpoint_url', ''))
-    html = html.replace('{{ config.access_key }}', config.get('access_key', ''))
-    html = html.replace('{{ config.secret_key }}', config.get('secret_key', ''))
-    
-    if bucket_name:
-        html = html.replace('{{ bucket_name }}', bucket_name)
-    else:
-        html = html.replace('{{ bucket_name }}', '')
-        
-    html = html.replace('{{ current_prefix }}', current_prefix)
-    
-    return html
-
-# 路由定义
-@app.route('/')
-def index():
-    messages = []
-    config = session.get('s3_config', DEFAULT_CONFIG)
-    
-    # 检查是否已配置
-    if not config.get('access_key') or not config.get('secret_key'):
-        messages.append("请先配置API连接信息")
-        config_html = '''
+# 首页模板
+INDEX_TEMPLATE = '''
+{% extends "layout.html" %}
+{% block content %}
+{% if not configured %}
         <div class="card">
             <div class="card-header">欢迎使用雨云对象存储管理</div>
             <div class="card-body">
@@ -455,157 +1434,71 @@ def index():
                 </button>
             </div>
         </div>
-        '''
-        return render_template(config_html, messages=messages, config=config)
-    
-    try:
-        s3 = get_s3_client()
-        response = s3.list_buckets()
-        buckets = [bucket['Name'] for bucket in response['Buckets']]
-        
-        # 生成存储桶列表HTML
-        buckets_html = '''
+{% elif error_msg %}
+        <div class="card">
+            <div class="card-header">连接错误</div>
+            <div class="card-body">
+                <div class="alert alert-danger">
+                    <h5><i class="bi bi-exclamation-triangle"></i> 无法连接到对象存储服务</h5>
+                    <p>错误信息: {{ error_msg }}</p>
+                    <p>请检查您的API配置是否正确，或者点击右上角的"配置"按钮修改连接信息。</p>
+                </div>
+            </div>
+        </div>
+{% else %}
         <div class="card">
             <div class="card-header">
                 <h4><i class="bi bi-collection"></i> 存储桶列表</h4>
             </div>
             <div class="card-body">
-        '''
-        
-        if buckets:
-            buckets_html += '<div class="row">'
-            for bucket in buckets:
-                buckets_html += f'''
+            {% if buckets %}
+                <div class="row">
+                {% for bucket in buckets %}
                 <div class="col-md-4 mb-3">
                     <div class="card h-100">
                         <div class="card-body text-center">
                             <i class="bi bi-bucket-fill" style="font-size: 2rem; color: #3498db;"></i>
-                            <h5 class="card-title mt-2">{bucket}</h5>
-                            <a href="/bucket/{bucket}" class="btn btn-primary mt-2">
+                            <h5 class="card-title mt-2">{{ bucket }}</h5>
+                            <a href="/bucket/{{ bucket|urlencode }}" class="btn btn-primary mt-2">
                                 <i class="bi bi-folder2-open"></i> 浏览内容
                             </a>
                         </div>
                     </div>
                 </div>
-                '''
-            buckets_html += '</div>'
-        else:
-            buckets_html += '''
+                {% endfor %}
+                </div>
+            {% else %}
             <div class="text-center py-4">
                 <i class="bi bi-inbox" style="font-size: 3rem; color: #6c757d;"></i>
                 <p class="mt-3 text-muted">没有找到存储桶</p>
             </div>
-            '''
-            
-        buckets_html += '</div></div>'
-        
-        return render_template(buckets_html, messages=messages, config=config)
-    except ClientError as e:
-        error_msg = f"连接错误: {str(e)}"
-        messages.append(error_msg)
-        error_html = f'''
-        <div class="card">
-            <div class="card-header">连接错误</div>
-            <div class="card-body">
-                <div class="alert alert-danger">
-                    <h5><i class="bi bi-exclamation-triangle"></i> 无法连接到对象存储服务</h5>
-                    <p>错误信息: {error_msg}</p>
-                    <p>请检查您的API配置是否正确，或者点击右上角的"配置"按钮修改连接信息。</p>
-                </div>
+            {% endif %}
             </div>
         </div>
-        '''
-        return render_template(error_html, messages=messages, config=config)
-
-@app.route('/configure', methods=['POST'])
-def configure():
-    """保存API配置"""
-    endpoint_url = request.form.get('endpoint_url', '').strip()
-    access_key = request.form.get('access_key', '').strip()
-    secret_key = request.form.get('secret_key', '').strip()
-    
-    if not endpoint_url or not access_key or not secret_key:
-        flash("所有字段都必须填写")
-        return redirect('/')
-    
-    # 保存配置到session
-    session['s3_config'] = {
-        'endpoint_url': endpoint_url,
-        'access_key': access_key,
-        'secret_key': secret_key
-    }
-    
-    flash("API配置已保存")
-    return redirect('/')
+{% endif %}
+{% endblock %}
+'''
 
-@app.route('/bucket/<bucket_name>')
-def bucket_contents(bucket_name):
-    messages = []
-    config = session.get('s3_config', DEFAULT_CONFIG)
-    current_prefix = request.args.get('prefix', '')
-    
-    try:
-        s3 = get_s3_client()
-        
-        # 获取文件列表
-        objects = []
-        folders = []
-        
-        try:
-            # 列出对象
-            paginator = s3.get_paginator('list_objects_v2')
-            for page in paginator.paginate(Bucket=bucket_name, Prefix=current_prefix, Delimiter='/'):
-                # 处理文件夹
-                if 'CommonPrefixes' in page:
-                    for prefix in page['CommonPrefixes']:
-                        folders.append({
-                            'name': prefix['Prefix'].replace(current_prefix, '').rstrip('/'),
-                            'prefix': prefix['Prefix'],
-                            'type': 'folder'
-                        })
-                
-                # 处理文件
-                if 'Contents' in page:
-                    for obj in page['Contents']:
-                        # 跳过文件夹标记对象
-                        if obj['Key'] == current_prefix:
-                            continue
-                            
-                        objects.append({
-                            'key': obj['Key'],
-                            'name': obj['Key'].replace(current_prefix, ''),
-                            'size': obj['Size'],
-                            'last_modified': obj['LastModified'],
-                            'type': 'file'
-                        })
-        except ClientError as e:
-            messages.append(f"无法列出文件: {str(e)}")
-        
-        # 生成面包屑导航
-        breadcrumb_html = '<nav aria-label="breadcrumb"><ol class="breadcrumb">'
-        breadcrumb_html += f'<li class="breadcrumb-item"><a href="/bucket/{bucket_name}">根目录</a></li>'
-        
-        if current_prefix:
-            parts = current_prefix.rstrip('/').split('/')
-            path = ''
-            for i, part in enumerate(parts):
-                if part:  # 跳过空部分
-                    path += part + '/'
-                    if i == len(parts) - 1:
-                        breadcrumb_html += f'<li class="breadcrumb-item active" aria-current="page">{part}</li>'
-                    else:
-                        breadcrumb_html += f'<li class="breadcrumb-item"><a href="/bucket/{bucket_name}?prefix={path}">{part}</a></li>'
-        
-        breadcrumb_html += '</ol></nav>'
+# 存储桶内容模板
+BUCKET_TEMPLATE = '''
+{% extends "layout.html" %}
+{% block content %}
+        <nav aria-label="breadcrumb">
+            <ol class="breadcrumb">
+                <li class="breadcrumb-item"><a href="/bucket/{{ bucket_name|urlencode }}">根目录</a></li>
+                {% for part, path in breadcrumbs %}
+                {% if loop.last %}
+                <li class="breadcrumb-item active" aria-current="page">{{ part }}</li>
+                {% else %}
+                <li class="breadcrumb-item"><a href="/bucket/{{ bucket_name|urlencode }}?prefix={{ path|urlencode }}">{{ part }}</a></li>
+                {% endif %}
+                {% endfor %}
+            </ol>
+        </nav>
         
-        # 生成文件列表HTML
-        content_html = breadcrumb_html
+        <div class="current-folder"><i class="bi bi-folder-fill"></i> 当前路径: {{ current_prefix or "根目录" }}</div>
         
-        # 当前路径显示
-        content_html += f'<div class="current-folder"><i class="bi bi-folder-fill"></i> 当前路径: {current_prefix or "根目录"}</div>'
-        
-        # 操作按钮
-        content_html += '''
+        <!-- 操作按钮 -->
         <div class="d-flex gap-2 mb-3">
             <button class="btn btn-success" data-bs-toggle="modal" data-bs-target="#uploadModal">
                 <i class="bi bi-upload"></i> 上传文件
@@ -613,81 +1506,108 @@ def bucket_contents(bucket_name):
             <button class="btn btn-primary" onclick="createFolder()">
                 <i class="bi bi-folder-plus"></i> 创建文件夹
             </button>
+            <form class="d-flex gap-2 ms-auto" action="/search/{{ bucket_name|urlencode }}" method="get">
+                <input type="search" class="form-control" name="q" placeholder="搜索整个存储桶" required>
+                <select class="form-select w-auto" name="mode">
+                    <option value="substring">包含</option>
+                    <option value="glob">通配符</option>
+                </select>
+                <button type="submit" class="btn btn-outline-secondary"><i class="bi bi-search"></i></button>
+            </form>
         </div>
-        '''
         
-        # 文件和文件夹列表
-        if folders or objects:
-            content_html += '<div class="card"><div class="card-body p-0">'
-            
-            # 显示文件夹
-            for folder in folders:
-                content_html += f'''
+        {% include "job_status.html" %}
+        
+        <div class="card"><div class="card-body p-0">
+            {% set listed = namespace(rows=0) %}
+            {% for entry in entries %}
+            {% if entry.type == 'folder' %}
+                {% set listed.rows = listed.rows + 1 %}
                 <div class="file-item">
                     <div>
                         <i class="bi bi-folder-fill folder-icon"></i>
-                        <a href="/bucket/{bucket_name}?prefix={folder['prefix']}">{folder['name']}</a>
+                        <a href="/bucket/{{ bucket_name|urlencode }}?prefix={{ entry.prefix|urlencode }}">{{ entry.name }}</a>
+                        <small class="text-muted d-block mt-1 folder-stats" data-prefix="{{ entry.prefix }}">统计中...</small>
                     </div>
                     <div class="file-actions">
+                        <a href="/download-folder/{{ bucket_name|urlencode }}/{{ entry.prefix|urlencode }}" class="btn btn-outline-primary btn-sm" title="打包下载">
+                            <i class="bi bi-file-earmark-zip"></i>
+                        </a>
                         <button class="btn btn-outline-info btn-sm" data-bs-toggle="modal" data-bs-target="#shareModal" 
-                                data-key="{folder['prefix']}" data-filename="{folder['name']}">
+                                data-key="{{ entry.prefix }}" data-filename="{{ entry.name }}">
                             <i class="bi bi-share"></i>
                         </button>
-                        <a href="/delete/{bucket_name}/{folder['prefix']}" class="btn btn-outline-danger btn-sm" 
-                           onclick="return confirm('确定要删除文件夹 {folder['name']} 吗？注意：这将删除文件夹中的所有内容！')">
+                        <a href="/delete/{{ bucket_name|urlencode }}/{{ entry.prefix|urlencode }}" class="btn btn-outline-danger btn-sm" 
+                           data-confirm="确定要删除文件夹 {{ entry.name }} 吗？注意：这将删除文件夹中的所有内容！" onclick="return confirm(this.dataset.confirm)">
                             <i class="bi bi-trash"></i>
                         </a>
                     </div>
                 </div>
-                '''
-            
-            # 显示文件
-            for obj in objects:
-                # 格式化文件大小
-                size = obj["size"]
-                if size > 1024*1024:
-                    size_str = f"{size/(1024*1024):.2f} MB"
-                elif size > 1024:
-                    size_str = f"{size/1024:.2f} KB"
-                else:
-                    size_str = f"{size} B"
-                
-                content_html += f'''
+            {% elif entry.type == 'file' %}
+                {% set listed.rows = listed.rows + 1 %}
                 <div class="file-item">
                     <div>
+                        {% if entry is thumbnailable %}
+                        <img src="/thumbnail/{{ bucket_name|urlencode }}/{{ entry.key|urlencode }}?v={{ entry.etag|urlencode }}"
+                             class="thumbnail" width="48" height="48" loading="lazy" alt=""
+                             onerror="thumbnailFailed(this)">
+                        <i class="bi bi-file-earmark file-icon" hidden></i>
+                        {% else %}
                         <i class="bi bi-file-earmark file-icon"></i>
-                        {obj['name']}
-                        <small class="text-muted d-block mt-1">{size_str} - {obj['last_modified'].strftime("%Y-%m-%d %H:%M:%S")}</small>
+                        {% endif %}
+                        {{ entry.name }}
+                        <small class="text-muted d-block mt-1">{{ entry.size|filesize }} - {{ entry.last_modified.strftime("%Y-%m-%d %H:%M:%S") }}</small>
                     </div>
                     <div class="file-actions">
-                        <a href="/download/{bucket_name}/{obj['key']}" class="btn btn-outline-primary btn-sm">
+                        {% if entry.name.lower().endswith('.zip') %}
+                        <a href="/zip/{{ bucket_name|urlencode }}/{{ entry.key|urlencode }}" class="btn btn-outline-secondary btn-sm" title="查看压缩包内容">
+                            <i class="bi bi-archive"></i>
+                        </a>
+                        {% endif %}
+                        <a href="/download/{{ bucket_name|urlencode }}/{{ entry.key|urlencode }}" class="btn btn-outline-primary btn-sm">
                             <i class="bi bi-download"></i>
                         </a>
                         <button class="btn btn-outline-info btn-sm" data-bs-toggle="modal" data-bs-target="#shareModal" 
-                                data-key="{obj['key']}" data-filename="{obj['name']}">
+                                data-key="{{ entry.key }}" data-filename="{{ entry.name }}">
                             <i class="bi bi-share"></i>
                         </button>
-                        <a href="/delete/{bucket_name}/{obj['key']}" class="btn btn-outline-danger btn-sm" 
-                           onclick="return confirm('确定要删除文件 {obj["name"]} 吗？')">
+                        <a href="/delete/{{ bucket_name|urlencode }}/{{ entry.key|urlencode }}" class="btn btn-outline-danger btn-sm" 
+                           data-confirm="确定要删除文件 {{ entry.name }} 吗？" onclick="return confirm(this.dataset.confirm)">
                             <i class="bi bi-trash"></i>
                         </a>
                     </div>
                 </div>
-                '''
-            
-            content_html += '</div></div>'
-        else:
-            content_html += '''
-            <div class="card">
-                <div class="card-body text-center py-5">
+            {% elif entry.type == 'error' %}
+                <div class="alert alert-danger m-2">无法列出文件: {{ entry.message }}</div>
+            {% else %}
+                {{ entry.marker }}
+            {% endif %}
+            {% endfor %}
+            {% if not listed.rows %}
+                <div class="text-center py-5">
                     <i class="bi bi-inbox" style="font-size: 3rem; color: #6c757d;"></i>
                     <p class="mt-3 text-muted">此目录为空</p>
                 </div>
-            </div>
-            '''
+            {% endif %}
+        </div></div>
+        
+        {% if prev_url or next_url %}
+        <!-- 分页导航 -->
+        <nav class="mt-3">
+            <ul class="pagination justify-content-center">
+                {% if prev_url %}
+                <li class="page-item"><a class="page-link" href="{{ prev_url }}">上一页</a></li>
+                {% endif %}
+                <li class="page-item disabled"><span class="page-link">第 {{ page_number }} 页</span></li>
+                {% if next_url %}
+                <li class="page-item"><a class="page-link" href="{{ next_url }}">下一页</a></li>
+                <li class="page-item"><a class="page-link" href="{{ all_url }}">显示全部</a></li>
+                {% endif %}
+            </ul>
+        </nav>
+        {% endif %}
         
-        # 上传模态框
-        content_html += '''
+        <!-- 上传模态框 -->
         <div class="modal fade" id="uploadModal" tabindex="-1">
             <div class="modal-dialog">
                 <div class="modal-content">
@@ -695,17 +1615,23 @@ def bucket_contents(bucket_name):
                         <h5 class="modal-title">上传文件</h5>
                         <button type="button" class="btn-close" data-bs-dismiss="modal"></button>
                     </div>
-                    <form method="post" action="/upload/''' + bucket_name + '''" enctype="multipart/form-data">
-                        <input type="hidden" name="prefix" value="''' + current_prefix + '''">
+                    <form id="uploadForm" method="post" action="/upload/{{ bucket_name|urlencode }}" enctype="multipart/form-data"
+                          data-direct="{{ '1' if direct_upload else '0' }}">
+                        <input type="hidden" name="prefix" value="{{ current_prefix }}">
                         <div class="modal-body">
                             <div class="mb-3">
-                                <label class="form-label">选择文件</label>
-                                <input type="file" class="form-control" name="file" required>
+                                <label class="form-label">选择文件（可多选）</label>
+                                <input type="file" class="form-control" name="file" multiple>
+                            </div>
+                            <div class="mb-3">
+                                <label class="form-label">或选择整个文件夹</label>
+                                <input type="file" class="form-control" name="folder" webkitdirectory multiple>
                             </div>
                             <div id="upload-status" class="upload-status">
                                 <div class="progress">
                                     <div id="upload-progress" class="progress-bar" role="progressbar" style="width: 0%;">0%</div>
                                 </div>
+                                <div id="upload-summary" class="mt-2"></div>
                             </div>
                         </div>
                         <div class="modal-footer">
@@ -716,10 +1642,7 @@ def bucket_contents(bucket_name):
                 </div>
             </div>
         </div>
-        '''
         
-        # 分享模态框
-        content_html += '''
         <!-- 分享模态框 -->
         <div class="modal fade" id="shareModal" tabindex="-1">
             <div class="modal-dialog">
@@ -746,6 +1669,16 @@ def bucket_contents(bucket_name):
                                     </select>
                                 </div>
                             </div>
+                            <div class="mb-3">
+                                <label class="form-label">下载大小上限（MB，可选）</label>
+                                <input type="number" class="form-control" name="byte_limit_mb" min="1" placeholder="不限制">
+                                <div class="form-text">设置后链接只能下载文件开头的这部分内容，适合试听或预览</div>
+                            </div>
+                            <div class="mb-3">
+                                <label class="form-label">最多下载次数（可选）</label>
+                                <input type="number" class="form-control" name="max_downloads" min="1" placeholder="不限制">
+                                <div class="form-text">按实际下载的数据量计算（次数 × 文件大小），设置后链接经由本服务下载</div>
+                            </div>
                             <div class="mb-3" id="shareResult" style="display: none;">
                                 <label class="form-label">分享链接</label>
                                 <div class="input-group">
@@ -765,14 +1698,360 @@ def bucket_contents(bucket_name):
                 </div>
             </div>
         </div>
-        '''
+{% endblock %}
+'''
+
+# 后台任务进度卡片（由布局中的脚本轮询 /jobs/<job_id>）
+JOB_STATUS_TEMPLATE = '''
+        {% if job_id %}
+        <!-- 后台任务进度 -->
+        <div class="alert alert-info" id="jobStatus" data-job-id="{{ job_id }}">
+            <div id="jobText"><i class="bi bi-hourglass-split"></i> 后台任务进行中...</div>
+            <div class="progress mt-2"><div class="progress-bar progress-bar-striped progress-bar-animated" style="width: 100%;"></div></div>
+            <button type="button" class="btn btn-sm btn-outline-secondary mt-2" id="jobCancel">取消任务</button>
+        </div>
+        {% endif %}
+'''
+
+# 搜索结果模板
+SEARCH_TEMPLATE = '''
+{% extends "layout.html" %}
+{% block content %}
+        <nav aria-label="breadcrumb">
+            <ol class="breadcrumb">
+                <li class="breadcrumb-item"><a href="/bucket/{{ bucket_name|urlencode }}">{{ bucket_name }}</a></li>
+                <li class="breadcrumb-item active" aria-current="page">搜索</li>
+            </ol>
+        </nav>
+        
+        <form class="d-flex gap-2 mb-3" action="/search/{{ bucket_name|urlencode }}" method="get">
+            <input type="search" class="form-control" name="q" value="{{ query }}" placeholder="文件名或路径的一部分，通配符如 TUP/tex/*.png" required>
+            <select class="form-select w-auto" name="mode">
+                <option value="substring" {{ 'selected' if mode == 'substring' }}>包含</option>
+                <option value="glob" {{ 'selected' if mode == 'glob' }}>通配符</option>
+            </select>
+            <button type="submit" class="btn btn-primary"><i class="bi bi-search"></i> 搜索</button>
+        </form>
+        
+        {% include "job_status.html" %}
+        
+        <div class="d-flex align-items-center gap-2 mb-3 text-muted small">
+            {% if not index_status %}
+            <span>索引尚未建立</span>
+            {% elif index_status.status == 'ready' %}
+            <span>索引包含 {{ index_status.object_count }} 个对象，更新于 {{ index_status.scanned_at }}</span>
+            {% else %}
+            <span>索引{{ {'queued': '等待建立', 'scanning': '正在建立', 'partial': '不完整', 'failed': '建立失败'}[index_status.status] }}，结果可能不全</span>
+            {% endif %}
+            <form method="post" action="/index/{{ bucket_name|urlencode }}/rebuild?q={{ query|urlencode }}&mode={{ mode }}">
+                <button type="submit" class="btn btn-link btn-sm p-0">重建索引</button>
+            </form>
+        </div>
+        
+        {% if query %}
+        <div class="card"><div class="card-body p-0">
+            {% for entry in results %}
+                {% set parent = entry.key.rpartition('/')[0] %}
+                <div class="file-item">
+                    <div>
+                        <i class="bi {{ 'bi-folder-fill folder-icon' if entry.key.endswith('/') else 'bi-file-earmark file-icon' }}"></i>
+                        {{ entry.key }}
+                        <small class="text-muted d-block mt-1">{{ entry.size|filesize }} - {{ entry.last_modified.strftime("%Y-%m-%d %H:%M:%S") }}</small>
+                    </div>
+                    <div class="file-actions">
+                        <a href="/bucket/{{ bucket_name|urlencode }}?prefix={{ (parent + '/' if parent else '')|urlencode }}" class="btn btn-outline-secondary btn-sm" title="打开所在文件夹">
+                            <i class="bi bi-folder2-open"></i>
+                        </a>
+                        {% if not entry.key.endswith('/') %}
+                        <a href="/download/{{ bucket_name|urlencode }}/{{ entry.key|urlencode }}" class="btn btn-outline-primary btn-sm">
+                            <i class="bi bi-download"></i>
+                        </a>
+                        {% endif %}
+                    </div>
+                </div>
+            {% else %}
+                <div class="text-center py-5">
+                    <i class="bi bi-search" style="font-size: 3rem; color: #6c757d;"></i>
+                    <p class="mt-3 text-muted">没有找到匹配的对象</p>
+                </div>
+            {% endfor %}
+        </div></div>
+        <p class="text-muted small mt-2">
+            {{ results|length }} 个结果{% if results|length >= result_limit %}（只显示前 {{ result_limit }} 个，请缩小搜索范围）{% endif %}，用时 {{ took_ms }} 毫秒
+        </p>
+        {% endif %}
+{% endblock %}
+'''
+
+ZIP_TEMPLATE = '''
+{% extends "layout.html" %}
+{% block content %}
+        {% set parent = key.rpartition('/')[0] %}
+        <nav aria-label="breadcrumb">
+            <ol class="breadcrumb">
+                <li class="breadcrumb-item"><a href="/bucket/{{ bucket_name|urlencode }}">{{ bucket_name }}</a></li>
+                {% if parent %}
+                <li class="breadcrumb-item"><a href="/bucket/{{ bucket_name|urlencode }}?prefix={{ (parent + '/')|urlencode }}">{{ parent }}</a></li>
+                {% endif %}
+                <li class="breadcrumb-item"><a href="/zip/{{ bucket_name|urlencode }}/{{ key|urlencode }}">{{ key.rpartition('/')[2] }}</a></li>
+                {% set crumbs = namespace(path='') %}
+                {% for part in path.rstrip('/').split('/') if part %}
+                    {% set crumbs.path = crumbs.path + part + '/' %}
+                    <li class="breadcrumb-item"><a href="/zip/{{ bucket_name|urlencode }}/{{ key|urlencode }}?path={{ crumbs.path|urlencode }}">{{ part }}</a></li>
+                {% endfor %}
+            </ol>
+        </nav>
+        
+        <p class="text-muted small">
+            共 {{ total_count }} 个文件，解压后 {{ total_size|filesize }}，压缩包 {{ archive_size|filesize }}
+        </p>
+        
+        <div class="card"><div class="card-body p-0">
+            {% for folder in folders %}
+                <div class="file-item">
+                    <div>
+                        <i class="bi bi-folder-fill folder-icon"></i>
+                        <a href="/zip/{{ bucket_name|urlencode }}/{{ key|urlencode }}?path={{ folder.path|urlencode }}">{{ folder.name }}</a>
+                        <small class="text-muted d-block mt-1">{{ folder.size|filesize }} - {{ folder.count }} 个文件</small>
+                    </div>
+                </div>
+            {% endfor %}
+            {% for entry in files %}
+                <div class="file-item">
+                    <div>
+                        <i class="bi bi-file-earmark file-icon"></i>
+                        {{ entry.name[path|length:] }}
+                        <small class="text-muted d-block mt-1">
+                            {{ entry.size|filesize }}（压缩后 {{ entry.compressed_size|filesize }}）{% if entry.modified %} - {{ entry.modified.strftime("%Y-%m-%d %H:%M:%S") }}{% endif %}
+                        </small>
+                    </div>
+                    <div class="file-actions">
+                        <a href="/zip-entry/{{ bucket_name|urlencode }}/{{ key|urlencode }}?name={{ entry.name|urlencode }}" class="btn btn-outline-primary btn-sm" title="解压下载">
+                            <i class="bi bi-download"></i>
+                        </a>
+                    </div>
+                </div>
+            {% endfor %}
+            {% if not folders and not files %}
+                <div class="text-center py-5">
+                    <i class="bi bi-archive" style="font-size: 3rem; color: #6c757d;"></i>
+                    <p class="mt-3 text-muted">此文件夹为空</p>
+                </div>
+            {% endif %}
+        </div></div>
+{% endblock %}
+'''
+
+# 模板在启动时编译一次，之后每次请求只执行编译好的模板代码（开启HTML自动转义）
+TEMPLATES = {
+    'layout.html': HTML_TEMPLATE,
+    'index.html': INDEX_TEMPLATE,
+    'bucket.html': BUCKET_TEMPLATE,
+    'job_status.html': JOB_STATUS_TEMPLATE,
+    'search.html': SEARCH_TEMPLATE,
+    'zip.html': ZIP_TEMPLATE
+}
+app.jinja_loader = DictLoader(TEMPLATES)
+
+@app.template_test('thumbnailable')
+def has_thumbnail(entry):
+    """文件列表中该文件是否显示缩略图"""
+    return (Image is not None and entry['size'] <= app.config['THUMBNAIL_MAX_SOURCE']
+            and entry['name'].lower().endswith(app.config['THUMBNAIL_EXTENSIONS']))
+
+@app.template_filter('filesize')
+def format_file_size(size):
+    """格式化文件大小"""
+    if size > 1024*1024:
+        return f"{size/(1024*1024):.2f} MB"
+    elif size > 1024:
+        return f"{size/1024:.2f} KB"
+    else:
+        return f"{size} B"
+
+def page_context(messages=None, config=None, bucket_name='', current_prefix='', **context):
+    """组装页面模板的公共变量"""
+    if messages is None:
+        messages = []
+    if config is None:
+        config = session.get('s3_config', DEFAULT_CONFIG)
+    # 在开始输出前取出闪现消息，流式响应发送后就无法再修改session
+    context.update(messages=list(messages) + get_flashed_messages(), config=config,
+                   bucket_name=bucket_name, current_prefix=current_prefix,
+                   upload_part_size=app.config['UPLOAD_PART_SIZE'],
+                   upload_batch_max_bytes=app.config['UPLOAD_BATCH_MAX_BYTES'],
+                   upload_batch_max_files=app.config['UPLOAD_BATCH_MAX_FILES'])
+    return context
+
+def render_page(template_name, **context):
+    """渲染页面模板的辅助函数"""
+    return render_template(template_name, **page_context(**context))
+
+# 流式输出时的刷新标记：模板输出到这里时立即把已生成的HTML发给浏览器
+FLUSH_MARKER = Markup('<!-- flush -->')
+
+def buffer_template_output(events, max_buffer=64 * 1024):
+    """合并模板输出的小片段，遇到刷新标记或缓冲区满时输出"""
+    buffer = []
+    size = 0
+    for event in events:
+        if event is FLUSH_MARKER or event == FLUSH_MARKER:
+            if buffer:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+            continue
+        buffer.append(event)
+        size += len(event)
+        if size >= max_buffer:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+def stream_page(template_name, **context):
+    """以流式响应渲染页面，模板边生成边发送"""
+    context = page_context(**context)
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    response = Response(stream_with_context(buffer_template_output(template.generate(context))),
+                        mimetype='text/html')
+    # 防止反向代理缓冲整个响应
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# 路由定义
+@app.route('/')
+def index():
+    messages = []
+    config = session.get('s3_config', DEFAULT_CONFIG)
+    
+    # 检查是否已配置
+    if not config.get('access_key') or not config.get('secret_key'):
+        messages.append("请先配置API连接信息")
+        return render_page('index.html', messages=messages, config=config, configured=False)
+    
+    try:
+        s3 = get_s3_client()
+        response = s3.list_buckets()
+        buckets = [bucket['Name'] for bucket in response['Buckets']]
+        return render_page('index.html', messages=messages, config=config, configured=True, buckets=buckets)
+    except ClientError as e:
+        error_msg = f"连接错误: {str(e)}"
+        messages.append(error_msg)
+        return render_page('index.html', messages=messages, config=config, configured=True, error_msg=error_msg)
+
+@app.route('/configure', methods=['POST'])
+def configure():
+    """保存API配置"""
+    endpoint_url = request.form.get('endpoint_url', '').strip()
+    access_key = request.form.get('access_key', '').strip()
+    secret_key = request.form.get('secret_key', '').strip()
+    
+    if not endpoint_url or not access_key or not secret_key:
+        flash("所有字段都必须填写")
+        return redirect('/')
+    
+    # 保存配置到session
+    session['s3_config'] = {
+        'endpoint_url': endpoint_url,
+        'access_key': access_key,
+        'secret_key': secret_key
+    }
+    
+    flash("API配置已保存")
+    return redirect('/')
+
+@app.route('/bucket/<bucket_name>')
+def bucket_contents(bucket_name):
+    messages = []
+    config = session.get('s3_config', DEFAULT_CONFIG)
+    current_prefix, cursor, page_number, page_size = parse_bucket_args(request.args)
+    breadcrumbs = build_breadcrumbs(current_prefix)
+    
+    try:
+        s3 = get_s3_client()
+        
+        if request.args.get('all') == '1':
+            # 显示全部：页头和第一批文件先发送，后续页边从S3获取边输出
+            return stream_page('bucket.html', config=config,
+                               bucket_name=bucket_name, current_prefix=current_prefix,
+                               breadcrumbs=breadcrumbs,
+                               entries=iter_folder_entries(s3, bucket_name, current_prefix),
+                               job_id=request.args.get('job', ''),
+                               direct_upload=app.config['DIRECT_UPLOAD'])
+        
+        # 获取一页文件列表（refresh=1 时跳过缓存，例如浏览器直传完成后）
+        objects = []
+        folders = []
+        next_cursor = ''
+        
+        try:
+            folders, objects, next_cursor = list_folder_page(s3, bucket_name, current_prefix, cursor, page_size,
+                                                             use_cache=request.args.get('refresh') != '1')
+        except ClientError as e:
+            messages.append(f"无法列出文件: {str(e)}")
         
-        return render_template(content_html, messages=messages, config=config, 
-                              bucket_name=bucket_name, current_prefix=current_prefix)
+        # 分页导航
+        prev_url, next_url, all_url = pagination_urls(bucket_name, current_prefix, cursor, next_cursor,
+                                                      page_number, page_size)
+        
+        return render_page('bucket.html', messages=messages, config=config,
+                           bucket_name=bucket_name, current_prefix=current_prefix,
+                           breadcrumbs=breadcrumbs, entries=folders + objects,
+                           job_id=request.args.get('job', ''), page_number=page_number,
+                           prev_url=prev_url, next_url=next_url, all_url=all_url,
+                           direct_upload=app.config['DIRECT_UPLOAD'])
     except ClientError as e:
         messages.append(f"访问存储桶错误: {str(e)}")
         return redirect('/')
 
+def build_object_key(prefix, filename):
+    """添加前缀到文件名"""
+    return prefix + filename if prefix else filename
+
+def clean_relative_path(path):
+    """规范化文件夹上传时的相对路径（如 音乐/专辑/01.mp3），去掉空段、.、.. 和控制字符
+
+    与 secure_filename 不同，这里保留中文等非ASCII字符，目录结构才能原样还原。
+    """
+    parts = []
+    for part in path.replace('\\', '/').split('/'):
+        part = ''.join(ch for ch in part if ch.isprintable()).strip()
+        if part and part not in ('.', '..'):
+            parts.append(part)
+    return '/'.join(parts)
+
+def upload_batch(s3, bucket_name, prefix, items, endpoint_url):
+    """把 (相对路径, 文件) 列表并行上传到prefix下，返回本批次的汇总"""
+    started = time.monotonic()
+    summary = {'uploaded': [], 'failed': [], 'bytes': 0}
+    workers = app.config['UPLOAD_BATCH_CONCURRENCY']
+    # 所有文件的分片共用同一个客户端的连接池，按文件数均分，避免线程排队等连接
+    part_concurrency = max(1, min(app.config['UPLOAD_MAX_CONCURRENCY'],
+                                  app.config['S3_MAX_POOL_CONNECTIONS'] // workers))
+    
+    def upload_one(relative_path, file):
+        key = build_object_key(prefix, relative_path)
+        size = file.stream.seek(0, os.SEEK_END)
+        file.stream.seek(0)
+        upload_stream(s3, file.stream, bucket_name, key, file.mimetype, part_concurrency)
+        index_object(s3, bucket_name, key, endpoint_url)
+        return key, size
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(upload_one, path, file): path for path, file in items}
+        for future in futures:
+            path = futures[future]
+            try:
+                key, size = future.result()
+                summary['uploaded'].append(key)
+                summary['bytes'] += size
+            except Exception as e:
+                # 连接错误等也只记为该文件失败，其余文件和汇总照常返回
+                summary['failed'].append({'path': path, 'message': str(e)})
+    summary['seconds'] = round(time.monotonic() - started, 3)
+    return summary
+
 @app.route('/upload/<bucket_name>', methods=['POST'])
 def upload_file(bucket_name):
     messages = []
@@ -789,18 +2068,331 @@ def upload_file(bucket_name):
     
     if file:
         filename = secure_filename(file.filename)
-        # 添加前缀到文件名
-        key = prefix + filename if prefix else filename
+        key = build_object_key(prefix, filename)
         
         try:
             s3 = get_s3_client()
-            s3.upload_fileobj(file, bucket_name, key)
+            upload_stream(s3, file.stream, bucket_name, key, file.mimetype)
+            invalidate_listing(bucket_name, key)
+            index_object(s3, bucket_name, key)
             flash(f'文件 {filename} 上传成功')
-        except ClientError as e:
+        except (ClientError, S3UploadFailedError) as e:
             flash(f'上传失败: {str(e)}')
     
     return redirect(f'/bucket/{bucket_name}?prefix={prefix}')
 
+@app.route('/upload/<bucket_name>/batch', methods=['POST'])
+def batch_upload(bucket_name):
+    """批量上传多个文件（或整个文件夹），paths 与 files 一一对应，保留相对路径"""
+    prefix = request.form.get('prefix', '')
+    files = request.files.getlist('files')
+    paths = request.form.getlist('paths')
+    
+    items = []
+    for index, file in enumerate(files):
+        relative_path = clean_relative_path(paths[index] if index < len(paths) else file.filename or '')
+        if relative_path:
+            items.append((relative_path, file))
+    if not items:
+        return jsonify({'success': False, 'message': '没有选择文件'}), 400
+    
+    try:
+        s3 = get_s3_client()
+        endpoint_url = session.get('s3_config', DEFAULT_CONFIG)['endpoint_url']
+        summary = upload_batch(s3, bucket_name, prefix, items, endpoint_url)
+    finally:
+        # 即使部分失败，已上传的文件也要在列表中可见
+        invalidate_listing(bucket_name, prefix)
+    return jsonify(dict(summary, success=not summary['failed']))
+
+def upload_request_data():
+    """读取分片上传接口的JSON请求体，返回 (data, key, upload_id)；key 或 upload_id 缺失时为空字符串"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    key = data.get('key')
+    upload_id = data.get('upload_id')
+    return data, key if isinstance(key, str) else '', upload_id if isinstance(upload_id, str) else ''
+
+def make_upload_token(bucket_name, key, upload_id, size, part_size):
+    """分片上传令牌: base64url(载荷).base64url(HMAC-SHA256前16字节)，格式与分享令牌相同
+
+    载荷是 [bucket, key, upload_id, 声明的文件大小, 分片大小]，由init签发，之后的分片、查询和合并请求
+    都带上它，服务端据此限制每个分片的大小并在合并时核对总大小，不需要为每个上传保存状态。
+    签名密钥与分享令牌相同，加上 upload: 前缀，两种令牌不能互相冒用。没有可用的密钥时抛出RuntimeError。
+    """
+    signing_key = share_token_key()
+    if signing_key is None:
+        raise RuntimeError('未配置分享令牌密钥')
+    payload = [bucket_name, key, upload_id, int(size), int(part_size)]
+    body = _b64encode(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    signature = hmac.new(signing_key, b'upload:' + body.encode('ascii'), hashlib.sha256).digest()[:16]
+    return f'{body}.{_b64encode(signature)}'
+
+def verify_upload_token(token, bucket_name):
+    """校验分片上传令牌，有效时返回 {key, upload_id, size, part_size}，伪造、损坏或不属于该存储桶时返回None"""
+    body, _, signature = (token or '').partition('.')
+    signing_key = share_token_key()
+    if not body or not signature or signing_key is None:
+        return None
+    expected = hmac.new(signing_key, b'upload:' + body.encode('ascii', 'replace'), hashlib.sha256).digest()[:16]
+    try:
+        if not hmac.compare_digest(_b64decode(signature), expected):
+            return None
+        token_bucket, key, upload_id, size, part_size = json.loads(_b64decode(body))
+    except (ValueError, TypeError):
+        return None
+    if token_bucket != bucket_name:
+        return None
+    return {'key': key, 'upload_id': upload_id, 'size': size, 'part_size': part_size}
+
+def upload_part_count(upload):
+    """声明的文件大小需要的分片数（空文件也有一个分片）"""
+    return max(1, math.ceil(upload['size'] / upload['part_size']))
+
+@app.route('/upload/<bucket_name>/init', methods=['POST'])
+def chunked_upload_init(bucket_name):
+    """开始分片上传，返回upload_id、分片大小和之后请求要带上的上传令牌"""
+    filename = secure_filename(request.form.get('filename', ''))
+    prefix = request.form.get('prefix', '')
+    content_type = request.form.get('content_type') or 'application/octet-stream'
+    try:
+        size = int(request.form.get('size', -1))
+    except ValueError:
+        size = -1
+    
+    if not filename:
+        return jsonify({'success': False, 'message': '没有选择文件'}), 400
+    if size < 0:
+        return jsonify({'success': False, 'message': '文件信息不完整'}), 400
+    if size > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'success': False, 'message': '文件超过大小限制'}), 400
+    
+    if share_token_key() is None:
+        return jsonify({'success': False, 'message': '未配置分享令牌密钥（SHARE_TOKEN_KEY），无法分片上传'}), 503
+    
+    # S3最多允许10000个分片，文件很大时相应加大分片
+    part_size = max(app.config['UPLOAD_PART_SIZE'], math.ceil(size / 10000))
+    key = build_object_key(prefix, filename)
+    try:
+        s3 = get_s3_client()
+        upload = s3.create_multipart_upload(Bucket=bucket_name, Key=key, ContentType=content_type)
+        return jsonify({
+            'success': True,
+            'key': key,
+            'upload_id': upload['UploadId'],
+            'part_size': part_size,
+            'token': make_upload_token(bucket_name, key, upload['UploadId'], size, part_size)
+        })
+    except ClientError as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/upload/<bucket_name>/part', methods=['PUT'])
+def chunked_upload_part(bucket_name):
+    """接收一个分片（请求体即分片内容）并转存到S3，分片不能超过init时确定的分片大小"""
+    upload = verify_upload_token(request.args.get('token'), bucket_name)
+    part_number = request.args.get('part_number', type=int)
+    
+    if upload is None or part_number is None or not 1 <= part_number <= upload_part_count(upload):
+        return jsonify({'success': False, 'message': '分片参数错误'}), 400
+    # 先看Content-Length，过大的分片不必读入内存
+    if (request.content_length or 0) > upload['part_size']:
+        return jsonify({'success': False, 'message': '分片超过分片大小'}), 413
+    body = request.get_data()
+    if len(body) > upload['part_size']:
+        return jsonify({'success': False, 'message': '分片超过分片大小'}), 413
+    
+    try:
+        s3 = get_s3_client()
+        result = s3.upload_part(Bucket=bucket_name, Key=upload['key'], UploadId=upload['upload_id'],
+                                PartNumber=part_number, Body=body)
+        return jsonify({'success': True, 'part_number': part_number, 'etag': result['ETag']})
+    except ClientError as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+def list_uploaded_parts(s3, bucket_name, key, upload_id):
+    """列出分片上传中已完成的分片"""
+    parts = []
+    paginator = s3.get_paginator('list_parts')
+    for page in paginator.paginate(Bucket=bucket_name, Key=key, UploadId=upload_id):
+        for part in page.get('Parts', []):
+            parts.append({'PartNumber': part['PartNumber'], 'ETag': part['ETag'], 'Size': part['Size']})
+    return parts
+
+@app.route('/upload/<bucket_name>/status')
+def chunked_upload_status(bucket_name):
+    """查询已上传的分片，供客户端断点续传"""
+    upload = verify_upload_token(request.args.get('token'), bucket_name)
+    if upload is None:
+        return jsonify({'success': False, 'message': '缺少分片信息'}), 400
+    try:
+        s3 = get_s3_client()
+        parts = list_uploaded_parts(s3, bucket_name, upload['key'], upload['upload_id'])
+        return jsonify({
+            'success': True,
+            'parts': parts,
+            'uploaded_bytes': sum(part['Size'] for part in parts)
+        })
+    except ClientError as e:
+        # 上传已完成或已被中止时，客户端应重新开始
+        return jsonify({'success': False, 'message': str(e)}), 404
+
+@app.route('/upload/<bucket_name>/complete', methods=['POST'])
+def chunked_upload_complete(bucket_name):
+    """所有分片到齐后合并为完整对象，分片数量和总大小必须与init时声明的一致"""
+    data = request.get_json(silent=True)
+    upload = verify_upload_token(data.get('token') if isinstance(data, dict) else None, bucket_name)
+    if upload is None:
+        return jsonify({'success': False, 'message': '缺少分片信息'}), 400
+    key, upload_id = upload['key'], upload['upload_id']
+    part_count = upload_part_count(upload)
+    
+    try:
+        s3 = get_s3_client()
+        parts = list_uploaded_parts(s3, bucket_name, key, upload_id)
+        if len(parts) != part_count:
+            return jsonify({'success': False, 'message': f'分片不完整: {len(parts)}/{part_count}'}), 409
+        uploaded_bytes = sum(part['Size'] for part in parts)
+        if uploaded_bytes != upload['size']:
+            return jsonify({'success': False,
+                            'message': f'文件大小不符: {uploaded_bytes}/{upload["size"]}'}), 409
+        s3.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': part['PartNumber'], 'ETag': part['ETag']} for part in parts]}
+        )
+        invalidate_listing(bucket_name, key)
+        index_object(s3, bucket_name, key)
+        flash(f'文件 {key.split("/")[-1]} 上传成功')
+        return jsonify({'success': True, 'key': key})
+    except ClientError as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/direct-upload/<bucket_name>/init', methods=['POST'])
+def direct_upload_init(bucket_name):
+    """为浏览器直传签发预签名POST策略或分片上传URL"""
+    filename = secure_filename(request.form.get('filename', ''))
+    prefix = request.form.get('prefix', '')
+    content_type = request.form.get('content_type') or 'application/octet-stream'
+    try:
+        size = int(request.form.get('size', -1))
+    except ValueError:
+        size = -1
+    
+    if not filename or size < 0:
+        return jsonify({'success': False, 'message': '文件信息不完整'}), 400
+    if size > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'success': False, 'message': '文件超过大小限制'}), 400
+    
+    key = build_object_key(prefix, filename)
+    expires = app.config['PRESIGN_UPLOAD_EXPIRES']
+    
+    try:
+        s3 = get_s3_client()
+        if size < app.config['UPLOAD_MULTIPART_THRESHOLD']:
+            # 小文件：一次POST表单直传，策略限定了对象名、类型和大小
+            post = s3.generate_presigned_post(
+                bucket_name, key,
+                Fields={'Content-Type': content_type},
+                Conditions=[{'Content-Type': content_type}, ['content-length-range', 0, size]],
+                ExpiresIn=expires
+            )
+            return jsonify({
+                'success': True,
+                'mode': 'post',
+                'key': key,
+                'url': post['url'],
+                'fields': post['fields']
+            })
+        
+        # 大文件：分片上传，S3最多允许10000个分片
+        part_size = max(app.config['UPLOAD_PART_SIZE'], math.ceil(size / 10000))
+        part_count = max(1, math.ceil(size / part_size))
+        upload = s3.create_multipart_upload(Bucket=bucket_name, Key=key, ContentType=content_type)
+        urls = [
+            s3.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': bucket_name,
+                    'Key': key,
+                    'UploadId': upload['UploadId'],
+                    'PartNumber': part_number
+                },
+                ExpiresIn=expires
+            )
+            for part_number in range(1, part_count + 1)
+        ]
+        return jsonify({
+            'success': True,
+            'mode': 'multipart',
+            'key': key,
+            'upload_id': upload['UploadId'],
+            'part_size': part_size,
+            'concurrency': app.config['DIRECT_UPLOAD_CONCURRENCY'],
+            'urls': urls
+        })
+    except ClientError as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+def parse_completed_parts(parts):
+    """校验浏览器提交的分片列表，返回按分片号排序的 [{'PartNumber', 'ETag'}]，格式不对时抛出ValueError"""
+    if not isinstance(parts, list) or not parts:
+        raise ValueError('缺少分片信息')
+    completed = {}
+    for part in parts:
+        if not isinstance(part, dict):
+            raise ValueError('分片信息格式错误')
+        try:
+            part_number = int(part.get('PartNumber'))
+        except (TypeError, ValueError):
+            raise ValueError('分片号无效') from None
+        etag = part.get('ETag')
+        if not 1 <= part_number <= 10000 or not isinstance(etag, str) or not etag:
+            raise ValueError(f'分片 {part_number} 信息无效')
+        if part_number in completed:
+            raise ValueError(f'分片 {part_number} 重复')
+        completed[part_number] = etag
+    return [{'PartNumber': number, 'ETag': completed[number]} for number in sorted(completed)]
+
+@app.route('/direct-upload/<bucket_name>/complete', methods=['POST'])
+def direct_upload_complete(bucket_name):
+    """浏览器上传完所有分片后合并对象"""
+    data, key, upload_id = upload_request_data()
+    if not key or not upload_id:
+        return jsonify({'success': False, 'message': '缺少分片信息'}), 400
+    try:
+        parts = parse_completed_parts(data.get('parts'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    try:
+        s3 = get_s3_client()
+        s3.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+        invalidate_listing(bucket_name, key)
+        index_object(s3, bucket_name, key)
+        return jsonify({'success': True, 'key': key})
+    except ClientError as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/direct-upload/<bucket_name>/abort', methods=['POST'])
+def direct_upload_abort(bucket_name):
+    """浏览器直传失败时中止分片上传"""
+    data, key, upload_id = upload_request_data()
+    if not key or not upload_id:
+        return jsonify({'success': False, 'message': '缺少分片信息'}), 400
+    try:
+        s3 = get_s3_client()
+        s3.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+        return jsonify({'success': True})
+    except ClientError as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/create-folder/<bucket_name>')
 def create_folder(bucket_name):
     folder_name = request.args.get('folder_name', '')
@@ -821,61 +2413,1458 @@ def create_folder(bucket_name):
         s3 = get_s3_client()
         # 创建文件夹（在S3中，文件夹是通过创建空对象实现的）
         s3.put_object(Bucket=bucket_name, Key=folder_path)
+        invalidate_listing(bucket_name, folder_path)
+        index_object(s3, bucket_name, folder_path)
         flash(f'文件夹 {folder_name} 创建成功')
     except ClientError as e:
         flash(f'创建文件夹失败: {str(e)}')
     
     return redirect(f'/bucket/{bucket_name}?prefix={prefix}')
 
+def content_disposition(filename, as_attachment=True):
+    """生成支持中文文件名的Content-Disposition头"""
+    disposition = 'attachment' if as_attachment else 'inline'
+    try:
+        filename.encode('ascii')
+        return f'{disposition}; filename="{filename}"'
+    except UnicodeEncodeError:
+        # 非ASCII文件名按 RFC 5987 编码，同时提供ASCII回退名
+        fallback = filename.encode('ascii', 'ignore').decode('ascii') or 'download'
+        return f'{disposition}; filename="{fallback}"; filename*=UTF-8\'\'{quote(filename)}'
+
+def stream_s3_body(body, chunk_size):
+    """逐块读取S3响应体，客户端断开或读完后关闭连接"""
+    try:
+        for chunk in body.iter_chunks(chunk_size):
+            yield chunk
+    finally:
+        body.close()
+
+def s3_object_request_params(bucket_name, key, req=request):
+    """把浏览器的Range/条件请求头转换为get_object参数（req 可传入其他框架的请求对象）"""
+    params = {'Bucket': bucket_name, 'Key': key}
+    
+    # 只转发单个字节区间，多区间请求按RFC允许的方式返回完整内容
+    byte_range = req.range
+    if byte_range is not None and byte_range.units == 'bytes' and len(byte_range.ranges) == 1:
+        params['Range'] = byte_range.to_header()
+    
+    if_none_match = req.headers.get('If-None-Match')
+    if if_none_match:
+        params['IfNoneMatch'] = if_none_match
+    elif req.if_modified_since is not None:
+        # 同时存在时If-None-Match优先，If-Modified-Since被忽略
+        params['IfModifiedSince'] = req.if_modified_since
+    return params
+
+def if_range_matches(obj, req=request):
+    """检查If-Range是否与对象当前版本一致（不一致时应返回完整内容）"""
+    if_range = req.if_range
+    if if_range.etag is not None:
+        # If-Range要求强比较，弱ETag永远不匹配；IfRange.etag 已去掉了 W/ 前缀，只能看原始请求头
+        if req.headers.get('If-Range', '').lstrip().startswith('W/'):
+            return False
+        return if_range.etag == obj.get('ETag', '').strip('"')
+    if if_range.date is not None:
+        return obj['LastModified'].replace(microsecond=0) == if_range.date
+    return True
+
+def s3_error_status(e):
+    """把条件请求/区间请求产生的ClientError转换为 (状态码, 响应头)，其他错误返回None"""
+    status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    upstream_headers = e.response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+    if status == 304:
+        headers = {}
+        for name in ('ETag', 'Last-Modified'):
+            if name.lower() in upstream_headers:
+                headers[name] = upstream_headers[name.lower()]
+        return 304, headers
+    if status == 416:
+        headers = {}
+        actual_size = e.response.get('Error', {}).get('ActualObjectSize')
+        if actual_size:
+            headers['Content-Range'] = f'bytes */{actual_size}'
+        return 416, headers
+    return None
+
+def s3_object_headers(obj, key, as_attachment=True):
+    """根据get_object结果生成下载响应的状态码和响应头"""
+    # 获取文件名
+    filename = key.split('/')[-1] if '/' in key else key
+    
+    headers = {
+        'Content-Type': obj.get('ContentType') or 'application/octet-stream',
+        'Content-Length': str(obj['ContentLength']),
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': content_disposition(filename, as_attachment)
+    }
+    if obj.get('ContentRange'):
+        headers['Content-Range'] = obj['ContentRange']
+    if obj.get('ETag'):
+        headers['ETag'] = obj['ETag']
+    if obj.get('LastModified'):
+        headers['Last-Modified'] = http_date(obj['LastModified'])
+    return (206 if obj.get('ContentRange') else 200), headers
+
+def serve_s3_object(s3, bucket_name, key, as_attachment=True):
+    """以流式响应返回S3对象，支持Range、If-None-Match、If-Modified-Since和If-Range"""
+    params = s3_object_request_params(bucket_name, key)
+    try:
+        obj = s3.get_object(**params)
+        if 'Range' in params and request.headers.get('If-Range') and not if_range_matches(obj):
+            # 对象已变化，断点续传的前提不成立，改为返回完整内容
+            obj['Body'].close()
+            del params['Range']
+            obj = s3.get_object(**params)
+    except ClientError as e:
+        error_status = s3_error_status(e)
+        if error_status is None:
+            raise
+        return Response(status=error_status[0], headers=error_status[1])
+    
+    # 直接把S3响应体分块转发给浏览器，内存占用与文件大小无关
+    body = obj['Body']
+    status, headers = s3_object_headers(obj, key, as_attachment)
+    response = Response(stream_s3_body(body, app.config['DOWNLOAD_CHUNK_SIZE']),
+                        status=status, headers=headers, direct_passthrough=True)
+    # 生成器未开始迭代就被丢弃时也要释放连接
+    response.call_on_close(body.close)
+    return response
+
 @app.route('/download/<bucket_name>/<path:key>')
 def download_file(bucket_name, key):
     try:
         s3 = get_s3_client()
-        file_obj = io.BytesIO()
-        s3.download_fileobj(bucket_name, key, file_obj)
-        file_obj.seek(0)
+        return serve_s3_object(s3, bucket_name, key)
+    except ClientError as e:
+        flash(f'下载失败: {str(e)}')
+        return redirect(f'/bucket/{bucket_name}')
+
+class ThumbnailCache:
+    """图片缩略图的本地磁盘缓存（多进程共用同一目录）
+
+    文件名是 (端点, 凭证, 存储桶, 键, ETag) 的哈希：对象被覆盖后ETag改变，自然对应新的缩略图，
+    旧文件留给LRU淘汰；凭证不同的session不会命中别人生成的缩略图。
+    无法生成缩略图的对象（不是图片、解码失败）保存为空文件，滚动到该行时不会再次下载原图。
+    """
+    
+    def __init__(self, directory, max_bytes, size, image_format, quality, max_source_size, workers):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        if image_format == 'WEBP' and Image is not None and not features.check('webp'):
+            image_format = 'JPEG'
+        self.format = image_format
+        self.mimetype = 'image/webp' if image_format == 'WEBP' else 'image/jpeg'
+        self.quality = quality
+        self.max_source_size = max_source_size
+        self.workers = workers
+        self._executor = None
+        self._pending = {}  # cache_key -> Future，同一缩略图同时只生成一次
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'generated': 0, 'unsupported': 0, 'evictions': 0}
+    
+    def _path(self, cache_key):
+        digest = hashlib.sha256('\0'.join(cache_key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + ('.webp' if self.format == 'WEBP' else '.jpg'))
+    
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+    
+    def get(self, s3, cache_key, timeout=None):
+        """返回缩略图文件路径，对象不是可识别的图片时返回None
+
+        未缓存时在线程池中生成，最多等待timeout秒，超时抛出 FutureTimeoutError（生成继续进行，
+        完成后下一次请求直接命中）；生成失败时抛出原来的异常，下一次请求会重新生成。
+        """
+        path = self._path(cache_key)
+        try:
+            os.utime(path)  # 记录访问时间，供LRU淘汰使用
+            self._count('hits')
+            return path if os.path.getsize(path) else None
+        except OSError:
+            pass
+        self._count('misses')
+        with self._lock:
+            future = self._pending.get(cache_key)
+            if future is None:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='thumbnail')
+                future = self._executor.submit(self._generate, s3, cache_key, path)
+                self._pending[cache_key] = future
+                future.add_done_callback(lambda _: self._discard(cache_key))
+        return future.result(timeout)
+    
+    def _discard(self, cache_key):
+        with self._lock:
+            self._pending.pop(cache_key, None)
+    
+    def _generate(self, s3, cache_key, path):
+        bucket_name, key, etag = cache_key[3:]
+        # 带If-Match读取，列表显示之后对象又被覆盖时不会把新内容存到旧ETag名下
+        obj = s3.get_object(Bucket=bucket_name, Key=key, IfMatch=f'"{etag}"')
+        with obj['Body'] as body:
+            if obj['ContentLength'] > self.max_source_size:
+                data = None
+            else:
+                data = body.read()
         
-        # 获取文件名
-        filename = key.split('/')[-1] if '/' in key else key
+        thumbnail = None
+        if data is not None:
+            try:
+                with Image.open(io.BytesIO(data)) as image:
+                    image.draft('RGB', (self.size, self.size))  # JPEG在解码时直接按比例缩小，快很多
+                    image = ImageOps.exif_transpose(image)  # 手机照片按EXIF方向摆正
+                    image.thumbnail((self.size, self.size))
+                    if self.format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+                        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+                        image = image.convert('RGBA' if has_alpha and self.format == 'WEBP' else 'RGB')
+                    thumbnail = io.BytesIO()
+                    image.save(thumbnail, self.format, quality=self.quality)
+            except (OSError, ValueError, Image.DecompressionBombError):
+                thumbnail = None
         
-        return send_file(
-            file_obj,
-            as_attachment=True,
-            download_name=filename
-        )
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}'
+        with open(tmp_path, 'wb') as f:
+            if thumbnail is not None:
+                f.write(thumbnail.getvalue())
+        os.replace(tmp_path, path)
+        
+        if thumbnail is None:
+            self._count('unsupported')
+            return None
+        self._count('generated')
+        if self._stats['generated'] % 100 == 0:
+            self.enforce_limit()
+        return path
+    
+    def enforce_limit(self):
+        """删除最久未访问的缩略图，直到总大小不超过上限"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            self._count('evictions')
+    
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['format'] = self.format
+        return stats
+
+@app.route('/thumbnail/<bucket_name>/<path:key>')
+def thumbnail(bucket_name, key):
+    """图片缩略图
+
+    参数: v 为对象的ETag，文件列表生成的地址都带有该参数。同一地址的内容永远不变，
+    浏览器可以长期缓存；对象被覆盖后列表中的地址随ETag改变。
+    """
+    if Image is None or not key.lower().endswith(app.config['THUMBNAIL_EXTENSIONS']):
+        return Response(status=404)
+    etag = request.args.get('v', '')
+    try:
+        s3 = get_s3_client()
+        if not etag:
+            head = s3.head_object(Bucket=bucket_name, Key=key)
+            etag = head.get('ETag', '').strip('"')
+            return redirect(f'/thumbnail/{quote(bucket_name)}/{quote(key)}?v={quote(etag)}')
+        config = session.get('s3_config', DEFAULT_CONFIG)
+        cache_key = (config['endpoint_url'], config['access_key'], config['secret_key'], bucket_name, key, etag)
+        path = thumbnail_cache.get(s3, cache_key, app.config['THUMBNAIL_WAIT'])
+    except ClientError:
+        # 对象已删除、已被覆盖（If-Match失败）或无权访问，不缓存
+        return Response(status=404)
+    except (FutureTimeoutError, BotoCoreError, OSError):
+        # 仍在排队生成，或连接S3、写缓存失败：不占着请求线程等待，让浏览器稍后重试
+        return Response(status=503, headers={'Retry-After': '2', 'Cache-Control': 'no-store'})
+    
+    if path is None:
+        response = Response(status=404)
+    else:
+        # 文件修改时间随每次访问更新，ETag改用文件名（内容的键）
+        response = send_file(path, mimetype=thumbnail_cache.mimetype, conditional=True,
+                             etag=os.path.splitext(os.path.basename(path))[0], last_modified=None)
+    # 缩略图需要登录后才能访问，只允许浏览器缓存，不允许共享代理缓存
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+class ZipOutputBuffer(io.RawIOBase):
+    """zipfile的输出目标：只收集写入的数据，由生成器随时取走
+
+    不支持seek和tell，zipfile会按流式方式写入（每个文件后附数据描述符）。
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def iter_folder_objects(s3, bucket_name, prefix):
+    """逐页列出前缀下的所有对象，不把完整列表放进内存"""
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        yield from page.get('Contents', [])
+
+def put_chunk(chunks, item, cancelled):
+    """队列满时等待打包线程取走；客户端断开后返回False，预读线程应立即退出"""
+    while not cancelled.is_set():
+        try:
+            chunks.put(item, timeout=1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def prefetch_object(s3, bucket_name, key, chunks, cancelled, chunk_size):
+    """在线程池中读取对象，逐块放入有界队列；以None结束，出错时放入异常"""
+    try:
+        body = s3.get_object(Bucket=bucket_name, Key=key)['Body']
+        try:
+            for chunk in body.iter_chunks(chunk_size):
+                if not put_chunk(chunks, chunk, cancelled):
+                    return
+        finally:
+            body.close()
+    except Exception as e:
+        put_chunk(chunks, e, cancelled)
+        return
+    put_chunk(chunks, None, cancelled)
+
+def archive_entry_name(key, prefix):
+    """对象在ZIP中的路径：去掉前缀以及空、.和..路径段，键中的 ../ 或开头的 / 不会让解压时写到目标目录之外
+
+    没有剩余路径时返回空字符串。
+    """
+    name = key[len(prefix):].replace('\\', '/')
+    parts = [part for part in name.split('/') if part not in ('', '.', '..')]
+    if not parts:
+        return ''
+    return '/'.join(parts) + ('/' if name.endswith('/') else '')
+
+def stream_folder_zip(s3, bucket_name, prefix):
+    """边从S3读取边输出ZIP归档，不使用临时文件
+
+    后面几个对象在线程池中提前读取，每个对象只缓冲有限的几块，内存占用与文件夹大小无关。
+    单个对象超过4GB或条目超过65535个时自动使用ZIP64。
+    对象多为图片和压缩包，再压缩收益很小，条目一律不压缩存储。
+    """
+    prefetch = app.config['FOLDER_ZIP_PREFETCH']
+    chunk_size = app.config['DOWNLOAD_CHUNK_SIZE']
+    buffer = ZipOutputBuffer()
+    cancelled = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix='folder-zip')
+    objects = iter_folder_objects(s3, bucket_name, prefix)
+    window = deque()
+    failed = []
+    
+    def schedule():
+        while len(window) < prefetch:
+            obj = next(objects, None)
+            if obj is None:
+                return
+            chunks = None
+            if not obj['Key'].endswith('/'):
+                chunks = queue.Queue(maxsize=app.config['FOLDER_ZIP_BUFFER_CHUNKS'])
+                executor.submit(prefetch_object, s3, bucket_name, obj['Key'], chunks, cancelled, chunk_size)
+            window.append((obj, chunks))
+    
+    try:
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+            schedule()
+            while window:
+                obj, chunks = window.popleft()
+                schedule()
+                name = archive_entry_name(obj['Key'], prefix)
+                if not name:
+                    continue
+                info = zipfile.ZipInfo(name, obj['LastModified'].astimezone().timetuple()[:6])
+                if chunks is None:
+                    archive.writestr(info, b'')  # 文件夹标记，保留空文件夹
+                    continue
+                
+                # 对象在列出之后被删除等情况下跳过，文件名记录在归档末尾
+                chunk = chunks.get()
+                if isinstance(chunk, Exception):
+                    failed.append(f'{name}: {chunk}')
+                    continue
+                info.file_size = obj['Size']  # 预先给出大小，zipfile据此决定是否写ZIP64扩展字段
+                with archive.open(info, 'w') as entry:
+                    while chunk is not None:
+                        if isinstance(chunk, Exception):
+                            raise chunk  # 已经输出了一部分内容，无法再跳过，中断下载
+                        entry.write(chunk)
+                        yield buffer.drain()
+                        chunk = chunks.get()
+                yield buffer.drain()
+            if failed:
+                archive.writestr('下载失败的文件.txt', '\n'.join(failed) + '\n')
+        yield buffer.drain()
+    finally:
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+@app.route('/download-folder/<bucket_name>/', defaults={'prefix': ''})
+@app.route('/download-folder/<bucket_name>/<path:prefix>')
+def download_folder(bucket_name, prefix):
+    """把文件夹打包为ZIP流式下载"""
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    try:
+        s3 = get_s3_client()
+        # 开始输出后就无法再返回错误页面，先确认可以列出该文件夹
+        s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix, MaxKeys=1)
     except ClientError as e:
         flash(f'下载失败: {str(e)}')
-        return redirect(f'/bucket/{bucket_name}')
+        return redirect(f'/bucket/{bucket_name}?prefix={prefix}')
+    filename = (prefix.rstrip('/').split('/')[-1] or bucket_name) + '.zip'
+    response = Response(stream_folder_zip(s3, bucket_name, prefix), mimetype='application/zip',
+                        direct_passthrough=True)
+    response.headers['Content-Disposition'] = content_disposition(filename)
+    # 防止反向代理缓冲整个响应
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# ZIP格式的各个记录头（见 PKWARE APPNOTE）
+ZIP_EOCD = struct.Struct('<4s4H2LH')
+ZIP64_EOCD_LOCATOR = struct.Struct('<4sLQL')
+ZIP64_EOCD = struct.Struct('<4sQ2H2L4Q')
+ZIP_CENTRAL_HEADER = struct.Struct('<4s6H3L5H2L')
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+ZIP_MAX_COMMENT = 65535
+
+def read_object_range(s3, bucket_name, key, etag, start, end):
+    """读取对象的一段字节（含end）；带If-Match，对象已被覆盖时抛出ClientError"""
+    obj = s3.get_object(Bucket=bucket_name, Key=key, Range=f'bytes={start}-{end}', IfMatch=f'"{etag}"')
+    with obj['Body'] as body:
+        return body.read()
+
+def decode_zip_name(raw_name, flags):
+    """解码文件名：有UTF-8标志时按UTF-8，否则依次尝试UTF-8、GBK（中文Windows打包）和CP437"""
+    if flags & 0x800:
+        return raw_name.decode('utf-8', 'replace')
+    for encoding in ('utf-8', 'gbk'):
+        try:
+            return raw_name.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    return raw_name.decode('cp437')
+
+def dos_datetime(dos_date, dos_time):
+    try:
+        return datetime(1980 + (dos_date >> 9), (dos_date >> 5) & 0xF, dos_date & 0x1F,
+                        dos_time >> 11, (dos_time >> 5) & 0x3F, (dos_time & 0x1F) * 2)
+    except ValueError:
+        return None
+
+def parse_zip_central_directory(data):
+    """解析中央目录，返回条目列表"""
+    entries = []
+    pos = 0
+    while pos + ZIP_CENTRAL_HEADER.size <= len(data):
+        (signature, _, _, flags, method, dos_time, dos_date, crc, compressed_size, size,
+         name_length, extra_length, comment_length, _, _, _, offset) = ZIP_CENTRAL_HEADER.unpack_from(data, pos)
+        if signature != b'PK\x01\x02':
+            raise ValueError('中央目录已损坏')
+        pos += ZIP_CENTRAL_HEADER.size
+        name = decode_zip_name(data[pos:pos + name_length], flags)
+        extra = data[pos + name_length:pos + name_length + extra_length]
+        pos += name_length + extra_length + comment_length
+        
+        # 超过4GB的大小和偏移保存在ZIP64扩展字段中，只包含取值为0xFFFFFFFF的那几项
+        if 0xFFFFFFFF in (size, compressed_size, offset):
+            extra_pos = 0
+            while extra_pos + 4 <= len(extra):
+                field_id, field_length = struct.unpack_from('<2H', extra, extra_pos)
+                if field_id == 0x0001:
+                    values = iter(struct.unpack_from(f'<{field_length // 8}Q', extra, extra_pos + 4))
+                    if size == 0xFFFFFFFF:
+                        size = next(values)
+                    if compressed_size == 0xFFFFFFFF:
+                        compressed_size = next(values)
+                    if offset == 0xFFFFFFFF:
+                        offset = next(values)
+                    break
+                extra_pos += 4 + field_length
+            else:
+                raise ValueError(f'{name} 缺少ZIP64扩展字段，压缩包已损坏')
+        
+        entries.append({
+            'name': name,
+            'size': size,
+            'compressed_size': compressed_size,
+            'method': method,
+            'flags': flags,
+            'crc': crc,
+            'offset': offset,
+            'modified': dos_datetime(dos_date, dos_time)
+        })
+    return entries
+
+def read_zip_directory(s3, bucket_name, key, etag, size):
+    """只用范围请求读取压缩包的目录结尾记录和中央目录，通常一到两次请求、几十KB
+
+    目录结尾记录在文件最后22字节加最长65535字节注释的范围内，中央目录通常紧挨在它前面，
+    一次读取末尾即可同时拿到两者；目录更大时再单独读取一次。
+    """
+    tail_start = max(0, size - ZIP_EOCD.size - ZIP_MAX_COMMENT)
+    tail = read_object_range(s3, bucket_name, key, etag, tail_start, size - 1) if size else b''
+    
+    # 注释中也可能出现签名，注释长度与剩余字节数一致的才是真正的记录
+    pos = tail.rfind(b'PK\x05\x06')
+    while pos >= 0:
+        if pos + ZIP_EOCD.size <= len(tail):
+            fields = ZIP_EOCD.unpack_from(tail, pos)
+            if pos + ZIP_EOCD.size + fields[7] == len(tail):
+                break
+        pos = tail.rfind(b'PK\x05\x06', 0, pos)
+    if pos < 0:
+        raise ValueError('不是有效的ZIP文件')
+    _, _, _, _, count, directory_size, directory_offset, _ = fields
+    
+    if 0xFFFF == count or 0xFFFFFFFF in (directory_size, directory_offset):
+        locator_pos = pos - ZIP64_EOCD_LOCATOR.size
+        if locator_pos < 0:
+            raise ValueError('ZIP64目录记录缺失')
+        signature, _, record_offset, _ = ZIP64_EOCD_LOCATOR.unpack_from(tail, locator_pos)
+        if signature != b'PK\x06\x07':
+            raise ValueError('ZIP64目录记录缺失')
+        if record_offset >= tail_start:
+            record = tail[record_offset - tail_start:record_offset - tail_start + ZIP64_EOCD.size]
+        else:
+            record = read_object_range(s3, bucket_name, key, etag,
+                                       record_offset, record_offset + ZIP64_EOCD.size - 1)
+        fields = ZIP64_EOCD.unpack(record)
+        if fields[0] != b'PK\x06\x06':
+            raise ValueError('ZIP64目录记录已损坏')
+        count, directory_size, directory_offset = fields[7:10]
+    
+    if directory_size > app.config['ZIP_MAX_DIRECTORY']:
+        raise ValueError(f'压缩包包含 {count} 个文件，目录过大，无法浏览')
+    if directory_offset >= tail_start:
+        directory = tail[directory_offset - tail_start:directory_offset - tail_start + directory_size]
+    elif directory_size:
+        directory = read_object_range(s3, bucket_name, key, etag,
+                                      directory_offset, directory_offset + directory_size - 1)
+    else:
+        directory = b''
+    if len(directory) != directory_size:
+        raise ValueError('中央目录不完整，压缩包可能已损坏')
+    return parse_zip_central_directory(directory)
+
+def get_zip_directory(s3, bucket_name, key):
+    """返回 (ETag, 压缩包大小, 条目列表)；每次只发一个HEAD确认ETag，目录本身按ETag缓存"""
+    endpoint_url = session.get('s3_config', DEFAULT_CONFIG)['endpoint_url']
+    head = s3.head_object(Bucket=bucket_name, Key=key)
+    etag = head.get('ETag', '').strip('"')
+    cache_key = (endpoint_url, bucket_name, key, etag)
+    entries = zip_directory_cache.get(cache_key)
+    if entries is None:
+        try:
+            entries = read_zip_directory(s3, bucket_name, key, etag, head['ContentLength'])
+        except (struct.error, StopIteration) as e:
+            # 记录被截断或字段长度与内容不符（如ZIP64扩展字段缺项）
+            raise ValueError('压缩包已损坏') from e
+        zip_directory_cache.set(cache_key, entries)
+    return etag, head['ContentLength'], entries
+
+def inflate_zip_entry(body, entry, chunk_size):
+    """边读取边解压压缩包中的一个文件，结束时校验CRC（不一致时中断下载）"""
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if entry['method'] == zipfile.ZIP_DEFLATED else None
+    crc = 0
+    try:
+        for chunk in body.iter_chunks(chunk_size):
+            if decompressor is None:
+                crc = zlib.crc32(chunk, crc)
+                yield chunk
+                continue
+            # 限制每次解压的输出大小，高压缩比的文件也不会一次占用大量内存
+            while chunk:
+                data = decompressor.decompress(chunk, chunk_size)
+                chunk = decompressor.unconsumed_tail
+                crc = zlib.crc32(data, crc)
+                yield data
+        if decompressor is not None:
+            data = decompressor.flush()
+            crc = zlib.crc32(data, crc)
+            yield data
+    finally:
+        body.close()
+    if crc != entry['crc']:
+        raise ValueError(f'{entry["name"]} CRC校验失败')
+
+@app.route('/zip/<bucket_name>/<path:key>')
+def browse_zip(bucket_name, key):
+    """浏览压缩包中的文件（只读取中央目录，不下载整个压缩包）
+
+    参数: path 为压缩包内的文件夹，以/结尾。
+    """
+    path = request.args.get('path', '')
+    parent = key.rpartition('/')[0]
+    try:
+        s3 = get_s3_client()
+        _, archive_size, entries = get_zip_directory(s3, bucket_name, key)
+    except (ClientError, ValueError) as e:
+        flash(f'无法读取压缩包: {str(e)}')
+        return redirect(f'/bucket/{bucket_name}?prefix={parent + "/" if parent else ""}')
+    
+    folders = {}
+    files = []
+    total_size = total_count = 0
+    for entry in entries:
+        if entry['name'].endswith('/'):
+            continue
+        total_size += entry['size']
+        total_count += 1
+        if not entry['name'].startswith(path):
+            continue
+        folder_name, separator, _ = entry['name'][len(path):].partition('/')
+        if separator:
+            folder = folders.setdefault(folder_name, {'name': folder_name, 'path': path + folder_name + '/',
+                                                      'size': 0, 'count': 0})
+            folder['size'] += entry['size']
+            folder['count'] += 1
+        else:
+            files.append(entry)
+    # 只有文件夹条目、没有文件的空文件夹
+    for entry in entries:
+        if entry['name'].endswith('/') and entry['name'].startswith(path) and entry['name'] != path:
+            folder_name = entry['name'][len(path):].partition('/')[0]
+            folders.setdefault(folder_name, {'name': folder_name, 'path': path + folder_name + '/',
+                                             'size': 0, 'count': 0})
+    
+    return render_page('zip.html', bucket_name=bucket_name, key=key, path=path,
+                       folders=sorted(folders.values(), key=lambda folder: folder['name']),
+                       files=sorted(files, key=lambda entry: entry['name']),
+                       total_size=total_size, total_count=total_count, archive_size=archive_size)
+
+@app.route('/zip-entry/<bucket_name>/<path:key>')
+def download_zip_entry(bucket_name, key):
+    """解压下载压缩包中的单个文件：一次范围请求读取本地文件头，再一次范围请求读取压缩数据
+
+    参数: name 为压缩包内的完整路径。
+    """
+    name = request.args.get('name', '')
+    folder = name.rpartition('/')[0]
+    back = f'/zip/{bucket_name}/{quote(key)}?path={quote(folder + "/" if folder else "")}'
+    try:
+        s3 = get_s3_client()
+        etag, _, entries = get_zip_directory(s3, bucket_name, key)
+        entry = next((item for item in entries if item['name'] == name and not name.endswith('/')), None)
+        if entry is None:
+            flash(f'压缩包中没有 {name}')
+            return redirect(back)
+        if entry['flags'] & 0x1:
+            flash(f'{name} 已加密，无法在线解压')
+            return redirect(back)
+        if entry['method'] not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            flash(f'{name} 使用了不支持的压缩方式（{entry["method"]}），请下载整个压缩包')
+            return redirect(back)
+        
+        # 本地文件头中的扩展字段长度可能与中央目录不同，需要先读出来才能确定数据起点
+        header = read_object_range(s3, bucket_name, key, etag,
+                                   entry['offset'], entry['offset'] + ZIP_LOCAL_HEADER.size - 1)
+        if len(header) != ZIP_LOCAL_HEADER.size:
+            raise ValueError('本地文件头已损坏')
+        fields = ZIP_LOCAL_HEADER.unpack(header)
+        if fields[0] != b'PK\x03\x04':
+            raise ValueError('本地文件头已损坏')
+        data_start = entry['offset'] + ZIP_LOCAL_HEADER.size + fields[9] + fields[10]
+        if entry['compressed_size']:
+            body = s3.get_object(Bucket=bucket_name, Key=key, IfMatch=f'"{etag}"',
+                                 Range=f'bytes={data_start}-{data_start + entry["compressed_size"] - 1}')['Body']
+        else:
+            body = StreamingBody(io.BytesIO(b''), 0)
+    except (ClientError, ValueError) as e:
+        flash(f'解压失败: {str(e)}')
+        return redirect(back)
+    
+    filename = name.split('/')[-1]
+    headers = {
+        'Content-Type': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        'Content-Length': str(entry['size']),
+        'Content-Disposition': content_disposition(filename)
+    }
+    response = Response(inflate_zip_entry(body, entry, app.config['DOWNLOAD_CHUNK_SIZE']),
+                        headers=headers, direct_passthrough=True)
+    # 生成器未开始迭代就被丢弃时也要释放连接
+    response.call_on_close(body.close)
+    return response
+
+# 后台任务: job_id -> 任务状态
+# 任务在固定大小的线程池中执行，同时对S3发起的请求不超过 JOB_WORKERS × DELETE_CONCURRENCY
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+_job_executor = None
+
+def job_owner(config=None):
+    """任务所有者：端点加凭证标识，只有同一凭证的session能查询和取消任务"""
+    if config is None:
+        config = session.get('s3_config', DEFAULT_CONFIG)
+    return (config['endpoint_url'],) + credential_identity(config)
+
+def job_snapshot(job):
+    """返回给浏览器的任务状态，不含所有者"""
+    return {name: value for name, value in job.items() if name != 'owner'}
+
+def create_job(kind, description, owner):
+    """登记一个新的后台任务，返回任务状态字典；owner 由 job_owner() 生成"""
+    job = {
+        'id': uuid.uuid4().hex[:12],
+        'owner': owner,
+        'kind': kind,
+        'description': description,
+        'status': 'queued',
+        'done': 0,
+        'failed': 0,
+        'errors': [],
+        'message': '',
+        'cancel_requested': False,
+        'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'finished_at': ''
+    }
+    with _jobs_lock:
+        _jobs[job['id']] = job
+        # 只淘汰已结束的任务，排队和执行中的任务必须保留以便查询和取消
+        finished = [job_id for job_id, item in _jobs.items() if item['status'] not in ('queued', 'running')]
+        for job_id in finished[:max(0, len(_jobs) - app.config['JOB_HISTORY_SIZE'])]:
+            del _jobs[job_id]
+    return job
+
+def begin_job(job):
+    """任务开始执行前调用，排队期间已被取消时返回False"""
+    if job['cancel_requested']:
+        finish_job(job)
+        return False
+    job['status'] = 'running'
+    return True
+
+def finish_job(job, error=None):
+    """根据执行结果设置任务的最终状态"""
+    if error is not None:
+        job['status'] = 'failed'
+        job['message'] = str(error)
+    elif job['cancel_requested']:
+        job['status'] = 'cancelled'
+    else:
+        job['status'] = 'failed' if job['failed'] else 'finished'
+    job['finished_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+def get_job_executor():
+    """任务线程池（首次使用时创建，gunicorn fork 出的每个worker各自拥有）"""
+    global _job_executor
+    with _jobs_lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'],
+                                               thread_name_prefix='job')
+        return _job_executor
+
+def enqueue_job(kind, description, func, *args):
+    """把耗时操作放入后台任务队列，func的第一个参数为任务状态字典"""
+    job = create_job(kind, description, job_owner())
+    
+    def runner():
+        if not begin_job(job):
+            return
+        try:
+            func(job, *args)
+            finish_job(job)
+        except Exception as e:
+            finish_job(job, e)
+    
+    get_job_executor().submit(runner)
+    return job
+
+def cancel_job(job_id, owner):
+    """请求取消任务：排队中的任务不再执行，执行中的任务在处理完当前批次后停止"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None or job['owner'] != owner or job['status'] not in ('queued', 'running'):
+            return False
+        job['cancel_requested'] = True
+        return True
+
+def get_job(job_id, owner):
+    """获取任务状态的快照，不属于owner的任务视为不存在"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None or job['owner'] != owner:
+            return None
+        return dict(job_snapshot(job), errors=list(job['errors']))
+
+def list_jobs(owner):
+    """owner最近的任务（新的在前），不含错误明细"""
+    with _jobs_lock:
+        return [dict(job_snapshot(job), errors=len(job['errors']))
+                for job in reversed(_jobs.values()) if job['owner'] == owner]
+
+def delete_keys_batch(s3, bucket_name, keys):
+    """使用DeleteObjects一次删除最多1000个对象，返回删除失败的键"""
+    response = s3.delete_objects(
+        Bucket=bucket_name,
+        Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+    )
+    return [
+        {'key': error['Key'], 'code': error.get('Code', ''), 'message': error.get('Message', '')}
+        for error in response.get('Errors', [])
+    ]
+
+def delete_prefix(job, s3, bucket_name, prefix, endpoint_url):
+    """删除前缀下的所有对象：逐页列出，每页（最多1000个键）并发批量删除"""
+    max_inflight = app.config['DELETE_CONCURRENCY']
+    # 后台线程没有请求上下文，端点由调用方传入
+    invalidate_listing(bucket_name, prefix, endpoint_url)
+    
+    def collect(future, keys):
+        batch_size = len(keys)
+        try:
+            errors = future.result()
+            failed_keys = {error['key'] for error in errors}
+            unindex_objects(bucket_name, [key for key in keys if key not in failed_keys], endpoint_url)
+        except ClientError as e:
+            errors = [{'key': '', 'code': 'BatchFailed', 'message': str(e)}] * batch_size
+        job['done'] += batch_size - len(errors)
+        job['failed'] += len(errors)
+        # 只保留前1000条错误明细，避免任务记录无限增长
+        job['errors'].extend(errors[:max(0, 1000 - len(job['errors']))])
+    
+    with ThreadPoolExecutor(max_workers=max_inflight) as executor:
+        inflight = {}
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            if job['cancel_requested']:
+                break  # 已提交的批次仍会执行完，保证进度统计准确
+            keys = [obj['Key'] for obj in page.get('Contents', [])]
+            if not keys:
+                continue
+            inflight[executor.submit(delete_keys_batch, s3, bucket_name, keys)] = keys
+            # 限制同时在途的批次，列表翻页与删除并行进行
+            if len(inflight) >= max_inflight:
+                finished, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(future, inflight.pop(future))
+        for future in list(inflight):
+            collect(future, inflight.pop(future))
+    invalidate_listing(bucket_name, prefix, endpoint_url)
+
+@app.route('/jobs')
+def jobs_list():
+    """列出本进程中当前凭证最近的后台任务"""
+    return jsonify({'success': True, 'jobs': list_jobs(job_owner())})
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """查询后台任务进度"""
+    job = get_job(job_id, job_owner())
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    return jsonify(dict(job, success=True))
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    """取消排队中或执行中的任务"""
+    if not cancel_job(job_id, job_owner()):
+        return jsonify({'success': False, 'message': '任务不存在或已结束'}), 404
+    return jsonify({'success': True})
 
 @app.route('/delete/<bucket_name>/<path:key>')
 def delete_file(bucket_name, key):
+    # 获取当前前缀
+    prefix = '/'.join(key.split('/')[:-1]) + '/' if '/' in key else ''
+    
     try:
         s3 = get_s3_client()
         
         # 检查是否是文件夹
         if key.endswith('/'):
-            # 删除文件夹及其内容
-            paginator = s3.get_paginator('list_objects_v2')
-            for page in paginator.paginate(Bucket=bucket_name, Prefix=key):
-                if 'Contents' in page:
-                    for obj in page['Contents']:
-                        s3.delete_object(Bucket=bucket_name, Key=obj['Key'])
-            flash(f'文件夹 {key} 及其内容已删除')
+            # 删除文件夹及其内容：不超过一页的直接批量删除，更大的文件夹转入后台任务
+            first_page = s3.list_objects_v2(Bucket=bucket_name, Prefix=key)
+            if first_page.get('IsTruncated'):
+                endpoint_url = session.get('s3_config', DEFAULT_CONFIG)['endpoint_url']
+                job = enqueue_job('delete', f'删除文件夹 {bucket_name}/{key}', delete_prefix,
+                                  s3, bucket_name, key, endpoint_url)
+                flash(f'文件夹 {key} 正在后台删除')
+                return redirect(f'/bucket/{bucket_name}?prefix={prefix}&job={job["id"]}')
+            
+            keys = [obj['Key'] for obj in first_page.get('Contents', [])]
+            errors = delete_keys_batch(s3, bucket_name, keys) if keys else []
+            invalidate_listing(bucket_name, key)
+            failed_keys = {error['key'] for error in errors}
+            unindex_objects(bucket_name, [item for item in keys if item not in failed_keys])
+            if errors:
+                flash(f'文件夹 {key} 中有 {len(errors)} 个对象删除失败: {errors[0]["key"]} {errors[0]["message"]}')
+            else:
+                flash(f'文件夹 {key} 及其内容已删除')
         else:
             # 删除文件
             s3.delete_object(Bucket=bucket_name, Key=key)
+            invalidate_listing(bucket_name, key)
+            unindex_objects(bucket_name, [key])
             flash(f'文件 {key} 删除成功')
     except ClientError as e:
         flash(f'删除失败: {str(e)}')
     
-    # 获取当前前缀
-    prefix = '/'.join(key.split('/')[:-1]) + '/' if '/' in key else ''
     return redirect(f'/bucket/{bucket_name}?prefix={prefix}')
 
+# 正在统计的文件夹，避免同一前缀被重复列举
+_folder_stats_pending = set()
+# 每次写操作加一；统计期间发生过写操作时不写入缓存，避免缓存旧的结果
+_folder_stats_generation = 0
+_folder_stats_lock = threading.Lock()
+_folder_stats_executor = None
+
+def get_folder_stats_executor():
+    """文件夹统计线程池（首次使用时创建）"""
+    global _folder_stats_executor
+    with _folder_stats_lock:
+        if _folder_stats_executor is None:
+            _folder_stats_executor = ThreadPoolExecutor(max_workers=app.config['FOLDER_STATS_WORKERS'],
+                                                        thread_name_prefix='folder-stats')
+        return _folder_stats_executor
+
+def walk_prefix_totals(s3, bucket_name, prefix):
+    """逐页列出前缀下的全部对象，返回 (总大小, 对象数)"""
+    size = count = 0
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            size += obj['Size']
+            count += 1
+    return size, count
+
+def scan_folder_stats(s3, endpoint_url, identity, bucket_name, prefix):
+    """统计一个文件夹：先列出第一层，各子文件夹再并行列举，全部完成后写入缓存
+
+    在线程池中执行，子任务通过完成回调汇总，线程之间不互相等待。
+    子文件夹的统计结果同样写入缓存，进入子文件夹时可以直接显示。
+    identity 为 credential_identity()，后台线程中没有session。
+    任何异常（包括连接错误）都只让本次统计失败，必须走到finish()，否则前缀会一直停留在统计中。
+    """
+    executor = get_folder_stats_executor()
+    generation = _folder_stats_generation
+    total = {'size': 0, 'count': 0, 'remaining': 0, 'failed': False}
+    lock = threading.Lock()
+    
+    def stats_key(folder):
+        return (endpoint_url, bucket_name, folder) + identity
+    
+    def finish():
+        if not total['failed'] and generation == _folder_stats_generation:
+            folder_stats_cache.set(stats_key(prefix), {'size': total['size'], 'count': total['count']})
+        with _folder_stats_lock:
+            _folder_stats_pending.discard(stats_key(prefix))
+    
+    try:
+        children = []
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, Delimiter='/'):
+            for obj in page.get('Contents', []):
+                total['size'] += obj['Size']
+                total['count'] += 1
+            children.extend(item['Prefix'] for item in page.get('CommonPrefixes', []))
+    except Exception:
+        total['failed'] = True
+        finish()
+        return
+    
+    to_walk = []
+    for child in children:
+        cached = folder_stats_cache.get(stats_key(child))
+        if cached is not None:
+            total['size'] += cached['size']
+            total['count'] += cached['count']
+        else:
+            to_walk.append(child)
+    if not to_walk:
+        finish()
+        return
+    total['remaining'] = len(to_walk)
+    
+    def child_done(child, future):
+        try:
+            size, count = future.result()
+            if generation == _folder_stats_generation:
+                folder_stats_cache.set(stats_key(child), {'size': size, 'count': count})
+        except Exception:
+            size = count = 0
+            total['failed'] = True
+        with lock:
+            total['size'] += size
+            total['count'] += count
+            total['remaining'] -= 1
+            done = total['remaining'] == 0
+        if done:
+            finish()
+    
+    for child in to_walk:
+        future = executor.submit(walk_prefix_totals, s3, bucket_name, child)
+        future.add_done_callback(lambda future, child=child: child_done(child, future))
+
+def get_folder_stats(s3, bucket_name, prefixes):
+    """返回已有的文件夹统计，并为缺失的前缀启动后台统计；第二个返回值是尚在统计中的前缀
+
+    调用前需先用 check_bucket_access 确认权限。
+    """
+    config = session.get('s3_config', DEFAULT_CONFIG)
+    endpoint_url = config['endpoint_url']
+    identity = credential_identity(config)
+    stats = {}
+    pending = []
+    index_status = metadata_index.status(endpoint_url, bucket_name)
+    for prefix in prefixes:
+        cache_key = (endpoint_url, bucket_name, prefix) + identity
+        cached = folder_stats_cache.get(cache_key)
+        if cached is None and index_status is not None and index_status['status'] == 'ready':
+            # 已建立完整索引时直接在本地汇总，不必列举S3
+            size, count = metadata_index.prefix_totals(endpoint_url, bucket_name, prefix)
+            cached = {'size': size, 'count': count}
+            folder_stats_cache.set(cache_key, cached)
+        if cached is not None:
+            stats[prefix] = cached
+            continue
+        pending.append(prefix)
+        with _folder_stats_lock:
+            if cache_key in _folder_stats_pending:
+                continue
+            _folder_stats_pending.add(cache_key)
+        get_folder_stats_executor().submit(scan_folder_stats, s3, endpoint_url, identity, bucket_name, prefix)
+    return stats, pending
+
+def start_index_job(s3, bucket_name, endpoint_url):
+    """把存储桶的全量索引扫描放入后台任务队列"""
+    metadata_index.mark_queued(endpoint_url, bucket_name)
+    return enqueue_job('index', f'建立索引 {bucket_name}', metadata_index.scan, s3, endpoint_url, bucket_name)
+
+def check_bucket_access(s3, bucket_name, config=None):
+    """确认当前凭证可以列出存储桶，无权访问时抛出ClientError
+
+    本地索引和统计缓存不按凭证区分，返回其中的内容之前先用一次 MaxKeys=1 的列表请求确认权限，
+    结果按凭证缓存一分钟。
+    """
+    if config is None:
+        config = session.get('s3_config', DEFAULT_CONFIG)
+    cache_key = (config['endpoint_url'], bucket_name) + credential_identity(config)
+    if bucket_access_cache.get(cache_key) is None:
+        s3.list_objects_v2(Bucket=bucket_name, MaxKeys=1)
+        bucket_access_cache.set(cache_key, True)
+
+def search_index(bucket_name, query, mode, limit):
+    """在索引中搜索，返回 (索引状态, 结果, 用时毫秒)；索引不存在时自动开始建立"""
+    endpoint_url = session.get('s3_config', DEFAULT_CONFIG)['endpoint_url']
+    check_bucket_access(get_s3_client(), bucket_name)
+    index_status = metadata_index.status(endpoint_url, bucket_name)
+    job = None
+    if index_status is None:
+        job = start_index_job(get_s3_client(), bucket_name, endpoint_url)
+        return None, [], 0, job
+    started = time.perf_counter()
+    results = metadata_index.search(endpoint_url, bucket_name, query, mode, limit) if query else []
+    return index_status, results, round((time.perf_counter() - started) * 1000, 1), job
+
+@app.route('/search/<bucket_name>')
+def search_objects(bucket_name):
+    """在整个存储桶内按键搜索（查询本地索引，不访问S3）"""
+    query = request.args.get('q', '').strip()
+    mode = 'glob' if request.args.get('mode') == 'glob' else 'substring'
+    job_id = request.args.get('job', '')
+    try:
+        index_status, results, took_ms, job = search_index(bucket_name, query, mode,
+                                                           app.config['SEARCH_RESULT_LIMIT'])
+    except (ClientError, BotoCoreError) as e:
+        flash(f'搜索失败: {str(e)}')
+        return redirect(f'/bucket/{bucket_name}')
+    if job is not None:
+        job_id = job['id']
+    if index_status and index_status['scanned_at']:
+        index_status['scanned_at'] = datetime.fromtimestamp(index_status['scanned_at']).strftime('%Y-%m-%d %H:%M:%S')
+    return render_page('search.html', bucket_name=bucket_name, query=query, mode=mode,
+                       results=results, took_ms=took_ms, index_status=index_status, job_id=job_id,
+                       result_limit=app.config['SEARCH_RESULT_LIMIT'])
+
+@app.route('/index/<bucket_name>/rebuild', methods=['POST'])
+def rebuild_index(bucket_name):
+    """重新全量扫描存储桶"""
+    endpoint_url = session.get('s3_config', DEFAULT_CONFIG)['endpoint_url']
+    s3 = get_s3_client()
+    try:
+        # 没有权限的会话不能触发扫描，否则失败的扫描会把已就绪的索引标记为失败
+        check_bucket_access(s3, bucket_name)
+    except (ClientError, BotoCoreError) as e:
+        flash(f'重建索引失败: {str(e)}')
+        return redirect(f'/bucket/{bucket_name}')
+    job = start_index_job(s3, bucket_name, endpoint_url)
+    return redirect(url_for('search_objects', bucket_name=bucket_name, q=request.args.get('q', ''),
+                            mode=request.args.get('mode', 'substring'), job=job['id']))
+
+# 已读取的分享令牌密钥: 密钥文件路径 -> 密钥
+_share_token_keys = {}
+
+def load_share_token_key_file(path):
+    """读取分享令牌密钥文件，不存在时生成32字节随机密钥（权限0600）
+
+    先写入临时文件再用 os.link 放到目标路径，目标已存在时链接失败：
+    多个worker同时启动时只有一个进程的密钥被采用，其余进程读取它。
+    """
+    try:
+        with open(path, 'rb') as f:
+            key = f.read()
+    except FileNotFoundError:
+        key = secrets.token_bytes(32)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}'
+        with os.fdopen(os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600), 'wb') as f:
+            f.write(key)
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            with open(path, 'rb') as f:
+                key = f.read()
+        finally:
+            os.remove(tmp_path)
+    return key
+
+def share_token_key():
+    """分享令牌的HMAC密钥，没有可用的密钥时返回None，此时既不签发也不接受任何令牌
+
+    secret_key 写在源码里、是公开的，不能用它签名或派生；
+    SHARE_TOKEN_KEY 未配置时使用 SHARE_TOKEN_KEY_FILE 中随机生成的密钥。
+    """
+    key = app.config['SHARE_TOKEN_KEY']
+    if key is None:
+        path = app.config['SHARE_TOKEN_KEY_FILE']
+        key = _share_token_keys.get(path)
+        if key is None:
+            key = _share_token_keys[path] = load_share_token_key_file(path)
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    if len(key) < 16 or key == app.secret_key.encode('utf-8'):
+        return None
+    return key
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def make_share_token(bucket_name, key, expires_at, byte_limit=None, max_downloads=None, credential_ref=None):
+    """生成分享令牌: base64url(载荷).base64url(HMAC-SHA256前16字节)
+
+    载荷是紧凑的JSON数组 [bucket, key, 过期时间戳, 字节上限, 下载次数上限, 凭证引用]，
+    末尾为0或空（不限制、无引用）的字段省略；任何字段被改动签名都会失效。
+    凭证引用指向 share_credentials 中保存的创建者凭证，令牌本身不含任何密钥。
+    没有可用的签名密钥时抛出RuntimeError。
+    """
+    signing_key = share_token_key()
+    if signing_key is None:
+        raise RuntimeError('未配置分享令牌密钥')
+    payload = [bucket_name, key, int(expires_at), int(byte_limit or 0), int(max_downloads or 0),
+               credential_ref or 0]
+    while payload[-1] == 0 and len(payload) > 3:
+        payload.pop()
+    body = _b64encode(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    signature = hmac.new(signing_key, body.encode('ascii'), hashlib.sha256).digest()[:16]
+    return f'{body}.{_b64encode(signature)}'
+
+def verify_share_token(token):
+    """校验分享令牌，有效时返回分享信息字典，伪造、损坏或过期时返回None
+
+    只做本地计算，不访问S3；签名使用恒定时间比较。
+    """
+    body, _, signature = token.partition('.')
+    signing_key = share_token_key()
+    if not body or not signature or signing_key is None:
+        return None
+    expected = hmac.new(signing_key, body.encode('ascii', 'replace'), hashlib.sha256).digest()[:16]
+    try:
+        if not hmac.compare_digest(_b64decode(signature), expected):
+            return None
+        payload = json.loads(_b64decode(body)) + [0, 0, 0]
+        bucket_name, key, expires_at, byte_limit, max_downloads, credential_ref = payload[:6]
+        if time.time() > expires_at:
+            return None
+    except (ValueError, TypeError):
+        return None
+    return {
+        'id': signature,  # 签名唯一标识一个分享链接
+        'bucket': bucket_name,
+        'key': key,
+        'expires_at': expires_at,
+        'byte_limit': byte_limit or None,
+        'max_downloads': max_downloads or None,
+        'credential_ref': credential_ref or None
+    }
+
+class MemoryLimitStore:
+    """进程内的限流计数（令牌桶和下载次数），gunicorn多worker时每个进程各自计数"""
+    
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()  # name -> (tokens, updated_at)
+        self._counters = {}  # name -> (count, expires_at)
+        self._lock = threading.Lock()
+    
+    def take(self, name, rate, burst):
+        """从令牌桶取一个令牌，返回 (是否允许, 需要等待的秒数)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(name, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[name] = (tokens, now)
+            self._buckets.move_to_end(name)
+            # 最久未出现的来源早已回满令牌，淘汰它们不影响限流结果
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+    
+    def consume(self, name, limit, expires_at, amount=1):
+        """计数增加amount，超过limit时不计数并返回False"""
+        with self._lock:
+            count, _ = self._counters.get(name, (0, expires_at))
+            if count + amount > limit:
+                return False
+            self._counters[name] = (count + amount, expires_at)
+            if len(self._counters) > self.max_entries:
+                now = time.time()
+                for stale in [n for n, (_, exp) in self._counters.items() if exp < now]:
+                    del self._counters[stale]
+        return True
+
+class SQLiteLimitStore:
+    """保存在本地SQLite文件中的限流计数，同一台机器上的所有worker进程共用"""
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+    
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets '
+                         '(name TEXT PRIMARY KEY, tokens REAL, updated_at REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters '
+                         '(name TEXT PRIMARY KEY, count INTEGER, expires_at REAL)')
+            self._local.conn = conn
+        return conn
+    
+    def _prune(self, conn, now):
+        # 偶尔清理过期计数和早已回满的令牌桶，控制文件大小
+        self._calls += 1
+        if self._calls % 1000 == 0:
+            conn.execute('DELETE FROM counters WHERE expires_at < ?', (now,))
+            conn.execute('DELETE FROM buckets WHERE updated_at < ?', (now - 3600,))
+    
+    def take(self, name, rate, burst):
+        now = time.time()
+        conn = self._connect()
+        # BEGIN IMMEDIATE 取得写锁，读-改-写在多进程间是原子的
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM buckets WHERE name = ?', (name,)).fetchone()
+            tokens, updated_at = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)', (name, tokens, now))
+            self._prune(conn, now)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, 0 if allowed else (1 - tokens) / rate
+    
+    def consume(self, name, limit, expires_at, amount=1):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT count FROM counters WHERE name = ?', (name,)).fetchone()
+            count = row[0] if row else 0
+            allowed = count + amount <= limit
+            if allowed:
+                conn.execute('INSERT OR REPLACE INTO counters VALUES (?, ?, ?)', (name, count + amount, expires_at))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed
+
+def create_limit_store():
+    if app.config['SHARE_LIMIT_BACKEND'] == 'sqlite':
+        return SQLiteLimitStore(app.config['SHARE_LIMIT_DB'])
+    return MemoryLimitStore()
+
+class ShareCredentialStore:
+    """分享链接使用的S3凭证，保存在本地SQLite文件中，同一台机器上的所有worker进程共用
+
+    每个分享链接一行，引用是随机生成的，行中同时记录分享的存储桶和对象键：
+    即使令牌中的对象键被改动，这组凭证也只能用来读取创建链接时指定的那一个对象。过期后被清理。
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._calls = 0
+    
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Secret Key 以明文保存，文件只允许服务进程读写
+            os.close(os.open(self.path, os.O_CREAT | os.O_WRONLY, 0o600))
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS share_credentials '
+                         '(ref TEXT PRIMARY KEY, endpoint_url TEXT, access_key TEXT, secret_key TEXT, '
+                         'bucket TEXT, key TEXT, expires_at REAL)')
+            self._local.conn = conn
+        return conn
+    
+    def save(self, config, bucket_name, key, expires_at):
+        """为一个分享链接保存凭证，返回引用"""
+        ref = secrets.token_urlsafe(16)
+        conn = self._connect()
+        conn.execute('INSERT INTO share_credentials VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     (ref, config['endpoint_url'], config['access_key'], config['secret_key'],
+                      bucket_name, key, expires_at))
+        self._calls += 1
+        if self._calls % 100 == 0:
+            conn.execute('DELETE FROM share_credentials WHERE expires_at < ?', (time.time(),))
+        return ref
+    
+    def load(self, ref, bucket_name, key):
+        """按引用取出S3配置，引用不存在、已过期或不是为这个对象保存的时返回None"""
+        row = self._connect().execute(
+            'SELECT endpoint_url, access_key, secret_key FROM share_credentials '
+            'WHERE ref = ? AND bucket = ? AND key = ? AND expires_at >= ?',
+            (ref, bucket_name, key, time.time())).fetchone()
+        if row is None:
+            return None
+        return {'endpoint_url': row[0], 'access_key': row[1], 'secret_key': row[2]}
+
+def share_s3_config(share):
+    """分享链接访问S3使用的配置：创建者保存在服务器上的凭证，没有可用的凭证时返回None"""
+    if share['credential_ref'] is None:
+        return None
+    return share_credentials.load(share['credential_ref'], share['bucket'], share['key'])
+
+def check_share_limits(share):
+    """检查分享链接的请求频率，超限时返回应直接发送的响应，否则返回None
+
+    访问者IP取自 request.remote_addr，部署在反向代理之后时需设置 TRUSTED_PROXY_COUNT。
+    下载次数在 serve_limited_share 中按实际输出的字节数计算。
+    """
+    checks = [
+        (f'token:{share["id"]}', app.config['SHARE_TOKEN_RATE'], app.config['SHARE_TOKEN_BURST']),
+        (f'ip:{request.remote_addr}', app.config['SHARE_IP_RATE'], app.config['SHARE_IP_BURST'])
+    ]
+    for name, rate, burst in checks:
+        allowed, retry_after = share_limits.take(name, rate, burst)
+        if not allowed:
+            return Response('请求过于频繁，请稍后再试', status=429,
+                            headers={'Retry-After': str(math.ceil(retry_after))},
+                            mimetype='text/plain')
+    return None
+
+def limit_object_request(params, byte_limit):
+    """把get_object参数限制在对象的前byte_limit个字节内，区间完全超出时返回False"""
+    byte_range = request.range
+    start, stop = 0, byte_limit
+    if 'Range' in params and byte_range.ranges[0][0] >= 0:
+        start, stop = byte_range.ranges[0]
+        if start >= byte_limit:
+            return False
+        stop = byte_limit if stop is None else min(stop, byte_limit)
+    # 后缀区间（bytes=-N）需要知道对象大小才能换算，按RFC允许的方式忽略
+    params['Range'] = f'bytes={start}-{stop - 1}'
+    return True
+
+def serve_limited_share(s3, share):
+    """经由本服务输出有大小上限或下载次数限制的分享文件
+
+    大小上限: 只输出对象的前byte_limit个字节，对下载方而言资源就是这段截断后的内容。
+    下载次数: 额度为 次数 × 文件大小 个字节，每个请求按本次输出的字节数扣除，
+    从中间开始的区间、分段下载都会被计入；额度不足以完成本次请求时拒绝。
+    """
+    bucket_name, key, byte_limit = share['bucket'], share['key'], share['byte_limit']
+    params = s3_object_request_params(bucket_name, key)
+    client_range = 'Range' in params
+    if byte_limit and not limit_object_request(params, byte_limit):
+        return Response(status=416, headers={'Content-Range': f'bytes */{byte_limit}'})
+    try:
+        obj = s3.get_object(**params)
+    except ClientError as e:
+        error_status = s3_error_status(e)
+        if error_status is None:
+            raise
+        return Response(status=error_status[0], headers=error_status[1])
+    
+    body = obj['Body']
+    status, headers = s3_object_headers(obj, key)
+    content_range = headers.pop('Content-Range', '')
+    total = int(content_range.rpartition('/')[2]) if content_range else obj['ContentLength']
+    if byte_limit:
+        total = min(total, byte_limit)
+    
+    if share['max_downloads']:
+        if not share_limits.consume(f'download-bytes:{share["id"]}', share['max_downloads'] * total,
+                                    share['expires_at'], obj['ContentLength']):
+            body.close()
+            return redirect('/share-expired')
+    
+    if client_range and content_range:
+        # 总长度按截断后的大小报告，保持断点续传的偏移一致
+        served = content_range.partition('/')[0]
+        headers['Content-Range'] = f'{served}/{total}'
+    else:
+        status = 200
+    response = Response(stream_s3_body(body, app.config['DOWNLOAD_CHUNK_SIZE']),
+                        status=status, headers=headers, direct_passthrough=True)
+    response.call_on_close(body.close)
+    return response
+
 @app.route('/generate-share-url/<bucket_name>', methods=['POST'])
 def generate_share_url(bucket_name):
     key = request.form.get('key')
+    if not key:
+        return jsonify({'success': False, 'message': '缺少文件路径'}), 400
     expires_in = int(request.form.get('expires_in', 60))
+    byte_limit_mb = request.form.get('byte_limit_mb', type=float)
+    max_downloads = request.form.get('max_downloads', type=int)
     expires_unit = request.form.get('expires_unit', 'minutes')
     
     # 将时间转换为秒
@@ -890,14 +3879,22 @@ def generate_share_url(bucket_name):
     
     # 计算过期时间戳
     expires_at = datetime.now() + timedelta(seconds=expires_seconds)
-    expires_timestamp = expires_at.timestamp()
+    byte_limit = int(byte_limit_mb * 1024 * 1024) if byte_limit_mb and byte_limit_mb > 0 else None
     
-    # 生成我们的代理URL
-    proxy_url = url_for('share_file', 
-                       bucket_name=bucket_name, 
-                       key=key, 
-                       expires=expires_timestamp, 
-                       _external=True)
+    # 生成带签名令牌的代理URL，桶名、文件路径、过期时间和大小上限都无法被篡改
+    max_downloads = max_downloads if max_downloads and max_downloads > 0 else None
+    if share_token_key() is None:
+        return jsonify({'success': False, 'message': '未配置分享令牌密钥（SHARE_TOKEN_KEY），无法生成分享链接'}), 503
+    # 只能分享自己有权读取的文件，否则代理模式可能把别人缓存下来的内容发给访问者
+    config = session.get('s3_config', DEFAULT_CONFIG)
+    try:
+        get_s3_client(config).head_object(Bucket=bucket_name, Key=key)
+    except (ClientError, BotoCoreError) as e:
+        return jsonify({'success': False, 'message': f'无法读取文件: {str(e)}'}), 404
+    # 访问者使用创建者的凭证读取文件，凭证留在服务器上，令牌里只有引用
+    credential_ref = share_credentials.save(config, bucket_name, key, expires_at.timestamp())
+    token = make_share_token(bucket_name, key, expires_at.timestamp(), byte_limit, max_downloads, credential_ref)
+    proxy_url = url_for('share_file', token=token, _external=True)
     
     return jsonify({
         'success': True,
@@ -905,38 +3902,385 @@ def generate_share_url(bucket_name):
         'expires_at': expires_at.strftime('%Y-%m-%d %H:%M:%S')
     })
 
-@app.route('/share/<bucket_name>/<path:key>')
-def share_file(bucket_name, key):
-    """分享文件代理路由"""
-    # 获取过期时间参数
-    expires = request.args.get('expires')
+class ShareDiskCache:
+    """热门分享文件的本地磁盘缓存（多进程共用同一目录）
+
+    每个对象保存为 <hash>.data 和 <hash>.json（ETag、类型、修改时间等），
+    写入先落到 .part 临时文件再原子改名，O_EXCL 创建的 .part 同时充当跨进程的填充锁；
+    进程崩溃留下的 .part 超过 fill_timeout 秒未被写入时视为失效，由下一次填充删除。
+    文件的修改时间即最近访问时间，超出容量时删除最久未访问的对象。
+    """
     
-    if not expires:
-        return redirect('/share-expired')
+    def __init__(self, directory, max_bytes, max_object_size, revalidate_after, fill_timeout):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_object_size = max_object_size
+        self.revalidate_after = revalidate_after
+        self.fill_timeout = fill_timeout
+        self._filling = set()  # 本进程正在填充的对象
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'revalidations': 0, 'stale': 0,
+                       'fills': 0, 'evictions': 0, 'reclaimed': 0}
     
-    # 检查链接是否过期
-    try:
-        expires_time = datetime.fromtimestamp(float(expires))
-        if datetime.now() > expires_time:
-            return redirect('/share-expired')
-    except:
-        return redirect('/share-expired')
+    def _path(self, cache_key):
+        digest = hashlib.sha256('\0'.join(cache_key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest)
     
-    try:
-        # 生成新的预签名URL（短期有效，用于实际下载）
-        s3 = get_s3_client()
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+    
+    def _remove(self, path):
+        for suffix in ('.data', '.json'):
+            try:
+                os.remove(path + suffix)
+            except OSError:
+                pass
+    
+    def lookup(self, s3, cache_key):
+        """返回 (数据文件路径, 元数据)；未缓存或已过期时返回None"""
+        path = self._path(cache_key)
+        try:
+            with open(path + '.json', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            self._count('misses')
+            return None
+        
+        if time.time() - meta['checked_at'] > self.revalidate_after:
+            # 只用HEAD比较ETag，对象未变化时不重新下载
+            self._count('revalidations')
+            head = s3.head_object(Bucket=cache_key[1], Key=cache_key[2])
+            if head.get('ETag') != meta['etag']:
+                self._count('stale')
+                self._remove(path)
+                return None
+            meta['checked_at'] = time.time()
+            self._write_meta(path, meta)
+        
+        try:
+            os.utime(path + '.data')  # 记录访问时间，供LRU淘汰使用
+        except OSError:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return path + '.data', meta
+    
+    def _write_meta(self, path, meta):
+        tmp_path = f'{path}.json.{os.getpid()}.{threading.get_ident()}'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path + '.json')
+    
+    def fill_async(self, s3, cache_key):
+        """在后台线程中把对象下载到缓存，同一对象同时只有一个进程在下载"""
+        with self._lock:
+            if cache_key in self._filling:
+                return
+            self._filling.add(cache_key)
+        threading.Thread(target=self._fill, args=(s3, cache_key), daemon=True).start()
+    
+    def _lock_part(self, part_path):
+        """以 O_EXCL 创建 .part 作为填充锁，返回文件描述符；其他进程正在下载时返回None"""
+        try:
+            return os.open(part_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        except FileExistsError:
+            pass
+        try:
+            # 下载过程中 .part 不断被写入，长时间未修改说明持有者已经不在了
+            if time.time() - os.stat(part_path).st_mtime < self.fill_timeout:
+                return None
+            os.remove(part_path)
+            self._count('reclaimed')
+        except OSError:
+            pass  # 刚好被持有者改名或删除
+        try:
+            return os.open(part_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        except FileExistsError:
+            return None  # 其他进程抢先重建了锁
+    
+    def _fill(self, s3, cache_key):
+        path = self._path(cache_key)
+        part_path = path + '.part'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd = self._lock_part(part_path)
+            if fd is None:
+                return  # 其他进程正在下载
+            try:
+                head = s3.head_object(Bucket=cache_key[1], Key=cache_key[2])
+                if head['ContentLength'] > self.max_object_size:
+                    return
+                with os.fdopen(fd, 'wb') as f:
+                    fd = None
+                    s3.download_fileobj(cache_key[1], cache_key[2], f, Config=get_transfer_config())
+                # 下载期间对象被覆盖时，分片可能来自不同版本，丢弃本次结果
+                if s3.head_object(Bucket=cache_key[1], Key=cache_key[2]).get('ETag') != head['ETag']:
+                    return
+                os.replace(part_path, path + '.data')
+                self._write_meta(path, {
+                    'etag': head['ETag'],
+                    'content_type': head.get('ContentType') or 'application/octet-stream',
+                    'last_modified': head['LastModified'].timestamp(),
+                    'size': head['ContentLength'],
+                    'checked_at': time.time()
+                })
+                self._count('fills')
+            finally:
+                if fd is not None:
+                    os.close(fd)
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+            self.enforce_limit()
+        except Exception:
+            # 缓存失败不影响分享，下次请求会重试
+            pass
+        finally:
+            with self._lock:
+                self._filling.discard(cache_key)
+    
+    def enforce_limit(self):
+        """删除最久未访问的对象，直到总大小不超过上限"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.data'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path[:-len('.data')]))
+                    total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+            self._count('evictions')
+    
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses'] + stats['stale']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+def serve_shared_object(s3, config, bucket_name, key):
+    """代理模式下输出分享文件：命中磁盘缓存时用sendfile发送，否则边转发S3边在后台填充缓存
+
+    缓存键带上凭证标识：命中缓存时不访问S3，只有同一组凭证创建的链接才能用到这份缓存。
+    """
+    cache_key = (config['endpoint_url'], bucket_name, key) + credential_identity(config)
+    cached = share_cache.lookup(s3, cache_key)
+    if cached is not None:
+        data_path, meta = cached
+        try:
+            # send_file 交给WSGI服务器的 file_wrapper（gunicorn 下即 sendfile），并处理Range和条件请求
+            response = send_file(data_path, mimetype=meta['content_type'], conditional=True,
+                                 etag=meta['etag'].strip('"'), last_modified=meta['last_modified'],
+                                 max_age=0)
+            filename = key.split('/')[-1]
+            response.headers['Content-Disposition'] = content_disposition(filename)
+            return response
+        except OSError:
+            pass  # 刚好被其他进程淘汰，退回直接转发
+    
+    share_cache.fill_async(s3, cache_key)
+    return serve_s3_object(s3, bucket_name, key)
+
+def presigned_download_url(config, bucket_name, key):
+    """获取对象的预签名下载URL，有效期内重复分享同一文件时直接复用"""
+    cache_key = (config['endpoint_url'], config['access_key'], config['secret_key'], bucket_name, key)
+    url = presign_cache.get(cache_key)
+    if url is None:
+        s3 = get_s3_client(config)
         url = s3.generate_presigned_url(
             'get_object',
             Params={
                 'Bucket': bucket_name,
                 'Key': key
             },
-            ExpiresIn=300  # 5分钟有效期
+            ExpiresIn=app.config['SHARE_PRESIGN_EXPIRES']
         )
-        return redirect(url)
+        presign_cache.set(cache_key, url)
+    return url
+
+@app.route('/share/<token>')
+def share_file(token):
+    """分享文件代理路由"""
+    # 先在本地校验签名和过期时间，伪造或过期的链接不会产生任何S3请求
+    share = verify_share_token(token)
+    if share is None:
+        return redirect('/share-expired')
+    # 限流和下载次数同样在访问S3之前检查
+    limited = check_share_limits(share)
+    if limited is not None:
+        return limited
+    bucket_name, key = share['bucket'], share['key']
+    config = share_s3_config(share)
+    if config is None:
+        return redirect('/share-expired')
+    
+    try:
+        if share['byte_limit'] or share['max_downloads']:
+            # 有大小上限或次数限制的链接必须经由本服务输出，才能截断内容和统计输出的字节数；
+            # 跳转到预签名URL后，该URL在有效期内可以被任意重复使用
+            return serve_limited_share(get_s3_client(config), share)
+        if app.config['SHARE_PROXY']:
+            return serve_shared_object(get_s3_client(config), config, bucket_name, key)
+        # 跳转到短期有效的预签名URL（缓存复用，热门链接不必每次重新签名）
+        # 浏览器跟随重定向时会把Range/If-None-Match等请求头原样发给S3，
+        # 因此断点续传、音频拖动和304协商由对象存储直接处理
+        return redirect(presigned_download_url(config, bucket_name, key))
     except ClientError:
         return redirect('/share-expired')
 
+# JSON API
+@app.route('/api/buckets')
+def api_buckets():
+    """列出存储桶"""
+    try:
+        s3 = get_s3_client()
+        response = s3.list_buckets()
+        return jsonify({
+            'success': True,
+            'buckets': [
+                {'name': bucket['Name'], 'created': bucket['CreationDate'].isoformat()}
+                for bucket in response['Buckets']
+            ]
+        })
+    except ClientError as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/buckets/<bucket_name>/objects')
+def api_objects(bucket_name):
+    """按游标分页列出对象：每次请求对应一次list_objects_v2调用，直接输出JSON
+    
+    参数: prefix, cursor（上一页返回的next_cursor）, limit（1-1000）, delimiter（默认"/"，为空时递归列出）
+    """
+    prefix = request.args.get('prefix', '')
+    cursor = request.args.get('cursor', '')
+    delimiter = request.args.get('delimiter', '/')
+    limit = min(max(1, request.args.get('limit', 1000, type=int)), 1000)
+    
+    params = {'Bucket': bucket_name, 'Prefix': prefix, 'MaxKeys': limit}
+    if delimiter:
+        params['Delimiter'] = delimiter
+    if cursor:
+        params['ContinuationToken'] = cursor
+    
+    try:
+        s3 = get_s3_client()
+        page = s3.list_objects_v2(**params)
+    except ClientError as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+    
+    return jsonify({
+        'success': True,
+        'prefixes': [item['Prefix'] for item in page.get('CommonPrefixes', [])],
+        'objects': [
+            {
+                'key': obj['Key'],
+                'size': obj['Size'],
+                'etag': obj.get('ETag', '').strip('"'),
+                'last_modified': obj['LastModified'].isoformat()
+            }
+            for obj in page.get('Contents', [])
+        ],
+        'next_cursor': page.get('NextContinuationToken', '') if page.get('IsTruncated') else ''
+    })
+
+@app.route('/api/buckets/<bucket_name>/folder-stats')
+def api_folder_stats(bucket_name):
+    """文件夹的递归大小和对象数
+
+    参数: prefix（可重复，最多100个）。未统计完成的前缀在后台开始统计并列入pending，稍后再次请求即可。
+    """
+    prefixes = request.args.getlist('prefix')[:100]
+    try:
+        s3 = get_s3_client()
+        # 统计在后台按本次凭证列举，缓存和索引中的结果也只给能列出该存储桶的凭证
+        check_bucket_access(s3, bucket_name)
+        stats, pending = get_folder_stats(s3, bucket_name, prefixes)
+    except (ClientError, BotoCoreError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+    return jsonify({'success': True, 'stats': stats, 'pending': pending})
+
+@app.route('/api/buckets/<bucket_name>/search')
+def api_search(bucket_name):
+    """在本地索引中搜索对象
+
+    参数: q（查询内容）, mode（substring 或 glob）, limit（1-1000）
+    索引尚未建立时开始建立并返回202和任务ID。
+    """
+    query = request.args.get('q', '').strip()
+    mode = 'glob' if request.args.get('mode') == 'glob' else 'substring'
+    limit = min(max(1, request.args.get('limit', 100, type=int)), 1000)
+    if not query:
+        return jsonify({'success': False, 'message': '缺少查询内容'}), 400
+    try:
+        index_status, results, took_ms, job = search_index(bucket_name, query, mode, limit)
+    except (ClientError, BotoCoreError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+    if job is not None:
+        return jsonify({'success': False, 'message': '正在建立索引，请稍后重试', 'job_id': job['id']}), 202
+    
+    return jsonify({
+        'success': True,
+        'index': index_status,
+        'took_ms': took_ms,
+        'results': [
+            dict(item, last_modified=item['last_modified'].astimezone(timezone.utc).isoformat())
+            for item in results
+        ]
+    })
+
+@app.after_request
+def compress_api_response(response):
+    """按Accept-Encoding压缩API响应（br优先，其次gzip）"""
+    if (not request.path.startswith('/api/') or response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers):
+        return response
+    
+    data = response.get_data()
+    if len(data) < app.config['API_COMPRESS_MIN_SIZE']:
+        return response
+    
+    accept_encodings = request.accept_encodings
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        response.set_data(brotli.compress(data, quality=5))
+        response.headers['Content-Encoding'] = 'br'
+    elif accept_encodings.quality('gzip') > 0:
+        response.set_data(gzip.compress(data, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def collect_stats():
+    """汇总各连接池和缓存的统计数据"""
+    return {
+        's3_clients': s3_client_stats(),
+        'listing_cache': listing_cache.stats(),
+        'presign_cache': presign_cache.stats(),
+        'folder_stats_cache': folder_stats_cache.stats(),
+        'thumbnail_cache': thumbnail_cache.stats(),
+        'zip_directory_cache': zip_directory_cache.stats(),
+        'share_cache': share_cache.stats()
+    }
+
+@app.route('/stats')
+def stats():
+    """运行状态统计（用于确认连接复用等）"""
+    return jsonify(collect_stats())
+
+@app.route('/share/<bucket_name>/<path:key>')
+def legacy_share_file(bucket_name, key):
+    """旧格式分享链接（expires明文参数，可被随意修改），已停用"""
+    return redirect('/share-expired')
+
 @app.route('/share-expired')
 def share_expired():
     """分享链接已过期页面"""
@@ -1004,9 +4348,64 @@ def share_expired():
     </html>
     '''
 
+# 启动时预编译全部页面模板
+for template_name in TEMPLATES:
+    app.jinja_env.get_template(template_name)
+
+def init_state():
+    """按 app.config 建立进程内的缓存、本地索引和分享相关的存储
+
+    导入模块时执行一次；create_app 传入配置后重新执行，新的缓存大小、有效期和文件路径才会生效。
+    """
+    global listing_cache, listing_cursor_history, bucket_access_cache, folder_stats_cache
+    global zip_directory_cache, presign_cache, metadata_index, thumbnail_cache
+    global share_limits, share_credentials, share_cache
+    # 目录列表缓存: (endpoint_url, bucket_name, prefix, cursor, page_size, access_key, secret摘要)
+    #   -> (folders, objects, next_cursor)
+    listing_cache = TTLCache(app.config['LISTING_CACHE_SIZE'], app.config['LISTING_CACHE_TTL'])
+    # 分页游标链: 键同上（cursor为下一页） -> 上一页的cursor
+    listing_cursor_history = TTLCache(4096, 3600)
+    # 已确认当前凭证可以列出的存储桶: (endpoint_url, bucket_name, access_key, secret摘要) -> True
+    bucket_access_cache = TTLCache(1024, 60)
+    # 文件夹递归统计: (endpoint_url, bucket_name, prefix, access_key, secret摘要) -> {'size', 'count'}
+    folder_stats_cache = TTLCache(app.config['FOLDER_STATS_CACHE_SIZE'], app.config['FOLDER_STATS_TTL'])
+    # 压缩包目录: (endpoint_url, bucket_name, key, etag) -> 条目列表
+    zip_directory_cache = TTLCache(app.config['ZIP_DIRECTORY_CACHE_SIZE'], app.config['ZIP_DIRECTORY_TTL'])
+    # 分享跳转的预签名URL: (endpoint_url, access_key, secret_key, bucket_name, key) -> url
+    # 键中包含Secret Key，避免凭证不正确的session拿到别人签好的URL；
+    # TTL 设为签名有效期减去余量，保证取出的URL在浏览器跟随跳转时仍然有效
+    presign_cache = TTLCache(app.config['PRESIGN_CACHE_SIZE'],
+                             app.config['SHARE_PRESIGN_EXPIRES'] - app.config['SHARE_PRESIGN_MARGIN'])
+    metadata_index = MetadataIndex(app.config['METADATA_INDEX_DB'])
+    thumbnail_cache = ThumbnailCache(app.config['THUMBNAIL_DIR'], app.config['THUMBNAIL_MAX_BYTES'],
+                                     app.config['THUMBNAIL_SIZE'], app.config['THUMBNAIL_FORMAT'],
+                                     app.config['THUMBNAIL_QUALITY'], app.config['THUMBNAIL_MAX_SOURCE'],
+                                     app.config['THUMBNAIL_WORKERS'])
+    share_limits = create_limit_store()
+    share_credentials = ShareCredentialStore(app.config['SHARE_CREDENTIAL_DB'])
+    share_cache = ShareDiskCache(app.config['SHARE_CACHE_DIR'], app.config['SHARE_CACHE_MAX_BYTES'],
+                                 app.config['SHARE_CACHE_MAX_OBJECT'], app.config['SHARE_CACHE_REVALIDATE'],
+                                 app.config['SHARE_CACHE_FILL_TIMEOUT'])
+
+init_state()
+
+def create_app(config=None):
+    """供 gunicorn '上传2:create_app()' 等服务器加载的入口
+
+    返回的是模块级的同一个 app（路由、缓存、任务记录都定义在模块上），并不会创建新实例。
+    传入config时更新配置并按新配置重新建立缓存和存储（之前缓存的内容随之丢弃），
+    ProxyFix 也只包装一次。
+    """
+    if config:
+        app.config.update(config)
+        init_state()
+    proxies = app.config['TRUSTED_PROXY_COUNT']
+    if proxies and not isinstance(app.wsgi_app, ProxyFix):
+        # 反向代理之后 remote_addr 是代理的地址，按IP限流前需还原真实的访问者地址
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+    return app
+
 if __name__ == '__main__':
+    import serve
     print("雨云对象存储管理服务启动中...")
-    print(f"访问地址: http://127.0.0.1:5000")
-    print(f"或使用局域网IP访问: http://<您的设备IP>:5000")
-  
-    app.run(debug=False, host='0.0.0.0', port=5000)
\ No newline at end of file
+    serve.run(create_app(), '雨云对象存储管理', module='上传2')
\ No newline at end of file
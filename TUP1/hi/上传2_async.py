@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# 雨云对象存储管理 - 异步（ASGI）部署模式
+#
+# 浏览、下载和删除等耗时的S3调用以协程方式在事件循环上执行（Quart + aiobotocore），
+# 单个进程即可同时服务大量浏览器，不再为每个请求占用一个线程。
+# 上传、分享、任务查询等其余路由仍交给 上传2.py 中的Flask应用处理，
+# 两者共用模板、缓存、后台任务记录和session。
+#
+# 依赖: pip install quart aiobotocore asgiref
+# 运行: python 上传2_async.py --port 5000
+
+from quart import Quart, request, redirect, session, Response, jsonify, render_template, flash, get_flashed_messages
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from asgiref.wsgi import WsgiToAsgi
+from botocore.exceptions import ClientError
+from jinja2 import DictLoader
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+import argparse
+import asyncio
+import inspect
+import time
+from collections import OrderedDict
+
+import 上传2 as base
+
+app = Quart(__name__)
+app.secret_key = base.app.secret_key  # 与Flask应用共用同一个session cookie
+app.config['RESPONSE_TIMEOUT'] = None  # 大文件下载可能持续很久，不限制响应时长
+app.jinja_loader = DictLoader(base.TEMPLATES)
+app.add_template_filter(base.format_file_size, 'filesize')
+app.add_template_test(base.has_thumbnail, 'thumbnailable')
+
+# 性能参数统一在 上传2.py 的 app.config 中配置
+settings = base.app.config
+
+# 异步S3客户端池: (endpoint_url, access_key) -> {'client', 'context', 'secret_key', 'last_used'}
+# 所有操作都在同一个事件循环线程内完成，字典操作之间没有await，因此不需要加锁
+_aio_session = get_session()
+_s3_clients = OrderedDict()
+_s3_client_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+async def close_client_later(entry, delay):
+    """延迟关闭被淘汰的客户端，让仍在使用它的下载先完成"""
+    await asyncio.sleep(delay)
+    await entry['context'].__aexit__(None, None, None)
+
+def retire_client(entry):
+    _s3_client_stats['evictions'] += 1
+    asyncio.get_running_loop().create_task(close_client_later(entry, settings['S3_CLIENT_IDLE_TIMEOUT']))
+
+async def get_s3_client():
+    """获取异步S3客户端（按端点和Access Key复用）"""
+    config = session.get('s3_config', base.DEFAULT_CONFIG)
+    pool_key = (config['endpoint_url'], config['access_key'])
+    now = time.monotonic()
+
+    # 回收空闲超时的客户端，OrderedDict 按最近使用排序，最旧的在最前面
+    while _s3_clients:
+        oldest_key, oldest = next(iter(_s3_clients.items()))
+        if now - oldest['last_used'] < settings['S3_CLIENT_IDLE_TIMEOUT']:
+            break
+        retire_client(_s3_clients.pop(oldest_key))
+
+    entry = _s3_clients.get(pool_key)
+    if entry is not None and entry['secret_key'] == config['secret_key']:
+        entry['last_used'] = now
+        _s3_clients.move_to_end(pool_key)
+        _s3_client_stats['hits'] += 1
+        return entry['client']
+    _s3_client_stats['misses'] += 1
+
+    context = _aio_session.create_client('s3',
+                                         endpoint_url=config['endpoint_url'],
+                                         aws_access_key_id=config['access_key'],
+                                         aws_secret_access_key=config['secret_key'],
+                                         config=AioConfig(max_pool_connections=settings['S3_MAX_POOL_CONNECTIONS']))
+    client = await context.__aenter__()
+
+    # 等待期间其他请求可能已经创建了同一组凭证的客户端
+    entry = _s3_clients.get(pool_key)
+    if entry is not None and entry['secret_key'] == config['secret_key']:
+        await context.__aexit__(None, None, None)
+        return entry['client']
+    if entry is not None:
+        retire_client(_s3_clients.pop(pool_key))
+
+    _s3_clients[pool_key] = {
+        'client': client,
+        'context': context,
+        'secret_key': config['secret_key'],
+        'last_used': now
+    }
+    while len(_s3_clients) > settings['S3_CLIENT_CACHE_SIZE']:
+        retire_client(_s3_clients.popitem(last=False)[1])
+    return client
+
+@app.after_serving
+async def close_s3_clients():
+    """进程退出前关闭所有客户端连接"""
+    while _s3_clients:
+        _, entry = _s3_clients.popitem()
+        await entry['context'].__aexit__(None, None, None)
+
+async def close_body(body):
+    """释放S3响应体占用的连接（兼容aiohttp和httpx两种后端）"""
+    result = body.close()
+    if inspect.isawaitable(result):
+        await result
+
+async def page_context(messages=None, config=None, bucket_name='', current_prefix='', **context):
+    """组装页面模板的公共变量"""
+    if messages is None:
+        messages = []
+    if config is None:
+        config = session.get('s3_config', base.DEFAULT_CONFIG)
+    context.update(messages=list(messages) + get_flashed_messages(), config=config,
+                   bucket_name=bucket_name, current_prefix=current_prefix,
+                   upload_part_size=settings['UPLOAD_PART_SIZE'],
+                   upload_batch_max_bytes=settings['UPLOAD_BATCH_MAX_BYTES'],
+                   upload_batch_max_files=settings['UPLOAD_BATCH_MAX_FILES'])
+    return context
+
+async def render_page(template_name, **context):
+    """渲染页面模板的辅助函数"""
+    return await render_template(template_name, **(await page_context(**context)))
+
+async def stream_page(template_name, **context):
+    """以流式响应渲染页面，遇到刷新标记时把已生成的HTML发给浏览器"""
+    context = await page_context(**context)
+    await app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+
+    async def generate(max_buffer=64 * 1024):
+        buffer = []
+        size = 0
+        async for event in template.generate_async(context):
+            if event == base.FLUSH_MARKER:
+                if buffer:
+                    yield ''.join(buffer).encode('utf-8')
+                    buffer, size = [], 0
+                continue
+            buffer.append(event)
+            size += len(event)
+            if size >= max_buffer:
+                yield ''.join(buffer).encode('utf-8')
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer).encode('utf-8')
+
+    response = Response(generate(), mimetype='text/html')
+    # 防止反向代理缓冲整个响应
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+async def iter_folder_entries(s3, bucket_name, current_prefix):
+    """逐页列出前缀下的全部条目，每次请求下一页之前先产出刷新标记"""
+    paginator = s3.get_paginator('list_objects_v2')
+    pages = paginator.paginate(Bucket=bucket_name, Prefix=current_prefix, Delimiter='/').__aiter__()
+    while True:
+        yield {'type': 'flush', 'marker': base.FLUSH_MARKER}
+        try:
+            page = await pages.__anext__()
+        except StopAsyncIteration:
+            return
+        except ClientError as e:
+            yield {'type': 'error', 'message': str(e)}
+            return
+        folders, objects = base.parse_listing_page(page, current_prefix)
+        for entry in folders + objects:
+            yield entry
+
+# 路由定义
+@app.route('/')
+async def index():
+    messages = []
+    config = session.get('s3_config', base.DEFAULT_CONFIG)
+
+    # 检查是否已配置
+    if not config.get('access_key') or not config.get('secret_key'):
+        messages.append("请先配置API连接信息")
+        return await render_page('index.html', messages=messages, config=config, configured=False)
+
+    try:
+        s3 = await get_s3_client()
+        response = await s3.list_buckets()
+        buckets = [bucket['Name'] for bucket in response['Buckets']]
+        return await render_page('index.html', messages=messages, config=config, configured=True, buckets=buckets)
+    except ClientError as e:
+        error_msg = f"连接错误: {str(e)}"
+        messages.append(error_msg)
+        return await render_page('index.html', messages=messages, config=config, configured=True, error_msg=error_msg)
+
+@app.route('/bucket/<bucket_name>')
+async def bucket_contents(bucket_name):
+    messages = []
+    config = session.get('s3_config', base.DEFAULT_CONFIG)
+    current_prefix, cursor, page_number, page_size = base.parse_bucket_args(request.args)
+    breadcrumbs = base.build_breadcrumbs(current_prefix)
+    s3 = await get_s3_client()
+
+    if request.args.get('all') == '1':
+        # 显示全部：页头和第一批文件先发送，后续页边从S3获取边输出
+        return await stream_page('bucket.html', config=config,
+                                 bucket_name=bucket_name, current_prefix=current_prefix,
+                                 breadcrumbs=breadcrumbs,
+                                 entries=iter_folder_entries(s3, bucket_name, current_prefix),
+                                 job_id=request.args.get('job', ''),
+                                 direct_upload=settings['DIRECT_UPLOAD'])
+
+    # 获取一页文件列表，与Flask应用共用目录列表缓存
+    cache_key = base.listing_cache_key(config, bucket_name, current_prefix, cursor, page_size)
+    result = base.listing_cache.get(cache_key) if request.args.get('refresh') != '1' else None
+    if result is None:
+        try:
+            page = await s3.list_objects_v2(**base.listing_page_params(bucket_name, current_prefix, cursor, page_size))
+            result = base.store_listing_page(cache_key, page, current_prefix)
+        except ClientError as e:
+            messages.append(f"无法列出文件: {str(e)}")
+            result = ([], [], '')
+    folders, objects, next_cursor = result
+
+    # 分页导航
+    prev_url, next_url, all_url = base.pagination_urls(bucket_name, current_prefix, cursor, next_cursor,
+                                                       page_number, page_size, config)
+
+    return await render_page('bucket.html', messages=messages, config=config,
+                             bucket_name=bucket_name, current_prefix=current_prefix,
+                             breadcrumbs=breadcrumbs, entries=folders + objects,
+                             job_id=request.args.get('job', ''), page_number=page_number,
+                             prev_url=prev_url, next_url=next_url, all_url=all_url,
+                             direct_upload=settings['DIRECT_UPLOAD'])
+
+@app.route('/download/<bucket_name>/<path:key>')
+async def download_file(bucket_name, key):
+    """流式下载，支持Range和条件请求，等待S3期间不占用线程"""
+    s3 = await get_s3_client()
+    params = base.s3_object_request_params(bucket_name, key, request)
+    try:
+        obj = await s3.get_object(**params)
+        if 'Range' in params and request.headers.get('If-Range') and not base.if_range_matches(obj, request):
+            # 对象已变化，断点续传的前提不成立，改为返回完整内容
+            await close_body(obj['Body'])
+            del params['Range']
+            obj = await s3.get_object(**params)
+    except ClientError as e:
+        error_status = base.s3_error_status(e)
+        if error_status is None:
+            await flash(f'下载失败: {str(e)}')
+            return redirect(f'/bucket/{bucket_name}')
+        return Response('', status=error_status[0], headers=error_status[1])
+
+    body = obj['Body']
+    status, headers = base.s3_object_headers(obj, key)
+
+    async def generate():
+        # 客户端断开时生成器被取消，finally中释放连接
+        try:
+            async for chunk in body.iter_chunks(settings['DOWNLOAD_CHUNK_SIZE']):
+                yield chunk
+        finally:
+            await close_body(body)
+
+    return Response(generate(), status=status, headers=headers)
+
+async def delete_keys_batch(s3, bucket_name, keys):
+    """使用DeleteObjects一次删除最多1000个对象，返回删除失败的键"""
+    response = await s3.delete_objects(
+        Bucket=bucket_name,
+        Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+    )
+    return [
+        {'key': error['Key'], 'code': error.get('Code', ''), 'message': error.get('Message', '')}
+        for error in response.get('Errors', [])
+    ]
+
+async def delete_prefix(job, s3, bucket_name, prefix, endpoint_url):
+    """删除前缀下的所有对象：逐页列出，各页的DeleteObjects以协程并发执行"""
+    base.invalidate_listing(bucket_name, prefix, endpoint_url)
+    limiter = asyncio.Semaphore(settings['DELETE_CONCURRENCY'])
+
+    async def delete_batch(keys):
+        try:
+            errors = await delete_keys_batch(s3, bucket_name, keys)
+            failed_keys = {error['key'] for error in errors}
+            base.unindex_objects(bucket_name, [key for key in keys if key not in failed_keys], endpoint_url)
+        except ClientError as e:
+            errors = [{'key': '', 'code': 'BatchFailed', 'message': str(e)}] * len(keys)
+        finally:
+            limiter.release()
+        job['done'] += len(keys) - len(errors)
+        job['failed'] += len(errors)
+        # 只保留前1000条错误明细，避免任务记录无限增长
+        job['errors'].extend(errors[:max(0, 1000 - len(job['errors']))])
+
+    tasks = []
+    paginator = s3.get_paginator('list_objects_v2')
+    async for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        if job['cancel_requested']:
+            break
+        keys = [obj['Key'] for obj in page.get('Contents', [])]
+        if keys:
+            # 限制同时在途的批次，列表翻页与删除并行进行
+            await limiter.acquire()
+            tasks.append(asyncio.create_task(delete_batch(keys)))
+    await asyncio.gather(*tasks)
+    base.invalidate_listing(bucket_name, prefix, endpoint_url)
+
+async def run_delete_job(job, s3, bucket_name, prefix, endpoint_url):
+    """在事件循环上执行后台删除任务，进度写入共享的任务记录"""
+    if not base.begin_job(job):
+        return
+    try:
+        await delete_prefix(job, s3, bucket_name, prefix, endpoint_url)
+        base.finish_job(job)
+    except Exception as e:
+        base.finish_job(job, e)
+
+@app.route('/delete/<bucket_name>/<path:key>')
+async def delete_file(bucket_name, key):
+    # 获取当前前缀
+    prefix = '/'.join(key.split('/')[:-1]) + '/' if '/' in key else ''
+    endpoint_url = session.get('s3_config', base.DEFAULT_CONFIG)['endpoint_url']
+
+    try:
+        s3 = await get_s3_client()
+
+        # 检查是否是文件夹
+        if key.endswith('/'):
+            # 删除文件夹及其内容：不超过一页的直接批量删除，更大的文件夹转入后台任务
+            first_page = await s3.list_objects_v2(Bucket=bucket_name, Prefix=key)
+            if first_page.get('IsTruncated'):
+                job = base.create_job('delete', f'删除文件夹 {bucket_name}/{key}',
+                                      base.job_owner(session.get('s3_config', base.DEFAULT_CONFIG)))
+                app.add_background_task(run_delete_job, job, s3, bucket_name, key, endpoint_url)
+                await flash(f'文件夹 {key} 正在后台删除')
+                return redirect(f'/bucket/{bucket_name}?prefix={prefix}&job={job["id"]}')
+
+            keys = [obj['Key'] for obj in first_page.get('Contents', [])]
+            errors = await delete_keys_batch(s3, bucket_name, keys) if keys else []
+            base.invalidate_listing(bucket_name, key, endpoint_url)
+            failed_keys = {error['key'] for error in errors}
+            base.unindex_objects(bucket_name, [item for item in keys if item not in failed_keys], endpoint_url)
+            if errors:
+                await flash(f'文件夹 {key} 中有 {len(errors)} 个对象删除失败: {errors[0]["key"]} {errors[0]["message"]}')
+            else:
+                await flash(f'文件夹 {key} 及其内容已删除')
+        else:
+            # 删除文件
+            await s3.delete_object(Bucket=bucket_name, Key=key)
+            base.invalidate_listing(bucket_name, key, endpoint_url)
+            base.unindex_objects(bucket_name, [key], endpoint_url)
+            await flash(f'文件 {key} 删除成功')
+    except ClientError as e:
+        await flash(f'删除失败: {str(e)}')
+
+    return redirect(f'/bucket/{bucket_name}?prefix={prefix}')
+
+@app.route('/stats')
+async def stats():
+    """运行状态统计，附带异步客户端池的命中情况"""
+    data = base.collect_stats()
+    aio_stats = dict(_s3_client_stats, size=len(_s3_clients))
+    total = aio_stats['hits'] + aio_stats['misses']
+    aio_stats['hit_rate'] = round(aio_stats['hits'] / total, 4) if total else 0.0
+    data['aio_s3_clients'] = aio_stats
+    return jsonify(data)
+
+# 其余路由由Flask应用在线程池中处理
+flask_app = WsgiToAsgi(base.create_app())
+
+async def asgi_app(scope, receive, send):
+    """ASGI入口：已实现为协程的路由交给Quart，其余请求转交Flask应用"""
+    if scope['type'] == 'http':
+        try:
+            app.url_map.bind('localhost').match(scope['path'], method=scope['method'])
+        except (NotFound, MethodNotAllowed):
+            await flask_app(scope, receive, send)
+            return
+    await app(scope, receive, send)
+
+def main():
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config as HypercornConfig
+
+    parser = argparse.ArgumentParser(description='雨云对象存储管理（异步模式）')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=5000, help='监听端口')
+    args = parser.parse_args()
+
+    config = HypercornConfig()
+    config.bind = [f'{args.host}:{args.port}']
+
+    print("雨云对象存储管理服务（异步模式）启动中...")
+    print(f"访问地址: http://127.0.0.1:{args.port}")
+    asyncio.run(serve(asgi_app, config))
+
+if __name__ == '__main__':
+    main()